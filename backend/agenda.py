@@ -0,0 +1,155 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+
+from db import conexao, conexao_leitura
+
+logger = logging.getLogger(__name__)
+
+MINUTOS_POR_DIA = 24 * 60
+TAREFAS = ("resumo", "panico")
+
+# Minutos perdidos (ex.: reinício) que ainda são executados ao voltar; além disso, descartados
+RECUPERACAO_MAX_MINUTOS = int(os.environ.get("AGENDA_RECUPERACAO_MAX_MINUTOS", "120"))
+# Recarga completa periódica da roda, como a do índice de alertas (indice_alertas.py)
+RECARGA_SEGUNDOS = float(os.environ.get("AGENDA_RECARGA", "900"))
+
+
+def minuto_do_dia(horario: str) -> int:
+    """Converter ``HH:MM`` no índice do minuto do dia (0-1439).
+
+    Mesma validação dos comandos do bot: horários fora de 00:00-23:59 levantam ValueError.
+    """
+    momento = datetime.strptime(horario, "%H:%M")
+    return momento.hour * 60 + momento.minute
+
+
+class RodaDeHorarios:
+    """Roda de 1440 posições (uma por minuto do dia) com os usuários devidos em cada uma.
+
+    Cada usuário ocupa no máximo uma posição por tarefa (``resumo`` e ``panico``).
+    Um tick consulta só a posição do minuto corrente, sem varrer ``usuarios``.
+    Os comandos e endpoints que alteram horários chamam ``atualizar_usuario``
+    depois do commit.
+    """
+
+    def __init__(self, recarga_segundos: float = RECARGA_SEGUNDOS):
+        self.recarga_segundos = recarga_segundos
+        self._lock = Lock()
+        self._posicoes = {tarefa: [set() for _ in range(MINUTOS_POR_DIA)] for tarefa in TAREFAS}
+        self._minuto_usuario = {tarefa: {} for tarefa in TAREFAS}
+        self._carregado_em = None
+
+    def _colocar(self, tarefa: str, user_id: int, horario: str | None):
+        # Chamado com o lock adquirido; horario None tira o usuário da roda
+        anterior = self._minuto_usuario[tarefa].pop(user_id, None)
+        if anterior is not None:
+            self._posicoes[tarefa][anterior].discard(user_id)
+        if not horario:
+            return
+        try:
+            minuto = minuto_do_dia(horario)
+        except (TypeError, ValueError):
+            # Fica fora da roda: um horário inválido nunca dispara
+            logger.warning(f"Horário inválido para usuário {user_id} ({tarefa}): {horario}")
+            return
+        self._posicoes[tarefa][minuto].add(user_id)
+        self._minuto_usuario[tarefa][user_id] = minuto
+
+    @staticmethod
+    def _horarios(row):
+        return {
+            "resumo": row["horario_resumo"] if row["resumo_automatico"] else None,
+            "panico": row["horario_panico"],
+        }
+
+    def recarregar(self):
+        """Reconstruir a roda a partir da tabela ``usuarios``"""
+        with conexao_leitura() as conn:
+            usuarios = conn.execute(
+                "SELECT user_id, resumo_automatico, horario_resumo, horario_panico FROM usuarios"
+            ).fetchall()
+
+        with self._lock:
+            for tarefa in TAREFAS:
+                self._posicoes[tarefa] = [set() for _ in range(MINUTOS_POR_DIA)]
+                self._minuto_usuario[tarefa] = {}
+            for row in usuarios:
+                for tarefa, horario in self._horarios(row).items():
+                    self._colocar(tarefa, row["user_id"], horario)
+            self._carregado_em = time.monotonic()
+        logger.info(f"Agenda carregada: {len(usuarios)} usuários")
+
+    def _garantir_carregado(self):
+        carregado_em = self._carregado_em
+        if carregado_em is None or time.monotonic() - carregado_em > self.recarga_segundos:
+            self.recarregar()
+
+    def atualizar_usuario(self, user_id: int):
+        """Reposicionar o usuário conforme a configuração gravada no banco"""
+        if self._carregado_em is None:
+            return  # a primeira carga já lê a configuração atual
+        with conexao_leitura() as conn:
+            row = conn.execute(
+                "SELECT user_id, resumo_automatico, horario_resumo, horario_panico FROM usuarios WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+        horarios = self._horarios(row) if row else dict.fromkeys(TAREFAS)
+        with self._lock:
+            for tarefa, horario in horarios.items():
+                self._colocar(tarefa, user_id, horario)
+
+    def devidos(self, tarefa: str, momento) -> list:
+        """Usuários com a tarefa agendada para o minuto de ``momento``"""
+        self._garantir_carregado()
+        with self._lock:
+            return sorted(self._posicoes[tarefa][momento.hour * 60 + momento.minute])
+
+    # --- Recuperação de minutos perdidos ---
+
+    def ultimo_minuto_executado(self):
+        with conexao_leitura() as conn:
+            row = conn.execute("SELECT ultimo_minuto FROM agenda_execucoes WHERE nome = 'agenda'").fetchone()
+        return row["ultimo_minuto"] if row else None
+
+    def minutos_pendentes(self, agora) -> list:
+        """Minutos (datetimes truncados) ainda não executados até ``agora``, inclusive.
+
+        Depois de um reinício, inclui os minutos perdidos desde a última execução
+        registrada, limitados a ``RECUPERACAO_MAX_MINUTOS``.
+        """
+        agora = agora.replace(second=0, microsecond=0)
+        ultimo = self.ultimo_minuto_executado()
+        if ultimo is None:
+            return [agora]
+
+        inicio = max(
+            agora.fromisoformat(ultimo) + timedelta(minutes=1),
+            agora - timedelta(minutes=RECUPERACAO_MAX_MINUTOS),
+        )
+        minutos = []
+        while inicio <= agora:
+            minutos.append(inicio)
+            inicio += timedelta(minutes=1)
+        return minutos
+
+    def marcar_executado(self, minuto):
+        with conexao() as conn:
+            conn.execute("""
+                INSERT INTO agenda_execucoes (nome, ultimo_minuto) VALUES ('agenda', ?)
+                ON CONFLICT(nome) DO UPDATE SET ultimo_minuto = excluded.ultimo_minuto
+            """, (minuto.isoformat(),))
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                **{f"usuarios_{tarefa}": len(self._minuto_usuario[tarefa]) for tarefa in TAREFAS},
+                "minutos_ocupados": len({m for tarefa in TAREFAS for m in self._minuto_usuario[tarefa].values()}),
+                "carregado_ha_segundos": time.monotonic() - self._carregado_em if self._carregado_em else None,
+            }
+
+
+# Os comandos do bot e o endpoint de configurações reposicionam os usuários nesta instância
+roda_horarios = RodaDeHorarios()
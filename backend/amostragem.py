@@ -0,0 +1,44 @@
+import numpy as np
+
+PONTOS_MINIMOS = 3
+# Limite aceito pela API: acima disso a redução não compensa o payload
+PONTOS_MAXIMOS = 5000
+
+
+def lttb_indices(y, n_pontos: int):
+    """Escolher índices com o Largest-Triangle-Three-Buckets.
+
+    Mantém o primeiro e o último ponto e, em cada bucket intermediário, o ponto
+    que forma o maior triângulo com o ponto escolhido antes e a média do bucket
+    seguinte, preservando picos e vales da série. O eixo x é a posição do ponto,
+    como no gráfico de categorias do dashboard.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_pontos >= n or n <= PONTOS_MINIMOS:
+        return np.arange(n)
+    n_pontos = max(n_pontos, PONTOS_MINIMOS)
+
+    x = np.arange(n, dtype=float)
+    # Limites dos buckets intermediários (o primeiro e o último ponto ficam fixos)
+    limites = np.linspace(1, n - 1, n_pontos - 1).astype(int)
+
+    indices = np.empty(n_pontos, dtype=int)
+    indices[0] = 0
+    anterior = 0
+    for i in range(n_pontos - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        prox_inicio = fim
+        prox_fim = limites[i + 2] if i + 2 < len(limites) else n
+        media_x = x[prox_inicio:prox_fim].mean()
+        media_y = y[prox_inicio:prox_fim].mean()
+
+        areas = np.abs(
+            (x[anterior] - media_x) * (y[inicio:fim] - y[anterior])
+            - (x[anterior] - x[inicio:fim]) * (media_y - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(areas))
+        indices[i + 1] = anterior
+
+    indices[-1] = n - 1
+    return indices
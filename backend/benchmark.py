@@ -0,0 +1,311 @@
+"""Benchmark de ponta a ponta dos jobs agendados e dos endpoints do dashboard.
+
+Cria um banco temporário com N usuários × M tickers × K alertas, usa o provedor
+replay com fixtures sintéticas (sem rede) e um bot do Telegram falso, executa cada
+job agendado e dispara requisições concorrentes contra a API. Cada cenário
+registra tempo total, latência p50/p99, chamadas upstream, consultas SQL e pico
+de RSS em um arquivo JSON, para comparar resultados entre commits.
+
+Uso:
+    python benchmark.py --usuarios 500 --tickers 10 --alertas 5 --saida bench.json
+
+Requer httpx (dependência de desenvolvimento, já usada pelo TestClient do FastAPI).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("DASHBOARD_SECRET_KEY", "benchmark")
+
+import bot  # noqa: E402
+import main  # noqa: E402
+from cache import cache_cotacoes  # noqa: E402
+from db import conexao, configurar_banco  # noqa: E402
+from escritor import escritor_alertas  # noqa: E402
+from indice_alertas import indice_alertas  # noqa: E402
+from agenda import roda_horarios  # noqa: E402
+from provedores import ProvedorReplay, configurar_provedor, provedor_atual  # noqa: E402
+from resumos import cache_resumos  # noqa: E402
+
+class BotStub:
+    """Substituto do telegram.Bot que apenas conta as mensagens"""
+
+    def __init__(self):
+        self.mensagens = 0
+
+    def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        self.mensagens += 1
+
+
+class ContadorConsultas:
+    """Conta as instruções SQL executadas em todas as conexões abertas"""
+
+    IGNORADAS = ("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA")
+
+    def __init__(self):
+        self.total = 0
+        self._connect_original = sqlite3.connect
+
+    def _rastrear(self, sql):
+        if not sql.lstrip().upper().startswith(self.IGNORADAS):
+            self.total += 1
+
+    def instalar(self):
+        contador = self
+
+        def connect(*args, **kwargs):
+            conn = contador._connect_original(*args, **kwargs)
+            conn.set_trace_callback(contador._rastrear)
+            return conn
+
+        sqlite3.connect = connect
+
+
+def gerar_fixtures(diretorio: Path, tickers, pregoes: int, seed: int):
+    """Gerar históricos sintéticos (passeio aleatório) para o provedor replay"""
+    rng = np.random.default_rng(seed)
+    datas = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=pregoes, name="Date")
+    for ticker in tickers:
+        retornos = rng.normal(0, 0.02, pregoes)
+        close = 20 * np.exp(np.cumsum(retornos))
+        pd.DataFrame({
+            "Open": close, "High": close * 1.01, "Low": close * 0.99,
+            "Close": close, "Volume": rng.integers(1e5, 1e7, pregoes),
+        }, index=datas).to_csv(diretorio / f"{ticker}.csv")
+
+
+def popular_banco(args, universo, provedor):
+    """Criar usuários, ações monitoradas, portfólios e alertas"""
+    rng = random.Random(args.seed)
+    with conexao() as conn:
+        for user_id in range(1, args.usuarios + 1):
+            conn.execute("INSERT OR IGNORE INTO usuarios (user_id) VALUES (?)", (user_id,))
+            conn.execute(
+                "INSERT OR IGNORE INTO dashboard_users (user_id, dashboard_key, username) VALUES (?, ?, ?)",
+                (user_id, f"hash-{user_id}", f"user{user_id}")
+            )
+            tickers = rng.sample(universo, min(args.tickers, len(universo)))
+            for i, ticker in enumerate(tickers):
+                preco = provedor.cotacao(ticker)
+                conn.execute("INSERT OR REPLACE INTO acoes_monitoradas VALUES (?, ?, ?)", (user_id, ticker, preco))
+                conn.execute(
+                    "INSERT OR REPLACE INTO portfolio_positions VALUES (?, ?, ?, ?)",
+                    (user_id, ticker, 100, preco * rng.uniform(0.8, 1.2))
+                )
+                if i < args.alertas:
+                    if rng.random() < args.cruzados:
+                        # Já cruzado: dispara em toda repetição (o preço do replay é fixo)
+                        sentido = rng.choice(["UP", "DOWN"])
+                        alvo = preco * (rng.uniform(0.9, 0.99) if sentido == "UP" else rng.uniform(1.01, 1.1))
+                    else:
+                        alvo = preco * rng.uniform(0.9, 1.1)
+                        sentido = "UP" if alvo > preco else "DOWN"
+                    conn.execute(
+                        "INSERT OR REPLACE INTO alertas_precos VALUES (?, ?, ?, ?, 0)",
+                        (user_id, ticker, alvo, sentido)
+                    )
+                    conn.execute(
+                        "INSERT OR REPLACE INTO alertas_panico VALUES (?, ?, 1, ?)",
+                        (user_id, ticker, rng.uniform(0.5, 5))
+                    )
+    provedor.chamadas.clear()
+
+
+def percentil(valores, p):
+    return float(np.percentile(valores, p)) if valores else None
+
+
+class Benchmark:
+    def __init__(self, args, universo, provedor, contador, bot_stub):
+        self.args = args
+        self.universo = universo
+        self.provedor = provedor
+        self.contador = contador
+        self.bot_stub = bot_stub
+        self.resultados = []
+
+    def _medir(self, nome, executar, **extras):
+        if not self.args.cache_quente:
+            cache_cotacoes.limpar()
+        chamadas_antes = self.provedor.estatisticas()["total"]
+        consultas_antes = self.contador.total
+        mensagens_antes = self.bot_stub.mensagens
+
+        inicio = time.perf_counter()
+        latencias = executar()
+        tempo_total = time.perf_counter() - inicio
+
+        resultado = {
+            "cenario": nome,
+            "tempo_total_s": tempo_total,
+            "operacoes": len(latencias),
+            "p50_ms": percentil(latencias, 50),
+            "p99_ms": percentil(latencias, 99),
+            "chamadas_upstream": self.provedor.estatisticas()["total"] - chamadas_antes,
+            "consultas_sql": self.contador.total - consultas_antes,
+            "mensagens_telegram": self.bot_stub.mensagens - mensagens_antes,
+            "pico_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            **extras,
+        }
+        self.resultados.append(resultado)
+        print(f"{nome:<32} {tempo_total:8.3f}s  p50={resultado['p50_ms'] or 0:8.2f}ms  "
+              f"p99={resultado['p99_ms'] or 0:8.2f}ms  upstream={resultado['chamadas_upstream']:<6} "
+              f"sql={resultado['consultas_sql']}")
+        return resultado
+
+    def _job(self, preparar, job):
+        def executar():
+            latencias = []
+            for _ in range(self.args.repeticoes):
+                preparar()
+                inicio = time.perf_counter()
+                job()
+                escritor_alertas.flush()  # inclui a gravação em lote no tempo do job
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                # Entrega fora do tempo do job (limitada pela taxa do Telegram), mas dentro do
+                # cenário: as mensagens contam para o job que as enfileirou
+                bot.fila_notificacoes.drenar()
+            return latencias
+        return executar
+
+    def cenarios_jobs(self):
+        def rearmar_alertas():
+            with conexao() as conn:
+                conn.execute("UPDATE alertas_precos SET notificado = 0")
+            indice_alertas.recarregar()
+
+        def agendar_para_agora():
+            agora = datetime.now(bot.TZ).strftime("%H:%M")
+            with conexao() as conn:
+                conn.execute("UPDATE usuarios SET horario_resumo = ?, horario_panico = ?", (agora, agora))
+            roda_horarios.recarregar()
+            cache_resumos.limpar()  # cada repetição mede o cálculo da tabela, não o cache
+
+        resultado = self._medir("job:verificar_alertas_precos", self._job(rearmar_alertas, bot.verificar_alertas_precos))
+        with conexao() as conn:
+            disparados = conn.execute("SELECT COUNT(*) FROM alertas_precos WHERE notificado = 1").fetchone()[0]
+        resultado["alertas_disparados"] = disparados
+        if self.args.cruzados > 0 and disparados == 0:
+            raise RuntimeError("Nenhum alerta de preço disparou: o caminho de disparo não foi medido")
+        self._medir("job:verificar_alertas_panico", self._job(agendar_para_agora, bot.verificar_alertas_panico))
+        self._medir("job:enviar_resumo", self._job(agendar_para_agora, bot.verificar_agendamentos))
+
+    def cenarios_api(self):
+        import httpx
+
+        args = self.args
+        tokens = [
+            main.create_access_token({"sub": str(user_id)})
+            for user_id in range(1, args.usuarios + 1)
+        ]
+
+        async def disparar(endpoint):
+            transporte = httpx.ASGITransport(app=main.app)
+            semaforo = asyncio.Semaphore(args.concorrencia)
+            latencias = []
+            erros = 0
+
+            async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+                async def requisicao(i):
+                    nonlocal erros
+                    headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+                    async with semaforo:
+                        inicio = time.perf_counter()
+                        resposta = await cliente.get(endpoint, headers=headers)
+                        latencias.append((time.perf_counter() - inicio) * 1000)
+                        if resposta.status_code != 200:
+                            erros += 1
+
+                await asyncio.gather(*(requisicao(i) for i in range(args.requisicoes)))
+            return latencias, erros
+
+        for endpoint in ["/api/acoes/detalhadas", "/api/portfolio", "/api/dashboard/snapshot",
+                         "/api/historico/{ticker}?periodo=all"]:
+            alvo = endpoint.replace("{ticker}", self.universo[0])
+            estado = {}
+
+            def executar():
+                latencias, estado["erros"] = asyncio.run(disparar(alvo))
+                return latencias
+
+            resultado = self._medir(f"api:{endpoint}", executar, concorrencia=args.concorrencia)
+            resultado["erros"] = estado["erros"]
+
+
+def commit_atual():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--tickers", type=int, default=10, help="tickers monitorados por usuário")
+    parser.add_argument("--alertas", type=int, default=5, help="alertas de preço e de pânico por usuário")
+    parser.add_argument("--cruzados", type=float, default=0.2,
+                        help="fração dos alertas de preço criados já cruzados (disparam a cada repetição)")
+    parser.add_argument("--universo", type=int, default=100, help="tickers distintos disponíveis")
+    parser.add_argument("--pregoes", type=int, default=2500, help="pregões por fixture")
+    parser.add_argument("--latencia-ms", type=float, default=50, help="latência sintética do upstream")
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    parser.add_argument("--concorrencia", type=int, default=20)
+    parser.add_argument("--requisicoes", type=int, default=200)
+    parser.add_argument("--repeticoes", type=int, default=3, help="execuções de cada job")
+    parser.add_argument("--cache-quente", action="store_true", help="não limpar o cache entre cenários")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", default="bench_results.json")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix="radar-bench-") as temporario:
+        diretorio = Path(temporario)
+        fixtures = diretorio / "fixtures"
+        fixtures.mkdir()
+        universo = [f"T{i:04d}.SA" for i in range(args.universo)]
+        gerar_fixtures(fixtures, universo, args.pregoes, args.seed)
+
+        provedor = ProvedorReplay(fixtures, latencia_ms=args.latencia_ms, taxa_erro=args.taxa_erro, seed=args.seed)
+        configurar_provedor(provedor)
+        configurar_banco(str(diretorio / "acoes.db"))
+
+        contador = ContadorConsultas()
+        contador.instalar()
+        bot_stub = BotStub()
+        bot.telegram_bot_instance = bot_stub
+
+        bot.setup_database()
+        popular_banco(args, universo, provedor_atual())
+
+        benchmark = Benchmark(args, universo, provedor, contador, bot_stub)
+        benchmark.cenarios_jobs()
+        benchmark.cenarios_api()
+        bot.fila_notificacoes.drenar()
+        escritor_alertas.flush()  # nada gravando no banco quando o diretório for removido
+
+    relatorio = {
+        "commit": commit_atual(),
+        "executado_em": datetime.now().isoformat(),
+        "parametros": vars(args),
+        "cenarios": benchmark.resultados,
+    }
+    Path(args.saida).write_text(json.dumps(relatorio, indent=2), encoding="utf-8")
+    print(f"Resultados gravados em {args.saida}")
+
+
+if __name__ == "__main__":
+    main_benchmark()
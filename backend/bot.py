@@ -1,5 +1,4 @@
-import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 import yfinance as yf
 from telegram import Update
@@ -8,6 +7,23 @@ from apscheduler.schedulers.background import BackgroundScheduler
 import requests
 import logging
 import os
+
+from cache import cache_usuarios
+from cotacoes import obter_preco_atual
+from historico_precos import obter_historicos_diarios
+from db import conexao, conexao_leitura
+from migracoes import aplicar_migracoes, verificar_planos
+from escritor import escritor_alertas
+from indice_alertas import indice_alertas
+from agenda import roda_horarios
+import resumos
+from resumos import cache_resumos
+from notificacoes import AgrupadorAlertas, FilaNotificacoes
+from monitor_jobs import EVENTOS_IGNORADOS, JOB_DEFAULTS, monitor_jobs
+from historico_alertas import consolidar_historico
+import snapshot_cotacoes
+from snapshot_cotacoes import obter_cotacoes
+
 yf.pdr_override()  # ativa override do pandas_datareader
 
 # Configuração de logging
@@ -18,77 +34,42 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Configurações
-DB_PATH = "acoes.db"
 TZ = pytz.timezone("America/Sao_Paulo")
 DASHBOARD_URL = os.environ.get("DASHBOARD_URL", "http://localhost:8001")
+# Com o índice de alertas e o snapshot de cotações, cada verificação custa só leituras locais
+ALERTAS_PRECO_INTERVALO = int(os.environ.get("ALERTAS_PRECO_INTERVALO", "60"))
 
 # Instância global do bot para uso nas funções agendadas
 telegram_bot_instance = None
 
-def setup_database():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Tabelas originais do bot
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS acoes_monitoradas (
-            user_id INTEGER,
-            ticker TEXT,
-            preco_referencia REAL,
-            PRIMARY KEY (user_id, ticker)
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS usuarios (
-            user_id INTEGER PRIMARY KEY,
-            resumo_automatico INTEGER DEFAULT 1,
-            horario_resumo TEXT DEFAULT '18:00',
-            horario_panico TEXT DEFAULT '18:00'
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS alertas_precos (
-            user_id INTEGER,
-            ticker TEXT,
-            preco_alvo REAL,
-            sentido TEXT DEFAULT 'DOWN',
-            notificado INTEGER DEFAULT 0,
-            PRIMARY KEY (user_id, ticker)
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS alertas_panico (
-            user_id INTEGER,
-            ticker TEXT,
-            ativo INTEGER DEFAULT 1,
-            percentual_queda REAL DEFAULT 5.0,
-            PRIMARY KEY (user_id, ticker)
-        )
-    """)
-
-    # Tabelas do dashboard
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS dashboard_users (
-            user_id INTEGER PRIMARY KEY,
-            dashboard_key TEXT UNIQUE NOT NULL,
-            username TEXT,
-            theme TEXT DEFAULT 'dark',
-            last_login TEXT
-        )
-    """)
-
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS portfolio_positions (
-            user_id INTEGER,
-            ticker TEXT,
-            quantity REAL,
-            avg_price REAL,
-            PRIMARY KEY (user_id, ticker)
-        )
-    """)
+# Tabelas com dados do usuário, cujo user_id é também o chat das notificações
+TABELAS_USUARIO = (
+    "usuarios", "acoes_monitoradas", "alertas_precos", "alertas_panico",
+    "portfolio_positions", "dashboard_users", "alert_history", "alert_history_diario",
+)
 
-    conn.commit()
-    conn.close()
+def migrar_chat(chat_antigo, chat_novo):
+    """Passar os dados do chat migrado (grupo que virou supergrupo) para o novo id"""
+    for tabela in TABELAS_USUARIO:
+        escritor_alertas.enfileirar(f"UPDATE OR IGNORE {tabela} SET user_id = ? WHERE user_id = ?", (chat_novo, chat_antigo))
+    escritor_alertas.flush()
+    # Índice, roda de horários e cache guardam o id antigo
+    indice_alertas.recarregar()
+    roda_horarios.atualizar_usuario(chat_antigo)
+    roda_horarios.atualizar_usuario(chat_novo)
+    cache_usuarios.invalidar(chat_antigo)
+    logger.info(f"Dados do chat {chat_antigo} migrados para {chat_novo}")
+
+# Os jobs só enfileiram; os workers da fila enviam respeitando os limites do Telegram
+fila_notificacoes = FilaNotificacoes(
+    lambda **kwargs: telegram_bot_instance.send_message(**kwargs), ao_migrar=migrar_chat
+)
+
+def setup_database():
+    with conexao() as conn:
+        aplicar_migracoes(conn)
+        # Um índice faltando ou ignorado impede a partida, em vez de só degradar os jobs
+        verificar_planos(conn)
 
 # --- Comandos Telegram ---
 
@@ -97,9 +78,10 @@ def start(update: Update, context: CallbackContext):
     username = update.effective_user.first_name or update.effective_user.username or "Usuário"
 
     # Registrar usuário no banco se não existir
-    with sqlite3.connect(DB_PATH) as conn:
+    with conexao() as conn:
         c = conn.cursor()
         c.execute("INSERT OR IGNORE INTO usuarios (user_id) VALUES (?)", (user_id,))
+    roda_horarios.atualizar_usuario(user_id)
 
     welcome_message = f"""
 🚀 *Bem-vindo ao Radar do Caos, {username}!*
@@ -215,9 +197,10 @@ def reset_dashboard(update: Update, context: CallbackContext):
 
     try:
         # Remover usuário do dashboard para forçar nova criação
-        with sqlite3.connect(DB_PATH) as conn:
+        with conexao() as conn:
             c = conn.cursor()
             c.execute("DELETE FROM dashboard_users WHERE user_id = ?", (user_id,))
+        cache_usuarios.invalidar(user_id)
 
         # Chamar comando dashboard para recriar
         dashboard_command(update, context)
@@ -235,18 +218,16 @@ def add_acao(update: Update, context: CallbackContext):
     ticker = context.args[0].upper()
 
     try:
-        acao = yf.Ticker(ticker)
-        hist = acao.history(period="1d")
-        if hist.empty:
+        preco = obter_preco_atual(ticker)
+        if preco is None:
             raise ValueError("Sem dados históricos")
-        preco = float(hist["Close"].iloc[-1])
     except Exception as e:
         logger.warning(f"Erro ao obter dados para {ticker}: {e}")
         update.message.reply_text(f"❌ Erro ao obter preço de *{ticker}*. Verifique se o ticker está correto.", parse_mode='Markdown')
         return
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with conexao() as conn:
             c = conn.cursor()
             c.execute("INSERT OR REPLACE INTO acoes_monitoradas VALUES (?, ?, ?)", (user_id, ticker, preco))
             c.execute("INSERT OR IGNORE INTO usuarios (user_id) VALUES (?)", (user_id,))
@@ -267,7 +248,7 @@ def remove_acao(update: Update, context: CallbackContext):
     ticker = context.args[0].upper()
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with conexao() as conn:
             c = conn.cursor()
             # Verificar se a ação existe
             c.execute("SELECT ticker FROM acoes_monitoradas WHERE user_id=? AND ticker=?", (user_id, ticker))
@@ -281,6 +262,7 @@ def remove_acao(update: Update, context: CallbackContext):
             c.execute("DELETE FROM alertas_precos WHERE user_id=? AND ticker=?", (user_id, ticker))
             # Remove alertas panico vinculados
             c.execute("DELETE FROM alertas_panico WHERE user_id=? AND ticker=?", (user_id, ticker))
+        indice_alertas.remover(user_id, ticker)
 
         update.message.reply_text(f"✅ *{ticker}* removida e alertas associados removidos.", parse_mode='Markdown')
         logger.info(f"Usuário {user_id} removeu ação {ticker}")
@@ -293,7 +275,7 @@ def listar_acoes(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with conexao_leitura() as conn:
             c = conn.cursor()
             c.execute("SELECT ticker, preco_referencia FROM acoes_monitoradas WHERE user_id=?", (user_id,))
             acoes = c.fetchall()
@@ -320,10 +302,11 @@ def configurar_auto(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with conexao() as conn:
             c = conn.cursor()
             c.execute("INSERT OR IGNORE INTO usuarios (user_id) VALUES (?)", (user_id,))
             c.execute("UPDATE usuarios SET resumo_automatico=? WHERE user_id=?", (status, user_id))
+        roda_horarios.atualizar_usuario(user_id)
 
         status_text = "ativado" if status else "desativado"
         update.message.reply_text(f"✅ Resumo automático *{status_text}*", parse_mode='Markdown')
@@ -347,10 +330,11 @@ def configurar_horario(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with conexao() as conn:
             c = conn.cursor()
             c.execute("INSERT OR IGNORE INTO usuarios (user_id) VALUES (?)", (user_id,))
             c.execute("UPDATE usuarios SET horario_resumo=? WHERE user_id=?", (horario, user_id))
+        roda_horarios.atualizar_usuario(user_id)
 
         update.message.reply_text(f"✅ Horário do resumo diário definido para *{horario}*", parse_mode='Markdown')
 
@@ -373,10 +357,11 @@ def configurar_horario_panico(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with conexao() as conn:
             c = conn.cursor()
             c.execute("INSERT OR IGNORE INTO usuarios (user_id) VALUES (?)", (user_id,))
             c.execute("UPDATE usuarios SET horario_panico=? WHERE user_id=?", (horario, user_id))
+        roda_horarios.atualizar_usuario(user_id)
 
         update.message.reply_text(f"✅ Horário do alerta de pânico definido para *{horario}*", parse_mode='Markdown')
 
@@ -399,11 +384,9 @@ def configurar_alerta(update: Update, context: CallbackContext):
         return
 
     try:
-        acao = yf.Ticker(ticker)
-        hist = acao.history(period="1d")
-        if hist.empty:
+        preco_atual = obter_preco_atual(ticker)
+        if preco_atual is None:
             raise ValueError("Sem dados")
-        preco_atual = float(hist["Close"].iloc[-1])
     except Exception as e:
         logger.warning(f"Erro ao obter preço atual de {ticker}: {e}")
         update.message.reply_text(f"❌ Erro ao obter preço atual de *{ticker}*", parse_mode='Markdown')
@@ -412,12 +395,13 @@ def configurar_alerta(update: Update, context: CallbackContext):
     sentido = "UP" if preco_alvo > preco_atual else "DOWN"
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with conexao() as conn:
             c = conn.cursor()
             c.execute("""
                 INSERT OR REPLACE INTO alertas_precos (user_id, ticker, preco_alvo, sentido, notificado)
                 VALUES (?, ?, ?, ?, 0)
             """, (user_id, ticker, preco_alvo, sentido))
+        indice_alertas.definir(user_id, ticker, preco_alvo, sentido)
 
         direcao = "acima de" if sentido == "UP" else "abaixo de"
         update.message.reply_text(
@@ -440,13 +424,16 @@ def remover_alerta(update: Update, context: CallbackContext):
     ticker = context.args[0].upper()
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with conexao() as conn:
             c = conn.cursor()
             c.execute("DELETE FROM alertas_precos WHERE user_id=? AND ticker=?", (user_id, ticker))
-            if c.rowcount == 0:
-                update.message.reply_text(f"❌ Nenhum alerta encontrado para *{ticker}*", parse_mode='Markdown')
-            else:
-                update.message.reply_text(f"✅ Alerta para *{ticker}* removido.", parse_mode='Markdown')
+            removido = c.rowcount > 0
+        # Índice atualizado só depois do commit
+        indice_alertas.remover(user_id, ticker)
+        if not removido:
+            update.message.reply_text(f"❌ Nenhum alerta encontrado para *{ticker}*", parse_mode='Markdown')
+        else:
+            update.message.reply_text(f"✅ Alerta para *{ticker}* removido.", parse_mode='Markdown')
 
     except Exception as e:
         logger.error(f"Erro ao remover alerta para usuário {user_id}: {e}")
@@ -476,7 +463,7 @@ def configurar_panico(update: Update, context: CallbackContext):
     ativo = 1 if status == "ON" else 0
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with conexao() as conn:
             c = conn.cursor()
             c.execute("INSERT OR REPLACE INTO alertas_panico (user_id, ticker, ativo, percentual_queda) VALUES (?, ?, ?, ?)",
                       (user_id, ticker, ativo, percentual))
@@ -494,157 +481,243 @@ def resumo(update: Update, context: CallbackContext):
 
 # --- Lógicas de envio ---
 
-def enviar_resumo(user_id, update=None):
+def tickers_dos_usuarios(user_ids):
+    """Obter ``{user_id: [tickers]}`` das ações monitoradas de vários usuários em uma consulta"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    with conexao_leitura() as conn:
+        rows = conn.execute(f"""
+            SELECT user_id, ticker FROM acoes_monitoradas
+            WHERE user_id IN ({",".join("?" * len(user_ids))})
+        """, user_ids).fetchall()
+    por_usuario = {}
+    for user_id, ticker in rows:
+        por_usuario.setdefault(user_id, []).append(ticker)
+    return por_usuario
+
+def montar_mensagem_resumo(tickers, tabela):
+    """Montar o resumo de um usuário a partir da tabela compartilhada do ciclo"""
+    mensagem = "📊 *RESUMO DAS AÇÕES*\n\n"
+    for ticker in tickers:
+        linha = tabela.get(ticker)
+        if linha is None:
+            mensagem += f"*{ticker}*: ❌ Sem dados\n\n"
+            continue
+
+        preco_atual, var_dia, var_semana = linha["preco"], linha["var_dia"], linha["var_semana"]
+
+        # Emojis para variação
+        emoji_dia = "🟢" if var_dia >= 0 else "🔴"
+        emoji_semana = "🟢" if var_semana >= 0 else "🔴"
+
+        mensagem += (
+            f"*{ticker}*\n"
+            f"💵 R$ {preco_atual:.2f}\n"
+            f"{emoji_dia} Hoje: {'+' if var_dia >= 0 else ''}{var_dia:.2f}%\n"
+            f"{emoji_semana} Semana: {'+' if var_semana >= 0 else ''}{var_semana:.2f}%\n\n"
+        )
+
+    mensagem += "💡 Use `/dashboard` para visualizações detalhadas!"
+    return mensagem
+
+def enviar_resumo(user_id, update=None, tickers=None):
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-            c.execute("SELECT ticker FROM acoes_monitoradas WHERE user_id=?", (user_id,))
-            acoes = c.fetchall()
+        if tickers is None:
+            tickers = tickers_dos_usuarios([user_id]).get(user_id, [])
 
-        if not acoes:
+        if not tickers:
             message = "📊 Nenhuma ação monitorada.\n\nUse `/add TICKER` para adicionar ações."
             if update:
                 update.message.reply_text(message, parse_mode='Markdown')
             else:
-                telegram_bot_instance.send_message(chat_id=user_id, text=message, parse_mode='Markdown')
+                fila_notificacoes.enfileirar(user_id, message)
             return
 
-        mensagem = "📊 *RESUMO DAS AÇÕES*\n\n"
-        for (ticker,) in acoes:
-            try:
-                acao = yf.Ticker(ticker)
-                hist = acao.history(period="7d")
-                if hist.empty:
-                    mensagem += f"*{ticker}*: ❌ Sem dados\n\n"
-                    continue
-
-                preco_atual = float(hist["Close"].iloc[-1])
-                preco_ontem = float(hist["Close"].iloc[-2]) if len(hist) >= 2 else preco_atual
-                preco_semana = float(hist["Close"].iloc[0]) if len(hist) >= 5 else preco_ontem
-
-                var_dia = ((preco_atual - preco_ontem) / preco_ontem) * 100
-                var_semana = ((preco_atual - preco_semana) / preco_semana) * 100
-
-                # Emojis para variação
-                emoji_dia = "🟢" if var_dia >= 0 else "🔴"
-                emoji_semana = "🟢" if var_semana >= 0 else "🔴"
-
-                mensagem += (
-                    f"*{ticker}*\n"
-                    f"💵 R$ {preco_atual:.2f}\n"
-                    f"{emoji_dia} Hoje: {'+' if var_dia >= 0 else ''}{var_dia:.2f}%\n"
-                    f"{emoji_semana} Semana: {'+' if var_semana >= 0 else ''}{var_semana:.2f}%\n\n"
-                )
-            except Exception as e:
-                logger.warning(f"Erro ao buscar dados para {ticker}: {e}")
-                mensagem += f"*{ticker}*: ❌ Erro ao buscar dados\n\n"
-
-        mensagem += "💡 Use `/dashboard` para visualizações detalhadas!"
+        # /resumo pede dados atuais; a tabela compartilhada (até RESUMO_TTL_SEGUNDOS) é dos envios agendados
+        tabela = resumos.calcular_tabela(tickers) if update else cache_resumos.obter(tickers)
+        mensagem = montar_mensagem_resumo(tickers, tabela)
 
         if update:
             update.message.reply_text(mensagem, parse_mode='Markdown')
         else:
-            telegram_bot_instance.send_message(chat_id=user_id, text=mensagem, parse_mode='Markdown')
+            fila_notificacoes.enfileirar(user_id, mensagem)
 
     except Exception as e:
+        monitor_jobs.anotar(erros=1)
         logger.error(f"Erro ao enviar resumo para usuário {user_id}: {e}")
 
+def salvar_alerta_historico(user_id, ticker, alert_type, trigger_value, message):
+    """Salvar alerta no histórico (gravado em lote pelo escritor de alertas)"""
+    escritor_alertas.enfileirar("""
+        INSERT INTO alert_history (user_id, ticker, alert_type, trigger_value, triggered_at, message)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (user_id, ticker, alert_type, trigger_value, datetime.now().isoformat(), message))
+
 def verificar_alertas_precos():
+    # Uma mensagem por usuário com todos os alertas do ciclo
+    agrupador = AgrupadorAlertas("🔔 *Alertas de preço*")
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-            c.execute("""
-                SELECT user_id, ticker, preco_alvo, sentido FROM alertas_precos
-                WHERE notificado = 0
-            """)
-            alertas = c.fetchall()
+        # Alertas pendentes vêm do índice em memória, não de uma leitura da tabela inteira
+        tickers = indice_alertas.tickers()
+        if not tickers:
+            return
 
-            for user_id, ticker, preco_alvo, sentido in alertas:
-                try:
-                    acao = yf.Ticker(ticker)
-                    hist = acao.history(period="1d")
-                    if hist.empty:
-                        continue
-                    preco_atual = float(hist["Close"].iloc[-1])
-                except Exception as e:
-                    logger.warning(f"Erro ao verificar alerta para {ticker}: {e}")
+        # Cotações do snapshot; só tickers sem cotação recente vão ao provedor
+        cotacoes = obter_cotacoes(tickers)
+        monitor_jobs.anotar(tickers=len(tickers))
+
+        for ticker, preco_atual in cotacoes.items():
+            # Busca binária: só os alertas cujo alvo o preço cruzou
+            for user_id, preco_alvo, sentido in indice_alertas.cruzados(ticker, preco_atual):
+                # Marca como notificado antes de tirar do índice: uma recarga do índice que
+                # comece depois da remoção já encontra a flag na fila do escritor. O WHERE só
+                # casa com este alvo, então não afeta um alerta redefinido nesse meio-tempo
+                escritor_alertas.enfileirar("""
+                    UPDATE alertas_precos SET notificado = 1
+                    WHERE user_id = ? AND ticker = ? AND preco_alvo = ? AND sentido = ?
+                """, (user_id, ticker, preco_alvo, sentido))
+                # Alerta redefinido desde a busca: o novo alvo fica para o próximo ciclo
+                if not indice_alertas.remover(user_id, ticker, (preco_alvo, sentido)):
                     continue
+                emoji = "🚀" if sentido == "UP" else "📉"
+                message = f"{emoji} *Alerta de preço:* {ticker} atingiu R$ {preco_atual:.2f} (alvo: R$ {preco_alvo:.2f})"
+
+                agrupador.adicionar(user_id, message)
 
-                if (sentido == "UP" and preco_atual >= preco_alvo) or (sentido == "DOWN" and preco_atual <= preco_alvo):
-                    emoji = "🚀" if sentido == "UP" else "📉"
-                    telegram_bot_instance.send_message(
-                        chat_id=user_id,
-                        text=f"{emoji} *Alerta de preço:* {ticker} atingiu R$ {preco_atual:.2f} (alvo: R$ {preco_alvo:.2f})",
-                        parse_mode='Markdown'
-                    )
-
-                    # Marca como notificado
-                    c.execute("""
-                        UPDATE alertas_precos SET notificado = 1 WHERE user_id = ? AND ticker = ?
-                    """, (user_id, ticker))
-                    conn.commit()
-                    logger.info(f"Alerta de preço disparado para usuário {user_id}, ticker {ticker}")
+                # Salvar no histórico (um registro por alerta)
+                salvar_alerta_historico(user_id, ticker, "price", preco_atual, message)
+                logger.info(f"Alerta de preço disparado para usuário {user_id}, ticker {ticker}")
 
     except Exception as e:
+        monitor_jobs.anotar(erros=1)
         logger.error(f"Erro ao verificar alertas de preço: {e}")
+    finally:
+        # Alertas já marcados como notificados saem mesmo se o ciclo falhar no meio
+        agrupador.enviar(fila_notificacoes)
+
+def verificar_alertas_panico(user_ids=None):
+    """Verificar os alertas de pânico dos usuários devidos (por padrão, os do minuto atual)"""
+    if user_ids is None:
+        user_ids = roda_horarios.devidos("panico", datetime.now(TZ))
+    if not user_ids:
+        return
 
-def verificar_alertas_panico():
-    agora = datetime.now(TZ).strftime("%H:%M")
-
+    agrupador = AgrupadorAlertas("🚨 *ALERTAS DE PÂNICO*")
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with conexao_leitura() as conn:
             c = conn.cursor()
-            c.execute("""
-                SELECT u.user_id, ap.ticker, ap.percentual_queda
-                FROM alertas_panico ap
-                JOIN usuarios u ON u.user_id = ap.user_id
-                WHERE ap.ativo=1 AND u.horario_panico=?
-            """, (agora,))
-            rows = c.fetchall()
-
-        for user_id, ticker, percentual in rows:
+            c.execute(f"""
+                SELECT user_id, ticker, percentual_queda FROM alertas_panico
+                WHERE ativo=1 AND user_id IN ({",".join("?" * len(user_ids))})
+            """, list(user_ids))
+            alertas = c.fetchall()
+
+        historicos = obter_historicos_diarios({ticker for _, ticker, _ in alertas}, period="7d")
+        monitor_jobs.anotar(tickers=len(historicos))
+
+        for user_id, ticker, percentual_queda in alertas:
             try:
-                acao = yf.Ticker(ticker)
-                hist = acao.history(period="2d")
-                if len(hist) < 2:
+                hist = historicos.get(ticker)
+                if hist is None or len(hist) < 2:
                     continue
 
-                preco_hoje = float(hist["Close"].iloc[-1])
-                preco_ontem = float(hist["Close"].iloc[-2])
-                queda = ((preco_ontem - preco_hoje) / preco_ontem) * 100
+                preco_atual = float(hist["Close"].iloc[-1])
+                preco_anterior = float(hist["Close"].iloc[-2])
+                queda_real = ((preco_anterior - preco_atual) / preco_anterior) * 100
+
+                if queda_real >= percentual_queda:
+                    message = f"🚨 *ALERTA DE PÂNICO:* {ticker} caiu {queda_real:.2f}% (R$ {preco_atual:.2f})"
+
+                    agrupador.adicionar(user_id, message)
+
+                    # Salvar no histórico (um registro por alerta)
+                    salvar_alerta_historico(user_id, ticker, "panic", queda_real, message)
 
-                if queda >= percentual:
-                    telegram_bot_instance.send_message(
-                        chat_id=user_id,
-                        text=(f"⚠️ *ALERTA DE PÂNICO:* {ticker} caiu {queda:.2f}% hoje, "
-                              f"excedendo o limite de {percentual}% definido por você.\n\n"
-                              f"💡 Acesse o `/dashboard` para análise detalhada."),
-                        parse_mode='Markdown'
-                    )
-                    logger.info(f"Alerta de pânico disparado para usuário {user_id}, ticker {ticker}")
+                    logger.info(f"Alerta de pânico disparado para usuário {user_id}, ticker {ticker}, queda {queda_real:.2f}%")
 
             except Exception as e:
-                logger.warning(f"Erro ao verificar alerta pânico para {ticker}: {e}")
+                monitor_jobs.anotar(erros=1)
+                logger.warning(f"Erro ao verificar alerta de pânico para {ticker}: {e}")
 
     except Exception as e:
+        monitor_jobs.anotar(erros=1)
         logger.error(f"Erro ao verificar alertas de pânico: {e}")
-
-def verificar_agendamentos():
-    agora = datetime.now(TZ).strftime("%H:%M")
+    finally:
+        agrupador.enviar(fila_notificacoes)
+
+def verificar_agendamentos(user_ids=None):
+    """Enviar os resumos automáticos dos usuários devidos (por padrão, os do minuto atual)"""
+    if user_ids is None:
+        user_ids = roda_horarios.devidos("resumo", datetime.now(TZ))
+    if not user_ids:
+        return
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-            c.execute("SELECT user_id FROM usuarios WHERE resumo_automatico=1 AND horario_resumo=?", (agora,))
-            usuarios = c.fetchall()
-
-        for (user_id,) in usuarios:
-            enviar_resumo(user_id)
+        # Cada ticker distinto é calculado uma vez para todos os usuários do ciclo
+        por_usuario = tickers_dos_usuarios(user_ids)
+        tickers = {ticker for tickers in por_usuario.values() for ticker in tickers}
+        cache_resumos.obter(tickers)
+        monitor_jobs.anotar(tickers=len(tickers))
+
+        for user_id in user_ids:
+            enviar_resumo(user_id, tickers=por_usuario.get(user_id, []))
             logger.info(f"Resumo automático enviado para usuário {user_id}")
 
     except Exception as e:
+        monitor_jobs.anotar(erros=1)
         logger.error(f"Erro ao verificar agendamentos: {e}")
 
+def atualizar_snapshot_cotacoes():
+    """Renovar o snapshot de cotações lido pela API e pelos jobs"""
+    try:
+        precos = snapshot_cotacoes.atualizar_snapshot()
+        monitor_jobs.anotar(tickers=len(precos))
+        logger.debug(f"Snapshot de cotações atualizado: {len(precos)} tickers")
+    except Exception as e:
+        monitor_jobs.anotar(erros=1)
+        logger.error(f"Erro ao atualizar snapshot de cotações: {e}")
+
+def executar_agenda():
+    """Tick de um minuto: resumos e alertas de pânico dos usuários devidos.
+
+    Processa também os minutos perdidos desde a última execução (ex.: reinício).
+    """
+    try:
+        for minuto in roda_horarios.minutos_pendentes(datetime.now(TZ)):
+            verificar_agendamentos(roda_horarios.devidos("resumo", minuto))
+            verificar_alertas_panico(roda_horarios.devidos("panico", minuto))
+            roda_horarios.marcar_executado(minuto)
+        aquecer_resumos()
+    except Exception as e:
+        monitor_jobs.anotar(erros=1)
+        logger.error(f"Erro ao executar agenda: {e}")
+
+def aquecer_resumos():
+    """Calcular a tabela de resumo alguns minutos antes de um horário concorrido"""
+    alvo = datetime.now(TZ) + timedelta(minutes=resumos.AQUECIMENTO_MINUTOS)
+    user_ids = roda_horarios.devidos("resumo", alvo)
+    if len(user_ids) < resumos.AQUECIMENTO_MIN_USUARIOS:
+        return
+    tickers = {ticker for tickers in tickers_dos_usuarios(user_ids).values() for ticker in tickers}
+    cache_resumos.aquecer(tickers)
+    logger.info(f"Resumos das {alvo:%H:%M} aquecidos: {len(tickers)} tickers para {len(user_ids)} usuários")
+
+def consolidar_historico_alertas():
+    """Consolidar em contagens diárias os alertas mais antigos que a retenção"""
+    try:
+        removidos = consolidar_historico()
+        if removidos:
+            logger.info(f"Histórico de alertas: {removidos} alertas antigos consolidados")
+    except Exception as e:
+        monitor_jobs.anotar(erros=1)
+        logger.error(f"Erro ao consolidar histórico de alertas: {e}")
+
+def agendar(scheduler, job, intervalo_segundos, trigger, **parametros):
+    """Registrar um job instrumentado pelo monitor, identificado pelo nome da função"""
+    nome = job.__name__
+    scheduler.add_job(monitor_jobs.instrumentar(nome, job, intervalo_segundos), trigger, id=nome, **parametros)
+
 def main():
     global telegram_bot_instance
 
@@ -661,6 +734,7 @@ def main():
     updater = Updater(TOKEN, use_context=True)
     dispatcher = updater.dispatcher
     telegram_bot_instance = updater.bot
+    fila_notificacoes.carregar_pendentes()
 
     # Registrar comandos
     dispatcher.add_handler(CommandHandler("start", start))
@@ -677,11 +751,16 @@ def main():
     dispatcher.add_handler(CommandHandler("remover_alerta", remover_alerta))
     dispatcher.add_handler(CommandHandler("panico", configurar_panico))
 
-    # Configurar agendador
-    scheduler = BackgroundScheduler(timezone=TZ)
-    scheduler.add_job(verificar_agendamentos, "interval", minutes=10)  # Reduzido para 10 minutos
-    scheduler.add_job(verificar_alertas_precos, "interval", minutes=5)  # Reduzido para 5 minutos
-    scheduler.add_job(verificar_alertas_panico, "interval", minutes=5)  # Reduzido para 5 minutos
+    # Configurar agendador (uma instância por job; disparos atrasados são coalescidos)
+    scheduler = BackgroundScheduler(timezone=TZ, job_defaults=JOB_DEFAULTS)
+    scheduler.add_listener(monitor_jobs.ouvir_agendador, EVENTOS_IGNORADOS)
+    # Poller único de cotações: primeira rodada já na partida
+    agendar(scheduler, atualizar_snapshot_cotacoes, snapshot_cotacoes.INTERVALO_SEGUNDOS,
+            "interval", seconds=snapshot_cotacoes.INTERVALO_SEGUNDOS, next_run_time=datetime.now(TZ))
+    # Um tick por minuto: cada horário HH:MM é atendido no próprio minuto
+    agendar(scheduler, executar_agenda, 60, "cron", minute="*", next_run_time=datetime.now(TZ))
+    agendar(scheduler, verificar_alertas_precos, ALERTAS_PRECO_INTERVALO, "interval", seconds=ALERTAS_PRECO_INTERVALO)
+    agendar(scheduler, consolidar_historico_alertas, None, "cron", hour=3, minute=30)  # Fora do pregão
     scheduler.start()
 
     logger.info("Bot iniciado com sucesso!")
@@ -690,110 +769,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
-
-# Função para salvar alerta no histórico
-def salvar_alerta_historico(user_id, ticker, alert_type, trigger_value, message):
-    """Salvar alerta no histórico"""
-    try:
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-            c.execute("""
-                INSERT INTO alert_history (user_id, ticker, alert_type, trigger_value, triggered_at, message)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (user_id, ticker, alert_type, trigger_value, datetime.now().isoformat(), message))
-            conn.commit()
-    except Exception as e:
-        logger.error(f"Erro ao salvar alerta no histórico: {e}")
-
-# Atualizar função de verificação de alertas de preço
-def verificar_alertas_precos():
-    try:
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-            c.execute("""
-                SELECT user_id, ticker, preco_alvo, sentido FROM alertas_precos
-                WHERE notificado = 0
-            """)
-            alertas = c.fetchall()
-
-            for user_id, ticker, preco_alvo, sentido in alertas:
-                try:
-                    acao = yf.Ticker(ticker)
-                    hist = acao.history(period="1d")
-                    if hist.empty:
-                        continue
-                    preco_atual = float(hist["Close"].iloc[-1])
-                except Exception as e:
-                    logger.warning(f"Erro ao verificar alerta para {ticker}: {e}")
-                    continue
-
-                if (sentido == "UP" and preco_atual >= preco_alvo) or (sentido == "DOWN" and preco_atual <= preco_alvo):
-                    emoji = "🚀" if sentido == "UP" else "📉"
-                    message = f"{emoji} *Alerta de preço:* {ticker} atingiu R$ {preco_atual:.2f} (alvo: R$ {preco_alvo:.2f})"
-
-                    telegram_bot_instance.send_message(
-                        chat_id=user_id,
-                        text=message,
-                        parse_mode='Markdown'
-                    )
-
-                    # Salvar no histórico
-                    salvar_alerta_historico(user_id, ticker, "price", preco_atual, message)
-
-                    # Marca como notificado
-                    c.execute("""
-                        UPDATE alertas_precos SET notificado = 1 WHERE user_id = ? AND ticker = ?
-                    """, (user_id, ticker))
-                    conn.commit()
-                    logger.info(f"Alerta de preço disparado para usuário {user_id}, ticker {ticker}")
-
-    except Exception as e:
-        logger.error(f"Erro ao verificar alertas de preço: {e}")
-
-# Atualizar função de verificação de alertas de pânico
-def verificar_alertas_panico():
-    agora = datetime.now(TZ).strftime("%H:%M")
-
-    try:
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-            c.execute("""
-                SELECT u.user_id, ap.ticker, ap.percentual_queda
-                FROM alertas_panico ap
-                JOIN usuarios u ON u.user_id = ap.user_id
-                WHERE ap.ativo=1 AND u.horario_panico=?
-            """, (agora,))
-            alertas = c.fetchall()
-
-            for user_id, ticker, percentual_queda in alertas:
-                try:
-                    acao = yf.Ticker(ticker)
-                    hist = acao.history(period="7d")
-                    if len(hist) < 2:
-                        continue
-
-                    preco_atual = float(hist["Close"].iloc[-1])
-                    preco_anterior = float(hist["Close"].iloc[-2])
-                    queda_real = ((preco_anterior - preco_atual) / preco_anterior) * 100
-
-                    if queda_real >= percentual_queda:
-                        message = f"🚨 *ALERTA DE PÂNICO:* {ticker} caiu {queda_real:.2f}% (R$ {preco_atual:.2f})"
-
-                        telegram_bot_instance.send_message(
-                            chat_id=user_id,
-                            text=message,
-                            parse_mode='Markdown'
-                        )
-
-                        # Salvar no histórico
-                        salvar_alerta_historico(user_id, ticker, "panic", queda_real, message)
-
-                        logger.info(f"Alerta de pânico disparado para usuário {user_id}, ticker {ticker}, queda {queda_real:.2f}%")
-
-                except Exception as e:
-                    logger.warning(f"Erro ao verificar alerta de pânico para {ticker}: {e}")
-
-    except Exception as e:
-        logger.error(f"Erro ao verificar alertas de pânico: {e}")
-
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+from threading import RLock
+
+# Orçamento padrão do cache de cotações
+CACHE_MAX_ENTRADAS = int(os.environ.get("CACHE_MAX_ENTRADAS", "2000"))
+CACHE_MAX_MB = float(os.environ.get("CACHE_MAX_MB", "64"))
+
+# Registros de usuários autenticados: invalidados explicitamente a cada alteração,
+# o TTL só limita o tempo de vida de alterações feitas fora da API e do bot
+CACHE_USUARIOS_MAX_ENTRADAS = int(os.environ.get("CACHE_USUARIOS_MAX_ENTRADAS", "10000"))
+CACHE_USUARIOS_TTL = float(os.environ.get("CACHE_USUARIOS_TTL", "300"))
+
+# TTL (segundos) por período do yfinance: intradiário curto, histórico longo
+TTL_POR_PERIODO = {
+    "1d": 60,
+    "2d": 300,
+    "5d": 300,
+    "7d": 600,
+    "1mo": 1800,
+    "3mo": 3600,
+    "1y": 6 * 3600,
+    "max": 24 * 3600,
+}
+TTL_PADRAO = 300
+
+
+def ttl_para_periodo(period: str) -> int:
+    """Obter o TTL configurado para um período do yfinance"""
+    return TTL_POR_PERIODO.get(period, TTL_PADRAO)
+
+
+def estimar_tamanho(valor) -> int:
+    """Estimar o tamanho em bytes de um valor armazenado no cache"""
+    memory_usage = getattr(valor, "memory_usage", None)
+    if memory_usage is not None:
+        try:
+            return int(memory_usage(deep=True).sum())
+        except Exception:
+            pass
+    return sys.getsizeof(valor)
+
+
+class CacheLRU:
+    """Cache thread-safe com TTL por entrada, despejo LRU e orçamento de memória"""
+
+    def __init__(self, max_entradas: int, max_bytes: int, ttl_padrao: float = TTL_PADRAO):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl_padrao = ttl_padrao
+        self._dados = OrderedDict()  # chave -> (valor, expira_em, tamanho)
+        self._bytes = 0
+        self._lock = RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, chave):
+        with self._lock:
+            entrada = self._dados.get(chave)
+            if entrada is None:
+                self.misses += 1
+                return None
+
+            valor, expira_em, _ = entrada
+            if expira_em <= time.monotonic():
+                self._remover(chave)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._dados.move_to_end(chave)
+            self.hits += 1
+            return valor
+
+    def set(self, chave, valor, ttl: float | None = None):
+        tamanho = estimar_tamanho(valor)
+        if tamanho > self.max_bytes:
+            return
+
+        expira_em = time.monotonic() + (self.ttl_padrao if ttl is None else ttl)
+        with self._lock:
+            if chave in self._dados:
+                self._remover(chave)
+            self._dados[chave] = (valor, expira_em, tamanho)
+            self._bytes += tamanho
+
+            while len(self._dados) > self.max_entradas or self._bytes > self.max_bytes:
+                chave_antiga = next(iter(self._dados))
+                self._remover(chave_antiga)
+                self.evictions += 1
+
+    def invalidar(self, chave):
+        with self._lock:
+            if chave in self._dados:
+                self._remover(chave)
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+            self._bytes = 0
+
+    def _remover(self, chave):
+        _, _, tamanho = self._dados.pop(chave)
+        self._bytes -= tamanho
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._dados),
+                "bytes": self._bytes,
+                "max_entradas": self.max_entradas,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Cache compartilhado entre a API (main.py) e o bot (bot.py)
+cache_cotacoes = CacheLRU(
+    max_entradas=CACHE_MAX_ENTRADAS,
+    max_bytes=int(CACHE_MAX_MB * 1024 * 1024),
+)
+
+# Usuários do dashboard (UserInDB) por user_id, consultados a cada requisição autenticada
+cache_usuarios = CacheLRU(
+    max_entradas=CACHE_USUARIOS_MAX_ENTRADAS,
+    max_bytes=16 * 1024 * 1024,
+    ttl_padrao=CACHE_USUARIOS_TTL,
+)
@@ -0,0 +1,76 @@
+from threading import Event, Lock
+
+
+class _Chamada:
+    __slots__ = ("evento", "resultado", "erro")
+
+    def __init__(self):
+        self.evento = Event()
+        self.resultado = None
+        self.erro = None
+
+
+class SingleFlight:
+    """Coalescer buscas simultâneas pela mesma chave em uma única execução.
+
+    A primeira thread a pedir uma chave executa a busca; as demais esperam e
+    recebem o mesmo resultado (ou a mesma exceção).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._em_voo = {}
+        self.execucoes = 0
+        self.coalescidas = 0
+
+    def iniciar(self, chave):
+        """Registrar interesse na chave. Retorna ``(chamada, lider)``"""
+        with self._lock:
+            chamada = self._em_voo.get(chave)
+            if chamada is not None:
+                self.coalescidas += 1
+                return chamada, False
+            chamada = _Chamada()
+            self._em_voo[chave] = chamada
+            self.execucoes += 1
+            return chamada, True
+
+    def concluir(self, chave, chamada, resultado=None, erro=None):
+        """Publicar o resultado do líder e liberar quem está esperando"""
+        chamada.resultado = resultado
+        chamada.erro = erro
+        with self._lock:
+            if self._em_voo.get(chave) is chamada:
+                del self._em_voo[chave]
+        chamada.evento.set()
+
+    def aguardar(self, chamada):
+        chamada.evento.wait()
+        if chamada.erro is not None:
+            raise chamada.erro
+        return chamada.resultado
+
+    def executar(self, chave, func):
+        chamada, lider = self.iniciar(chave)
+        if not lider:
+            return self.aguardar(chamada)
+
+        try:
+            resultado = func()
+        except BaseException as e:
+            self.concluir(chave, chamada, erro=e)
+            raise
+        self.concluir(chave, chamada, resultado=resultado)
+        return resultado
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "em_voo": len(self._em_voo),
+                "execucoes": self.execucoes,
+                "coalescidas": self.coalescidas,
+            }
+
+
+# Buscas de cotações e históricos compartilhadas pela API e pelo bot
+voos_cotacoes = SingleFlight()
@@ -0,0 +1,68 @@
+import logging
+import os
+
+from cache import cache_cotacoes, ttl_para_periodo
+from coalescencia import voos_cotacoes
+from provedores import provedor_atual
+
+logger = logging.getLogger(__name__)
+
+# Quantidade máxima de tickers por requisição multi-símbolo ao provedor
+LOTE_MAXIMO = int(os.environ.get("COTACOES_LOTE_MAXIMO", "50"))
+
+
+def dividir_em_lotes(tickers, tamanho=None):
+    """Dividir a lista de tickers em lotes de tamanho limitado"""
+    tamanho = tamanho or LOTE_MAXIMO
+    tickers = list(tickers)
+    for inicio in range(0, len(tickers), tamanho):
+        yield tickers[inicio:inicio + tamanho]
+
+
+def obter_historico(ticker: str, period: str = "1d"):
+    """Obter o histórico de um ticker, passando pelo cache compartilhado.
+
+    Erros do provedor são propagados para o chamador; históricos vazios não são cacheados.
+    """
+    chave = ("historico", ticker, period)
+    hist = cache_cotacoes.get(chave)
+    if hist is not None:
+        return hist
+
+    def _buscar():
+        hist = provedor_atual().historico(ticker, period=period)
+        if not hist.empty:
+            cache_cotacoes.set(chave, hist, ttl=ttl_para_periodo(period))
+        return hist
+
+    # Requisições simultâneas pelo mesmo ticker/período compartilham uma busca
+    return voos_cotacoes.executar(chave, _buscar)
+
+
+def obter_preco_atual(ticker: str):
+    """Obter o último preço de fechamento de um ticker (None se não houver dados)"""
+    hist = obter_historico(ticker, "1d")
+    if hist.empty:
+        return None
+    return float(hist["Close"].iloc[-1])
+
+
+def baixar_historicos(tickers, falhas: set | None = None, **parametros):
+    """Baixar históricos em lote pelo provedor configurado, sem passar pelo cache.
+
+    ``parametros`` são repassados ao provedor (``period`` ou ``start``). Retorna
+    ``{ticker: DataFrame}``; tickers sem dados ficam de fora. Se ``falhas`` for
+    informado, recebe os tickers dos lotes que falharam (sem dados por erro, não
+    por inexistência).
+    """
+    provedor = provedor_atual()
+    resultado = {}
+    for lote in dividir_em_lotes(tickers):
+        try:
+            resultado.update(provedor.historicos_em_lote(lote, **parametros))
+        except Exception as e:
+            logger.warning(f"Erro ao buscar lote de cotações {lote}: {e}")
+            if falhas is not None:
+                falhas.update(lote)
+    return resultado
+
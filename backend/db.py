@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Banco compartilhado pela API (main.py) e pelo bot (bot.py)
+DB_PATH = os.environ.get("DB_PATH", "acoes.db")
+
+# Tempo que uma conexão espera por um lock antes de falhar com "database is locked"
+BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+
+PRAGMAS = {
+    "synchronous": "NORMAL",      # seguro com WAL e evita fsync a cada commit
+    "cache_size": "-20000",       # ~20 MB de page cache por conexão
+    "mmap_size": str(256 * 1024 * 1024),
+    "temp_store": "MEMORY",
+    "busy_timeout": str(BUSY_TIMEOUT_MS),
+}
+
+_local = threading.local()
+_wal_configurado = set()
+_wal_lock = threading.Lock()
+
+
+def configurar_banco(caminho: str):
+    """Trocar o arquivo de banco usado pelas próximas conexões (benchmarks, testes)"""
+    global DB_PATH
+    DB_PATH = caminho
+
+
+def _ativar_wal(conn, caminho):
+    # journal_mode=WAL é persistente no arquivo: basta uma vez por processo
+    with _wal_lock:
+        if caminho in _wal_configurado:
+            return
+        conn.execute("PRAGMA journal_mode=WAL")
+        _wal_configurado.add(caminho)
+
+
+def _abrir(caminho, somente_leitura):
+    if somente_leitura:
+        uri = f"file:{os.path.abspath(caminho)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT_MS / 1000)
+        conn.execute("PRAGMA query_only=1")
+    else:
+        conn = sqlite3.connect(caminho, timeout=BUSY_TIMEOUT_MS / 1000)
+        _ativar_wal(conn, caminho)
+
+    conn.row_factory = sqlite3.Row
+    for pragma, valor in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma}={valor}")
+    return conn
+
+
+def _conexao_da_thread(somente_leitura=False):
+    """Conexão persistente da thread atual (uma de escrita e uma de leitura por banco)"""
+    conexoes = getattr(_local, "conexoes", None)
+    if conexoes is None:
+        conexoes = _local.conexoes = {}
+
+    chave = (DB_PATH, somente_leitura)
+    conn = conexoes.get(chave)
+    if conn is None:
+        conn = conexoes[chave] = _abrir(DB_PATH, somente_leitura)
+    return conn
+
+
+@contextmanager
+def conexao():
+    """Conexão de escrita da thread atual.
+
+    Faz commit ao sair do bloco mais externo ou rollback em caso de exceção; blocos
+    aninhados na mesma thread compartilham a transação.
+    """
+    conn = _conexao_da_thread()
+    profundidade = getattr(_local, "profundidade", 0)
+    _local.profundidade = profundidade + 1
+    try:
+        yield conn
+        if profundidade == 0:
+            conn.commit()
+    except BaseException:
+        if profundidade == 0:
+            conn.rollback()
+        raise
+    finally:
+        _local.profundidade = profundidade
+
+
+@contextmanager
+def conexao_leitura():
+    """Conexão somente leitura da thread atual.
+
+    Com WAL, leituras não bloqueiam nem são bloqueadas pelas escritas do agendador.
+    """
+    yield _conexao_da_thread(somente_leitura=True)
+
+
+@contextmanager
+def transacao_leitura():
+    """Transação explícita na conexão somente leitura da thread.
+
+    Todas as consultas do bloco, inclusive as feitas via ``conexao_leitura``,
+    enxergam o mesmo snapshot do WAL. Blocos aninhados reaproveitam a transação.
+    """
+    conn = _conexao_da_thread(somente_leitura=True)
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+
+from executor import executar_bloqueante
+from snapshot_cotacoes import obter_cotacoes
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre consultas do poller compartilhado
+INTERVALO_SEGUNDOS = float(os.environ.get("STREAM_PRECOS_INTERVALO", "15"))
+# Comentário SSE enviado quando não há preços novos, para manter proxies com a conexão aberta
+HEARTBEAT_SEGUNDOS = float(os.environ.get("STREAM_PRECOS_HEARTBEAT", "20"))
+
+
+class Assinatura:
+    """Preços pendentes de um cliente do stream.
+
+    Atualizações de um mesmo ticker se sobrescrevem até o cliente consumi-las:
+    um cliente lento recebe só o preço mais recente, sem fila crescendo.
+    """
+
+    def __init__(self, tickers):
+        self.tickers = frozenset(tickers)
+        self._pendentes = {}
+        self._evento = asyncio.Event()
+
+    def publicar(self, precos: dict):
+        self._pendentes.update(precos)
+        self._evento.set()
+
+    async def proximos(self, timeout: float):
+        """Aguardar preços novos; ``{}`` se o timeout passar sem atualizações"""
+        try:
+            await asyncio.wait_for(self._evento.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._evento.clear()
+        precos, self._pendentes = self._pendentes, {}
+        return precos
+
+
+class DifusorCotacoes:
+    """Poller único de cotações com assinaturas multiplexadas por ticker.
+
+    A cada intervalo busca, em lote, a união dos tickers assinados e entrega a
+    cada assinatura só os tickers dela cujo preço mudou. O custo no provedor
+    depende do número de tickers distintos, não do número de dashboards abertos.
+    Lê do snapshot de cotações (o provedor só é consultado quando ele está
+    velho). Roda no event loop da API; a leitura vai para o executor de I/O.
+    """
+
+    def __init__(self, intervalo: float = INTERVALO_SEGUNDOS):
+        self.intervalo = intervalo
+        self._assinaturas = set()
+        self._por_ticker = {}
+        self._ultimos = {}
+        self._tarefa = None
+        self._acordar = None
+        self.ciclos = 0
+        self.tickers_buscados = 0
+        self.erros = 0
+
+    def assinar(self, tickers) -> Assinatura:
+        assinatura = Assinatura(tickers)
+        self._assinaturas.add(assinatura)
+        novos = False
+        for ticker in assinatura.tickers:
+            if ticker not in self._por_ticker:
+                self._por_ticker[ticker] = set()
+                novos = True
+            self._por_ticker[ticker].add(assinatura)
+
+        # O cliente recebe de imediato o que já se conhece; tickers novos antecipam o próximo ciclo
+        conhecidos = {t: self._ultimos[t] for t in assinatura.tickers if t in self._ultimos}
+        if conhecidos:
+            assinatura.publicar(conhecidos)
+        self._garantir_tarefa()
+        if novos:
+            self._acordar.set()
+        return assinatura
+
+    def cancelar(self, assinatura: Assinatura):
+        self._assinaturas.discard(assinatura)
+        for ticker in assinatura.tickers:
+            assinantes = self._por_ticker.get(ticker)
+            if assinantes is None:
+                continue
+            assinantes.discard(assinatura)
+            if not assinantes:
+                del self._por_ticker[ticker]
+                self._ultimos.pop(ticker, None)
+
+    def _garantir_tarefa(self):
+        if self._tarefa is None or self._tarefa.done():
+            self._acordar = asyncio.Event()
+            self._tarefa = asyncio.get_running_loop().create_task(self._executar())
+
+    async def _executar(self):
+        # Encerra sozinho quando o último cliente sai; a próxima assinatura reinicia
+        while self._assinaturas:
+            await self._ciclo()
+            try:
+                await asyncio.wait_for(self._acordar.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
+
+    async def _ciclo(self):
+        tickers = list(self._por_ticker)
+        if not tickers:
+            return
+        try:
+            precos = await executar_bloqueante(obter_cotacoes, tickers)
+        except Exception as e:
+            self.erros += 1
+            logger.warning(f"Erro ao atualizar cotações do stream: {e}")
+            return
+        self.ciclos += 1
+        self.tickers_buscados += len(tickers)
+
+        alterados = {}
+        for ticker, preco in precos.items():
+            if ticker in self._por_ticker and self._ultimos.get(ticker) != preco:
+                self._ultimos[ticker] = preco
+                alterados[ticker] = preco
+
+        entregas = {}
+        for ticker, preco in alterados.items():
+            for assinatura in self._por_ticker[ticker]:
+                entregas.setdefault(assinatura, {})[ticker] = preco
+        for assinatura, precos_assinatura in entregas.items():
+            assinatura.publicar(precos_assinatura)
+
+    def estatisticas(self) -> dict:
+        return {
+            "assinaturas": len(self._assinaturas),
+            "tickers": len(self._por_ticker),
+            "ciclos": self.ciclos,
+            "tickers_buscados": self.tickers_buscados,
+            "erros": self.erros,
+            "intervalo_segundos": self.intervalo,
+            "ativo": self._tarefa is not None and not self._tarefa.done(),
+        }
+
+
+def evento_sse(evento: str, dados: str) -> str:
+    return f"event: {evento}\ndata: {dados}\n\n"
+
+
+difusor_cotacoes = DifusorCotacoes()
@@ -0,0 +1,115 @@
+import atexit
+import logging
+import os
+import queue
+import time
+from itertools import groupby
+from operator import itemgetter
+from threading import Event, Lock, Thread
+
+from db import conexao
+
+logger = logging.getLogger(__name__)
+
+# Um lote é gravado quando atinge LOTE_MAXIMO comandos ou após INTERVALO_MS
+LOTE_MAXIMO = int(os.environ.get("ESCRITOR_LOTE_MAXIMO", "500"))
+INTERVALO_MS = float(os.environ.get("ESCRITOR_INTERVALO_MS", "200"))
+
+
+class EscritorEmLote:
+    """Thread única de escrita que agrupa comandos enfileirados em poucas transações.
+
+    Os comandos são gravados na ordem em que foram enfileirados; comandos
+    consecutivos com o mesmo SQL viram um único ``executemany``. ``flush()``
+    bloqueia até que tudo o que foi enfileirado antes dele esteja commitado.
+    """
+
+    def __init__(self, nome: str, lote_maximo: int = None, intervalo_ms: float = None):
+        self.nome = nome
+        self.lote_maximo = lote_maximo or LOTE_MAXIMO
+        self.intervalo = (intervalo_ms if intervalo_ms is not None else INTERVALO_MS) / 1000
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = Lock()
+        self._lotes = 0
+        self._comandos = 0
+        self._erros = 0
+
+    def _garantir_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._executar, name=self.nome, daemon=True)
+                self._thread.start()
+
+    def enfileirar(self, sql: str, params=()):
+        """Agendar um comando de escrita"""
+        self._garantir_thread()
+        self._fila.put((sql, params))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Aguardar a gravação de todos os comandos enfileirados até agora"""
+        if self._thread is None:
+            return True  # nada foi enfileirado
+        gravado = Event()
+        self._garantir_thread()
+        self._fila.put(gravado)
+        return gravado.wait(timeout)
+
+    def _coletar_lote(self):
+        lote = [self._fila.get()]
+        limite = time.monotonic() + self.intervalo
+        # Um flush encerra o lote na hora: quem espera não paga o intervalo
+        while len(lote) < self.lote_maximo and not isinstance(lote[-1], Event):
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._fila.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _executar(self):
+        while True:
+            lote = self._coletar_lote()
+            comandos = [item for item in lote if not isinstance(item, Event)]
+            if comandos:
+                self._gravar(comandos)
+            for item in lote:
+                if isinstance(item, Event):
+                    item.set()
+
+    def _gravar(self, comandos):
+        try:
+            with conexao() as conn:
+                for sql, grupo in groupby(comandos, key=itemgetter(0)):
+                    conn.executemany(sql, [params for _, params in grupo])
+        except Exception as e:
+            # Regravar um a um para não perder o lote inteiro por um comando inválido
+            logger.error(f"Erro ao gravar lote de {len(comandos)} comandos ({self.nome}): {e}")
+            for sql, params in comandos:
+                try:
+                    with conexao() as conn:
+                        conn.execute(sql, params)
+                except Exception as e:
+                    with self._lock:
+                        self._erros += 1
+                    logger.error(f"Erro ao gravar comando ({self.nome}): {e}")
+
+        with self._lock:
+            self._lotes += 1
+            self._comandos += len(comandos)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "pendentes": self._fila.qsize(),
+                "lotes": self._lotes,
+                "comandos": self._comandos,
+                "erros": self._erros,
+            }
+
+
+# Flags de notificação e histórico dos alertas disparados pelos jobs
+escritor_alertas = EscritorEmLote("escritor-alertas")
+atexit.register(escritor_alertas.flush, timeout=5)
@@ -0,0 +1,18 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Threads disponíveis para I/O bloqueante (yfinance, SQLite, arquivos). É também o teto de
+# concorrência das requisições: buscas de vários tickers são feitas em lote pelo provedor
+# (cotacoes.baixar_historicos), sem fan-out de uma tarefa por ticker
+EXECUTOR_MAX_WORKERS = int(os.environ.get("EXECUTOR_MAX_WORKERS", "16"))
+
+executor_io = ThreadPoolExecutor(max_workers=EXECUTOR_MAX_WORKERS, thread_name_prefix="io")
+
+
+async def executar_bloqueante(func, *args, **kwargs):
+    """Executar uma função bloqueante no executor de I/O sem travar o event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor_io, partial(func, *args, **kwargs))
+
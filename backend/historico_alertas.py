@@ -0,0 +1,100 @@
+import base64
+import logging
+import os
+from datetime import datetime, timedelta
+
+from db import conexao, conexao_leitura
+
+logger = logging.getLogger(__name__)
+
+# Alertas mais antigos que isso viram contagens diárias por ticker em alert_history_diario
+RETENCAO_DIAS = int(os.environ.get("HISTORICO_ALERTAS_RETENCAO_DIAS", "90"))
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 200
+
+COLUNAS = "id, ticker, alert_type, trigger_value, triggered_at, message"
+
+
+def codificar_cursor(triggered_at: str, id_alerta: int) -> str:
+    return base64.urlsafe_b64encode(f"{triggered_at}|{id_alerta}".encode()).decode()
+
+
+def decodificar_cursor(cursor: str):
+    """Obter (triggered_at, id) de um cursor; ValueError se for inválido"""
+    try:
+        triggered_at, id_alerta = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return triggered_at, int(id_alerta)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def listar_pagina(user_id: int, limite: int = LIMITE_PADRAO, cursor: str | None = None,
+                  ticker: str | None = None, tipo: str | None = None):
+    """Obter uma página do histórico, do mais recente para o mais antigo.
+
+    Paginação por chave (triggered_at, id): cada página custa o mesmo, não importa
+    a profundidade. Retorna ``(alertas, proximo_cursor)``; o cursor é None na última página.
+    """
+    condicoes = ["user_id = ?"]
+    params = [user_id]
+    if ticker:
+        condicoes.append("ticker = ?")
+        params.append(ticker)
+    if tipo:
+        condicoes.append("alert_type = ?")
+        params.append(tipo)
+    if cursor:
+        condicoes.append("(triggered_at, id) < (?, ?)")
+        params.extend(decodificar_cursor(cursor))
+
+    # Uma linha a mais indica se existe próxima página
+    params.append(limite + 1)
+    with conexao_leitura() as conn:
+        alertas = conn.execute(f"""
+            SELECT {COLUNAS} FROM alert_history
+            WHERE {" AND ".join(condicoes)}
+            ORDER BY triggered_at DESC, id DESC
+            LIMIT ?
+        """, params).fetchall()
+
+    proximo_cursor = None
+    if len(alertas) > limite:
+        alertas = alertas[:limite]
+        ultimo = alertas[-1]
+        proximo_cursor = codificar_cursor(ultimo["triggered_at"], ultimo["id"])
+    return alertas, proximo_cursor
+
+
+def resumo_diario(user_id: int, dias: int = 365):
+    """Obter as contagens diárias por ticker dos alertas já consolidados"""
+    inicio = (datetime.now() - timedelta(days=dias)).date().isoformat()
+    with conexao_leitura() as conn:
+        return conn.execute("""
+            SELECT dia, ticker, alert_type, quantidade FROM alert_history_diario
+            WHERE user_id = ? AND dia >= ?
+            ORDER BY dia DESC, ticker
+        """, (user_id, inicio)).fetchall()
+
+
+def consolidar_historico(retencao_dias: int = None):
+    """Mover alertas antigos para contagens por dia, ticker e tipo.
+
+    Inserção e remoção acontecem na mesma transação: um alerta nunca é contado
+    duas vezes nem perdido. Retorna o número de alertas consolidados.
+    """
+    retencao_dias = retencao_dias if retencao_dias is not None else RETENCAO_DIAS
+    limite = (datetime.now() - timedelta(days=retencao_dias)).isoformat()
+
+    with conexao() as conn:
+        conn.execute("""
+            INSERT INTO alert_history_diario (user_id, ticker, alert_type, dia, quantidade)
+            SELECT user_id, ticker, alert_type, substr(triggered_at, 1, 10), COUNT(*)
+            FROM alert_history
+            WHERE triggered_at < ?
+            GROUP BY user_id, ticker, alert_type, substr(triggered_at, 1, 10)
+            ON CONFLICT(user_id, ticker, alert_type, dia)
+            DO UPDATE SET quantidade = quantidade + excluded.quantidade
+        """, (limite,))
+        removidos = conn.execute("DELETE FROM alert_history WHERE triggered_at < ?", (limite,)).rowcount
+    return removidos
@@ -0,0 +1,243 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pandas as pd
+
+from cache import ttl_para_periodo
+from coalescencia import voos_cotacoes
+from cotacoes import baixar_historicos
+from db import conexao, conexao_leitura
+
+logger = logging.getLogger(__name__)
+
+# Como cada período do yfinance é lido do armazenamento local:
+# ("barras", n) = últimos n pregões; ("dias", n) = últimos n dias corridos; None = tudo
+PERIODOS = {
+    "1d": ("barras", 1),
+    "2d": ("barras", 2),
+    "5d": ("barras", 5),
+    "7d": ("dias", 7),
+    "1mo": ("dias", 31),
+    "3mo": ("dias", 92),
+    "1y": ("dias", 366),
+    "max": None,
+}
+
+# Janela de dias corridos que garante n pregões (fins de semana e feriados)
+DIAS_POR_BARRA = 2
+FOLGA_BARRAS_DIAS = 7
+
+COLUNAS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+def _inicio_necessario(period: str):
+    """Primeira data necessária para atender o período (None = histórico completo)"""
+    regra = PERIODOS.get(period, PERIODOS["1d"])
+    if regra is None:
+        return None
+    tipo, n = regra
+    dias = n * DIAS_POR_BARRA + FOLGA_BARRAS_DIAS if tipo == "barras" else n
+    return (date.today() - timedelta(days=dias)).isoformat()
+
+
+def _ler_coberturas(conn, tickers):
+    coberturas = {}
+    for ticker in tickers:
+        row = conn.execute(
+            "SELECT inicio, completo, atualizado_em FROM historico_cobertura WHERE ticker = ?",
+            (ticker,)
+        ).fetchone()
+        if row:
+            coberturas[ticker] = row
+    return coberturas
+
+
+def _planejar_busca(ticker, cobertura, inicio_necessario, agora, ttl_final):
+    """Decidir o que precisa ser baixado para o ticker.
+
+    Retorna ``None`` se o armazenamento local já atende, ``("max", None)`` para o
+    histórico completo ou ``("start", data)`` para baixar a partir de uma data.
+    """
+    if cobertura is None:
+        return ("max", None) if inicio_necessario is None else ("start", inicio_necessario)
+
+    inicio, completo, atualizado_em = cobertura
+    if not completo:
+        if inicio_necessario is None:
+            return ("max", None)
+        if inicio is None or inicio_necessario < inicio:
+            return ("start", inicio_necessario)
+
+    if atualizado_em is None or agora - atualizado_em >= ttl_final:
+        return ("final", None)
+    return None
+
+
+def _ultima_data(conn, ticker):
+    row = conn.execute("SELECT MAX(data) FROM historico_precos WHERE ticker = ?", (ticker,)).fetchone()
+    return row[0] if row else None
+
+
+def _gravar(conn, ticker, hist):
+    datas = hist.index.strftime("%Y-%m-%d")
+    valores = hist.reindex(columns=COLUNAS).astype(float)
+    linhas = zip(
+        [ticker] * len(hist), datas,
+        valores["Open"].tolist(), valores["High"].tolist(), valores["Low"].tolist(),
+        valores["Close"].tolist(), valores["Volume"].tolist(),
+    )
+    conn.executemany("""
+        INSERT OR REPLACE INTO historico_precos (ticker, data, open, high, low, close, volume)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, linhas)
+
+
+def sincronizar(tickers, period: str = "max"):
+    """Baixar apenas os pregões que faltam no armazenamento local para o período.
+
+    Tickers com a mesma data de início são baixados juntos, em lote.
+    """
+    tickers = sorted(set(tickers))
+    if not tickers:
+        return
+
+    inicio_necessario = _inicio_necessario(period)
+    agora = time.time()
+    ttl_final = ttl_para_periodo("1d")
+
+    with conexao_leitura() as conn:
+        coberturas = _ler_coberturas(conn, tickers)
+
+        # Agrupar tickers pela requisição necessária para baixar em lote
+        grupos = defaultdict(list)
+        for ticker in tickers:
+            plano = _planejar_busca(ticker, coberturas.get(ticker), inicio_necessario, agora, ttl_final)
+            if plano is None:
+                continue
+            tipo, inicio = plano
+            if tipo == "final":
+                # Rebaixa o último pregão gravado, que pode estar incompleto
+                inicio = _ultima_data(conn, ticker) or inicio_necessario
+                tipo = "start" if inicio else "max"
+            grupos[(tipo, inicio)].append(ticker)
+
+    for (tipo, inicio), grupo in grupos.items():
+        falhas = set()
+        if tipo == "max":
+            historicos = baixar_historicos(grupo, falhas, period="max")
+        else:
+            historicos = baixar_historicos(grupo, falhas, start=inicio)
+
+        with conexao() as conn:
+            for ticker in grupo:
+                if ticker in falhas:
+                    continue  # erro do provedor: tenta de novo na próxima leitura
+                hist = historicos.get(ticker)
+                # Ticker sem dados (deslistado, digitado errado) também registra a
+                # cobertura: o TTL evita rebaixá-lo a cada leitura
+                if hist is not None:
+                    _gravar(conn, ticker, hist)
+
+                inicio_coberto = inicio if tipo == "start" else None
+                conn.execute("""
+                    INSERT INTO historico_cobertura (ticker, inicio, completo, atualizado_em)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(ticker) DO UPDATE SET
+                        inicio = CASE
+                            WHEN MAX(historico_cobertura.completo, excluded.completo) = 1 THEN NULL
+                            WHEN historico_cobertura.inicio IS NULL THEN excluded.inicio
+                            ELSE MIN(historico_cobertura.inicio, excluded.inicio)
+                        END,
+                        completo = MAX(historico_cobertura.completo, excluded.completo),
+                        atualizado_em = excluded.atualizado_em
+                """, (ticker, inicio_coberto, int(tipo == "max"), agora))
+
+
+def _ler(conn, ticker, period):
+    regra = PERIODOS.get(period, PERIODOS["1d"])
+    if regra is None:
+        consulta = "SELECT data, open, high, low, close, volume FROM historico_precos WHERE ticker = ? ORDER BY data"
+        params = (ticker,)
+    elif regra[0] == "barras":
+        consulta = """
+            SELECT * FROM (
+                SELECT data, open, high, low, close, volume FROM historico_precos
+                WHERE ticker = ? ORDER BY data DESC LIMIT ?
+            ) ORDER BY data
+        """
+        params = (ticker, regra[1])
+    else:
+        consulta = """
+            SELECT data, open, high, low, close, volume FROM historico_precos
+            WHERE ticker = ? AND data >= ? ORDER BY data
+        """
+        params = (ticker, _inicio_necessario(period))
+
+    df = pd.read_sql_query(consulta, conn, params=params)
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.pop("data")), name="Date")
+    df.columns = COLUNAS
+    return df
+
+
+def obter_historicos_diarios(tickers, period: str = "max"):
+    """Obter pregões diários de vários tickers a partir do armazenamento local.
+
+    Retorna ``{ticker: DataFrame}`` com as colunas Open/High/Low/Close/Volume;
+    tickers sem dados ficam de fora.
+    """
+    tickers = sorted(set(tickers))
+    sincronizar(tickers, period)
+
+    resultado = {}
+    with conexao_leitura() as conn:
+        for ticker in tickers:
+            hist = _ler(conn, ticker, period)
+            if not hist.empty:
+                resultado[ticker] = hist
+    return resultado
+
+
+def obter_fechamentos_diarios(tickers, period: str = "7d"):
+    """Obter os fechamentos diários de vários tickers em um único DataFrame longo.
+
+    Uma consulta para todos os tickers; colunas ``ticker``, ``data`` e ``close``,
+    ordenadas por ticker e data.
+    """
+    tickers = sorted(set(tickers))
+    if not tickers:
+        return pd.DataFrame(columns=["ticker", "data", "close"])
+    sincronizar(tickers, period)
+
+    marcadores = ",".join("?" * len(tickers))
+    regra = PERIODOS.get(period, PERIODOS["1d"])
+    if regra is not None and regra[0] == "barras":
+        consulta = f"""
+            SELECT ticker, data, close FROM (
+                SELECT ticker, data, close,
+                       ROW_NUMBER() OVER (PARTITION BY ticker ORDER BY data DESC) AS ordem
+                FROM historico_precos WHERE ticker IN ({marcadores})
+            ) WHERE ordem <= ? ORDER BY ticker, data
+        """
+        params = (*tickers, regra[1])
+    else:
+        inicio = _inicio_necessario(period) or ""
+        consulta = f"""
+            SELECT ticker, data, close FROM historico_precos
+            WHERE ticker IN ({marcadores}) AND data >= ? ORDER BY ticker, data
+        """
+        params = (*tickers, inicio)
+
+    with conexao_leitura() as conn:
+        return pd.read_sql_query(consulta, conn, params=params)
+
+
+def obter_historico_diario(ticker: str, period: str = "max"):
+    """Obter os pregões diários de um ticker (DataFrame vazio se não houver dados)"""
+    def _buscar():
+        hist = obter_historicos_diarios([ticker], period).get(ticker)
+        return hist if hist is not None else pd.DataFrame(columns=COLUNAS)
+
+    # Visualizações simultâneas do mesmo histórico compartilham a sincronização
+    return voos_cotacoes.executar(("historico_diario", ticker, period), _buscar)
@@ -0,0 +1,153 @@
+import logging
+import os
+import time
+from bisect import bisect_left, bisect_right, insort
+from threading import Lock
+
+from db import conexao_leitura
+from escritor import escritor_alertas
+
+logger = logging.getLogger(__name__)
+
+# Recarga completa periódica: cobre alterações feitas por outro processo (ex.: bot rodando sozinho)
+RECARGA_SEGUNDOS = float(os.environ.get("INDICE_ALERTAS_RECARGA", "900"))
+
+
+class IndiceAlertas:
+    """Índice em memória dos alertas de preço pendentes, ordenado por preço-alvo.
+
+    Para cada ticker há uma lista ordenada de alvos UP e outra de alvos DOWN.
+    Com um preço novo, os alertas cruzados são encontrados por busca binária:
+    UP dispara com ``preço >= alvo`` (prefixo da lista) e DOWN com
+    ``preço <= alvo`` (sufixo). Custo O(log n + disparados) por ticker.
+
+    Os caminhos de CRUD de ``alertas_precos`` (API e bot) chamam ``definir`` e
+    ``remover`` depois do commit, mantendo o índice igual à tabela. Durante uma
+    recarga, essas alterações também vão para um diário, reaplicado sobre os
+    dados lidos do banco antes da troca: nada feito no meio da leitura se perde.
+    """
+
+    def __init__(self, recarga_segundos: float = RECARGA_SEGUNDOS):
+        self.recarga_segundos = recarga_segundos
+        self._lock = Lock()
+        self._lock_recarga = Lock()
+        self._diario = None
+        self._up = {}
+        self._down = {}
+        self._alvos = {}
+        self._carregado_em = None
+
+    def recarregar(self):
+        """Reconstruir o índice a partir dos alertas com ``notificado = 0``"""
+        with self._lock_recarga:
+            self._recarregar()
+
+    def _recarregar(self):
+        # Diário aberto antes do flush: o que mudar daqui em diante é reaplicado após a leitura
+        with self._lock:
+            self._diario = []
+        try:
+            # Flags de notificado ainda na fila fariam alertas já disparados voltarem ao índice
+            escritor_alertas.flush()
+            with conexao_leitura() as conn:
+                alertas = conn.execute("""
+                    SELECT user_id, ticker, preco_alvo, sentido FROM alertas_precos
+                    WHERE notificado = 0
+                """).fetchall()
+        except BaseException:
+            with self._lock:
+                self._diario = None
+            raise
+
+        up, down, alvos = {}, {}, {}
+        for user_id, ticker, preco_alvo, sentido in alertas:
+            lado = up if sentido == "UP" else down
+            lado.setdefault(ticker, []).append((preco_alvo, user_id))
+            alvos[(user_id, ticker)] = (preco_alvo, sentido)
+        for lado in (up, down):
+            for lista in lado.values():
+                lista.sort()
+
+        with self._lock:
+            diario, self._diario = self._diario, None
+            self._up, self._down, self._alvos = up, down, alvos
+            for operacao, args in diario:
+                operacao(*args)
+            self._carregado_em = time.monotonic()
+        logger.info(f"Índice de alertas de preço carregado: {len(alvos)} alertas pendentes")
+
+    def _garantir_carregado(self):
+        carregado_em = self._carregado_em
+        if carregado_em is None or time.monotonic() - carregado_em > self.recarga_segundos:
+            self.recarregar()
+
+    def _retirar(self, user_id: int, ticker: str):
+        # Chamado com o lock adquirido
+        atual = self._alvos.pop((user_id, ticker), None)
+        if atual is None:
+            return
+        preco_alvo, sentido = atual
+        lado = self._up if sentido == "UP" else self._down
+        lista = lado[ticker]
+        del lista[bisect_left(lista, (preco_alvo, user_id))]
+        if not lista:
+            del lado[ticker]
+
+    def _inserir(self, user_id: int, ticker: str, preco_alvo: float, sentido: str):
+        # Chamado com o lock adquirido
+        self._retirar(user_id, ticker)
+        lado = self._up if sentido == "UP" else self._down
+        insort(lado.setdefault(ticker, []), (preco_alvo, user_id))
+        self._alvos[(user_id, ticker)] = (preco_alvo, sentido)
+
+    def _registrar(self, operacao, *args):
+        # Chamado com o lock adquirido: aplica e, durante uma recarga, anota no diário
+        operacao(*args)
+        if self._diario is not None:
+            self._diario.append((operacao, args))
+
+    def definir(self, user_id: int, ticker: str, preco_alvo: float, sentido: str):
+        """Registrar (ou substituir) o alerta pendente do usuário para o ticker"""
+        with self._lock:
+            self._registrar(self._inserir, user_id, ticker, preco_alvo, sentido)
+
+    def remover(self, user_id: int, ticker: str, alvo: tuple | None = None):
+        """Tirar do índice o alerta do usuário para o ticker (removido ou já notificado).
+
+        Com ``alvo`` = ``(preco_alvo, sentido)``, só remove se o alerta ainda for
+        esse: um alerta redefinido pela API entre ``cruzados`` e a remoção fica.
+        """
+        with self._lock:
+            if alvo is not None and self._alvos.get((user_id, ticker)) != alvo:
+                return False
+            self._registrar(self._retirar, user_id, ticker)
+            return True
+
+    def tickers(self):
+        """Tickers com pelo menos um alerta pendente"""
+        self._garantir_carregado()
+        with self._lock:
+            return set(self._up) | set(self._down)
+
+    def cruzados(self, ticker: str, preco: float):
+        """Obter ``[(user_id, preco_alvo, sentido)]`` dos alertas que o preço cruzou"""
+        self._garantir_carregado()
+        with self._lock:
+            up = self._up.get(ticker, [])
+            down = self._down.get(ticker, [])
+            # (preço, inf) fica depois de todos os alvos iguais ao preço; (preço, -inf) antes
+            disparados = [(user_id, alvo, "UP") for alvo, user_id in up[:bisect_right(up, (preco, float("inf")))]]
+            disparados += [(user_id, alvo, "DOWN") for alvo, user_id in down[bisect_left(down, (preco, float("-inf"))):]]
+        return disparados
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "alertas": len(self._alvos),
+                "tickers": len(set(self._up) | set(self._down)),
+                "carregado_ha_segundos": time.monotonic() - self._carregado_em if self._carregado_em else None,
+            }
+
+
+# Compartilhado pela API e pelo bot, que rodam no mesmo processo
+indice_alertas = IndiceAlertas()
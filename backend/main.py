@@ -1,28 +1,48 @@
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.responses import HTMLResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, status
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 import sqlite3
 import secrets
 import os
-import yfinance as yf
 import json
 from typing import Optional, List
 from threading import Thread
 
 import bot  # <- importa seu bot.py como módulo
+from cache import cache_cotacoes, cache_usuarios
+from coalescencia import voos_cotacoes
+from cotacoes import obter_preco_atual
+from difusao_cotacoes import HEARTBEAT_SEGUNDOS, difusor_cotacoes, evento_sse
+from metadados import obter_metadados
+from provedores import provedor_atual
+from historico_precos import obter_historico_diario
+from amostragem import PONTOS_MAXIMOS, PONTOS_MINIMOS, lttb_indices
+from executor import executar_bloqueante
+from db import conexao, conexao_leitura, transacao_leitura
+from escritor import escritor_alertas
+from indice_alertas import indice_alertas
+from agenda import minuto_do_dia, roda_horarios
+from resumos import cache_resumos
+from monitor_jobs import monitor_jobs
+import snapshot_cotacoes
+import historico_alertas
+from senhas import PoolSaturado, pool_senhas
+from respostas import AtivosEstaticos, ETagCompressaoMiddleware
 
 dominio = os.environ.get("dominio")
 # Configurações
-DB_PATH = "acoes.db"  # Caminho para o banco do bot
 SECRET_KEY = os.environ.get("DASHBOARD_SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 horas
+# Token do stream de preços: vai na URL (EventSource não envia cabeçalhos), então vale só para conectar
+STREAM_TOKEN_EXPIRE_SECONDS = 60
+ESCOPO_STREAM = "stream_precos"
+# Usuários (user_id do Telegram, separados por vírgula) que podem ler /metrics
+METRICS_ADMIN_IDS = {int(i) for i in os.environ.get("METRICS_ADMIN_IDS", "").split(",") if i.strip()}
 
 app = FastAPI(title="Dashboard de Ações", version="2.0.0")
 
@@ -35,13 +55,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Montar arquivos estáticos do frontend
-app.mount("/static", StaticFiles(directory="../frontend"), name="static")
+# ETag/304 e compressão gzip (ou brotli) das respostas JSON e HTML
+app.add_middleware(ETagCompressaoMiddleware)
 
-# Configuração de segurança
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Montar arquivos estáticos do frontend (JS/CSS pré-comprimidos e versionados)
+ativos_estaticos = AtivosEstaticos(directory="../frontend")
+app.mount("/static", ativos_estaticos, name="static")
+
+# Configuração de segurança (hashing bcrypt no pool de senhas.py)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+@app.exception_handler(PoolSaturado)
+async def pool_saturado_handler(request, exc: PoolSaturado):
+    # Rajada de logins: melhor recusar já do que enfileirar bcrypt sem limite
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 # --- Modelos Pydantic ---
 class User(BaseModel):
     user_id: int
@@ -62,6 +90,9 @@ class DashboardKeyUpdate(BaseModel):
     old_key: str
     new_key: str
 
+class ThemeUpdate(BaseModel):
+    theme: str
+
 # Novos modelos para as funcionalidades
 class AcaoMonitorada(BaseModel):
     ticker: str
@@ -110,6 +141,16 @@ class AlertaHistorico(BaseModel):
     triggered_at: str
     message: str
 
+class PaginaHistoricoAlertas(BaseModel):
+    alertas: List[AlertaHistorico]
+    proximo_cursor: str | None = None
+
+class ResumoDiarioAlertas(BaseModel):
+    dia: str
+    ticker: str
+    alert_type: str
+    quantidade: int
+
 class ConfiguracaoBot(BaseModel):
     resumo_automatico: bool
     horario_resumo: str
@@ -123,38 +164,21 @@ class PortfolioPosition(BaseModel):
     total_value: float | None = None
     profit_loss: float | None = None
 
-# --- Cache simples para dados do yfinance ---
-cache_data = {}
-CACHE_EXPIRE_MINUTES = 5
-
-def get_cached_data(key: str):
-    if key in cache_data:
-        data, timestamp = cache_data[key]
-        if datetime.now() - timestamp < timedelta(minutes=CACHE_EXPIRE_MINUTES):
-            return data
-    return None
-
-def set_cached_data(key: str, data):
-    cache_data[key] = (data, datetime.now())
+class DashboardSnapshot(BaseModel):
+    user: User
+    acoes_detalhadas: List[AcaoMonitorada]
+    portfolio: List[PortfolioPosition]
+    alertas_preco: List[AlertaPreco]
+    alertas_panico: List[AlertaPanico]
+    historico_alertas: PaginaHistoricoAlertas
+    configuracoes_bot: ConfiguracaoBot
 
 # --- Funções de Banco de Dados ---
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 def get_user_from_db(user_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM dashboard_users WHERE user_id = ?", (user_id,))
-    user_data = cursor.fetchone()
-    conn.close()
+    with conexao_leitura() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM dashboard_users WHERE user_id = ?", (user_id,))
+        user_data = cursor.fetchone()
     if user_data:
         return UserInDB(
             user_id=user_data["user_id"],
@@ -164,11 +188,13 @@ def get_user_from_db(user_id: int):
         )
     return None
 
-def authenticate_user(user_id: int, dashboard_key: str):
-    user = get_user_from_db(user_id)
+async def authenticate_user(user_id: int, dashboard_key: str):
+    # No login a chave é conferida contra o banco, nunca contra o cache
+    user = await executar_bloqueante(get_user_from_db, user_id)
     if not user:
         return False
-    if not verify_password(dashboard_key, user.hashed_dashboard_key):
+    cache_usuarios.set(user_id, user)
+    if not await pool_senhas.verificar(dashboard_key, user.hashed_dashboard_key):
         return False
     return user
 
@@ -193,91 +219,100 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         user_id: int = int(payload.get("sub"))
         if user_id is None:
             raise credentials_exception
+        # Tokens com escopo (ex.: stream de preços) não valem como sessão
+        if payload.get("escopo"):
+            raise credentials_exception
         token_data = TokenData(user_id=user_id)
     except JWTError:
         raise credentials_exception
-    user = get_user_from_db(user_id=token_data.user_id)
+    # Sessões ativas são atendidas pelo cache, sem passar pelo executor nem pelo SQLite
+    user = cache_usuarios.get(token_data.user_id)
     if user is None:
-        raise credentials_exception
+        user = await executar_bloqueante(get_user_from_db, token_data.user_id)
+        if user is None:
+            raise credentials_exception
+        cache_usuarios.set(token_data.user_id, user)
     return user
 
-def create_dashboard_user(user_id: int, username: str | None = None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+async def get_admin_user(current_user: UserInDB = Depends(get_current_user)):
+    """Exigir um usuário listado em METRICS_ADMIN_IDS"""
+    if current_user.user_id not in METRICS_ADMIN_IDS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return current_user
 
-    # Verificar se o usuário já existe
-    cursor.execute("SELECT user_id FROM dashboard_users WHERE user_id = ?", (user_id,))
-    if cursor.fetchone():
-        conn.close()
+def update_dashboard_key_db(user_id: int, hashed_dashboard_key: str):
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE dashboard_users SET dashboard_key = ? WHERE user_id = ?",
+            (hashed_dashboard_key, user_id)
+        )
+    cache_usuarios.invalidar(user_id)
+
+def update_theme_db(user_id: int, theme: str):
+    with conexao() as conn:
+        conn.execute("UPDATE dashboard_users SET theme = ? WHERE user_id = ?", (theme, user_id))
+    cache_usuarios.invalidar(user_id)
+
+def insert_dashboard_user(user_id: int, hashed_dashboard_key: str, username: str | None = None):
+    try:
+        with conexao() as conn:
+            conn.execute(
+                "INSERT INTO dashboard_users (user_id, dashboard_key, username, theme) VALUES (?, ?, ?, ?)",
+                (user_id, hashed_dashboard_key, username, "dark")
+            )
+        return True
+    except sqlite3.IntegrityError:
+        return False  # Usuário já existe
+
+async def create_dashboard_user(user_id: int, username: str | None = None):
+    # Verificar se o usuário já existe antes de gastar um hash bcrypt
+    if await executar_bloqueante(get_user_from_db, user_id):
         return None  # Usuário já existe
 
     # Gerar chave segura
     dashboard_key = secrets.token_urlsafe(12)  # 16 caracteres
-    hashed_dashboard_key = get_password_hash(dashboard_key)
+    hashed_dashboard_key = await pool_senhas.gerar_hash(dashboard_key)
 
-    try:
-        cursor.execute(
-            "INSERT INTO dashboard_users (user_id, dashboard_key, username, theme) VALUES (?, ?, ?, ?)",
-            (user_id, hashed_dashboard_key, username, "dark")
-        )
-        conn.commit()
-        return dashboard_key
-    except sqlite3.IntegrityError:
+    if not await executar_bloqueante(insert_dashboard_user, user_id, hashed_dashboard_key, username):
         return None
-    finally:
-        conn.close()
+    return dashboard_key
 
 # --- Funções para dados de ações ---
-def get_stock_data(ticker: str, period: str = "1d"):
-    cache_key = f"{ticker}_{period}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-
+def get_precos_seguros(tickers):
+    """Obter os preços atuais de vários tickers pelo snapshot de cotações, sem propagar erros"""
     try:
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period=period)
-        if hist.empty:
-            return None
-
-        data = {
-            "ticker": ticker,
-            "history": hist.to_dict('records'),
-            "current_price": float(hist["Close"].iloc[-1]),
-            "info": stock.info
-        }
-        set_cached_data(cache_key, data)
-        return data
+        return snapshot_cotacoes.obter_cotacoes(tickers)
     except Exception as e:
-        print(f"Erro ao buscar dados para {ticker}: {e}")
-        return None
+        print(f"Erro ao obter cotações: {e}")
+        return {}
 
 # --- Funções para as novas funcionalidades ---
-def get_acoes_monitoradas_detalhadas(user_id: int):
+def get_acoes_monitoradas(user_id: int):
+    """Obter ações monitoradas com o preço de referência"""
+    with conexao_leitura() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT ticker, preco_referencia FROM acoes_monitoradas WHERE user_id = ?", (user_id,))
+        acoes = cursor.fetchall()
+    return acoes
+
+async def get_acoes_monitoradas_detalhadas(user_id: int):
     """Obter ações monitoradas com preço atual e de referência"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT ticker, preco_referencia FROM acoes_monitoradas WHERE user_id = ?", (user_id,))
-    acoes = cursor.fetchall()
-    conn.close()
+    acoes = await executar_bloqueante(get_acoes_monitoradas, user_id)
+    precos = await executar_bloqueante(get_precos_seguros, [acao["ticker"] for acao in acoes]) if acoes else {}
+    return montar_acoes_detalhadas(acoes, precos)
 
+def montar_acoes_detalhadas(acoes, precos: dict):
+    """Combinar as ações monitoradas com os preços atuais já obtidos"""
     result = []
     for acao in acoes:
         ticker = acao["ticker"]
+        preco_atual = precos.get(ticker)
         preco_referencia = acao["preco_referencia"]
 
-        try:
-            stock = yf.Ticker(ticker)
-            hist = stock.history(period="1d")
-            if not hist.empty:
-                preco_atual = float(hist["Close"].iloc[-1])
-                variacao_percentual = ((preco_atual - preco_referencia) / preco_referencia) * 100
-            else:
-                preco_atual = None
-                variacao_percentual = None
-        except Exception as e:
-            print(f"Erro ao obter dados para {ticker}: {e}")
-            preco_atual = None
+        if preco_atual is not None:
+            variacao_percentual = ((preco_atual - preco_referencia) / preco_referencia) * 100
+        else:
             variacao_percentual = None
 
         result.append(AcaoMonitorada(
@@ -291,25 +326,21 @@ def get_acoes_monitoradas_detalhadas(user_id: int):
 
 def update_acao_monitorada(user_id: int, ticker: str, novo_preco_referencia: float):
     """Atualizar preço de referência de uma ação monitorada"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE acoes_monitoradas SET preco_referencia = ? WHERE user_id = ? AND ticker = ?",
-        (novo_preco_referencia, user_id, ticker)
-    )
-    affected_rows = cursor.rowcount
-    conn.commit()
-    conn.close()
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE acoes_monitoradas SET preco_referencia = ? WHERE user_id = ? AND ticker = ?",
+            (novo_preco_referencia, user_id, ticker)
+        )
+        affected_rows = cursor.rowcount
     return affected_rows > 0
 
 def delete_acao_monitorada(user_id: int, ticker: str):
     """Remover ação monitorada"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM acoes_monitoradas WHERE user_id = ? AND ticker = ?", (user_id, ticker))
-    affected_rows = cursor.rowcount
-    conn.commit()
-    conn.close()
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM acoes_monitoradas WHERE user_id = ? AND ticker = ?", (user_id, ticker))
+        affected_rows = cursor.rowcount
     return affected_rows > 0
 
 def create_acao_monitorada(user_id: int, ticker: str, preco_referencia: Optional[float] = None):
@@ -317,36 +348,28 @@ def create_acao_monitorada(user_id: int, ticker: str, preco_referencia: Optional
     if preco_referencia is None:
         # Obter preço atual como referência
         try:
-            stock = yf.Ticker(ticker)
-            hist = stock.history(period="1d")
-            if not hist.empty:
-                preco_referencia = float(hist["Close"].iloc[-1])
-            else:
+            preco_referencia = obter_preco_atual(ticker)
+            if preco_referencia is None:
                 return False
         except:
             return False
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "INSERT OR REPLACE INTO acoes_monitoradas (user_id, ticker, preco_referencia) VALUES (?, ?, ?)",
-            (user_id, ticker, preco_referencia)
-        )
-        conn.commit()
+        with conexao() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO acoes_monitoradas (user_id, ticker, preco_referencia) VALUES (?, ?, ?)",
+                (user_id, ticker, preco_referencia)
+            )
         return True
     except:
         return False
-    finally:
-        conn.close()
 
 def get_alertas_preco(user_id: int):
     """Obter alertas de preço do usuário"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM alertas_precos WHERE user_id = ?", (user_id,))
-    alertas = cursor.fetchall()
-    conn.close()
+    with conexao_leitura() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM alertas_precos WHERE user_id = ?", (user_id,))
+        alertas = cursor.fetchall()
 
     return [AlertaPreco(
         ticker=alerta["ticker"],
@@ -359,72 +382,63 @@ def update_alerta_preco(user_id: int, ticker: str, novo_preco_alvo: float):
     """Atualizar alerta de preço"""
     # Determinar sentido baseado no preço atual
     try:
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period="1d")
-        if not hist.empty:
-            preco_atual = float(hist["Close"].iloc[-1])
+        preco_atual = obter_preco_atual(ticker)
+        if preco_atual is not None:
             sentido = "UP" if novo_preco_alvo > preco_atual else "DOWN"
         else:
             sentido = "DOWN"  # Default
     except:
         sentido = "DOWN"  # Default
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE alertas_precos SET preco_alvo = ?, sentido = ?, notificado = 0 WHERE user_id = ? AND ticker = ?",
-        (novo_preco_alvo, sentido, user_id, ticker)
-    )
-    affected_rows = cursor.rowcount
-    conn.commit()
-    conn.close()
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE alertas_precos SET preco_alvo = ?, sentido = ?, notificado = 0 WHERE user_id = ? AND ticker = ?",
+            (novo_preco_alvo, sentido, user_id, ticker)
+        )
+        affected_rows = cursor.rowcount
+    if affected_rows > 0:
+        indice_alertas.definir(user_id, ticker, novo_preco_alvo, sentido)
     return affected_rows > 0
 
 def delete_alerta_preco(user_id: int, ticker: str):
     """Remover alerta de preço"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM alertas_precos WHERE user_id = ? AND ticker = ?", (user_id, ticker))
-    affected_rows = cursor.rowcount
-    conn.commit()
-    conn.close()
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM alertas_precos WHERE user_id = ? AND ticker = ?", (user_id, ticker))
+        affected_rows = cursor.rowcount
+    indice_alertas.remover(user_id, ticker)
     return affected_rows > 0
 
 def create_alerta_preco(user_id: int, ticker: str, preco_alvo: float):
     """Criar novo alerta de preço"""
     # Determinar sentido baseado no preço atual
     try:
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period="1d")
-        if not hist.empty:
-            preco_atual = float(hist["Close"].iloc[-1])
+        preco_atual = obter_preco_atual(ticker)
+        if preco_atual is not None:
             sentido = "UP" if preco_alvo > preco_atual else "DOWN"
         else:
             sentido = "DOWN"  # Default
     except:
         sentido = "DOWN"  # Default
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "INSERT OR REPLACE INTO alertas_precos (user_id, ticker, preco_alvo, sentido, notificado) VALUES (?, ?, ?, ?, 0)",
-            (user_id, ticker, preco_alvo, sentido)
-        )
-        conn.commit()
+        with conexao() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO alertas_precos (user_id, ticker, preco_alvo, sentido, notificado) VALUES (?, ?, ?, ?, 0)",
+                (user_id, ticker, preco_alvo, sentido)
+            )
+        indice_alertas.definir(user_id, ticker, preco_alvo, sentido)
         return True
     except:
         return False
-    finally:
-        conn.close()
 
 def get_alertas_panico(user_id: int):
     """Obter alertas de pânico do usuário"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM alertas_panico WHERE user_id = ?", (user_id,))
-    alertas = cursor.fetchall()
-    conn.close()
+    with conexao_leitura() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM alertas_panico WHERE user_id = ?", (user_id,))
+        alertas = cursor.fetchall()
 
     return [AlertaPanico(
         ticker=alerta["ticker"],
@@ -434,70 +448,50 @@ def get_alertas_panico(user_id: int):
 
 def update_alerta_panico(user_id: int, ticker: str, ativo: bool, percentual_queda: float):
     """Atualizar alerta de pânico"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE alertas_panico SET ativo = ?, percentual_queda = ? WHERE user_id = ? AND ticker = ?",
-        (int(ativo), percentual_queda, user_id, ticker)
-    )
-    affected_rows = cursor.rowcount
-    conn.commit()
-    conn.close()
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE alertas_panico SET ativo = ?, percentual_queda = ? WHERE user_id = ? AND ticker = ?",
+            (int(ativo), percentual_queda, user_id, ticker)
+        )
+        affected_rows = cursor.rowcount
     return affected_rows > 0
 
 def delete_alerta_panico(user_id: int, ticker: str):
     """Remover alerta de pânico"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM alertas_panico WHERE user_id = ? AND ticker = ?", (user_id, ticker))
-    affected_rows = cursor.rowcount
-    conn.commit()
-    conn.close()
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM alertas_panico WHERE user_id = ? AND ticker = ?", (user_id, ticker))
+        affected_rows = cursor.rowcount
     return affected_rows > 0
 
 def create_alerta_panico(user_id: int, ticker: str, percentual_queda: float):
     """Criar novo alerta de pânico"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "INSERT OR REPLACE INTO alertas_panico (user_id, ticker, ativo, percentual_queda) VALUES (?, ?, 1, ?)",
-            (user_id, ticker, percentual_queda)
-        )
-        conn.commit()
+        with conexao() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO alertas_panico (user_id, ticker, ativo, percentual_queda) VALUES (?, ?, 1, ?)",
+                (user_id, ticker, percentual_queda)
+            )
         return True
     except:
         return False
-    finally:
-        conn.close()
-
-def get_historico_alertas(user_id: int):
-    """Obter histórico de alertas disparados"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT * FROM alert_history WHERE user_id = ? ORDER BY triggered_at DESC",
-        (user_id,)
-    )
-    alertas = cursor.fetchall()
-    conn.close()
 
-    return [AlertaHistorico(
-        id=alerta["id"],
-        ticker=alerta["ticker"],
-        alert_type=alerta["alert_type"],
-        trigger_value=alerta["trigger_value"],
-        triggered_at=alerta["triggered_at"],
-        message=alerta["message"]
-    ) for alerta in alertas]
+def get_historico_alertas(user_id: int, limite: int, cursor: str | None = None,
+                          ticker: str | None = None, tipo: str | None = None):
+    """Obter uma página do histórico de alertas disparados"""
+    alertas, proximo_cursor = historico_alertas.listar_pagina(user_id, limite, cursor, ticker, tipo)
+    return PaginaHistoricoAlertas(
+        alertas=[AlertaHistorico(**dict(alerta)) for alerta in alertas],
+        proximo_cursor=proximo_cursor
+    )
 
 def get_configuracoes_bot(user_id: int):
     """Obter configurações do bot para o usuário"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM usuarios WHERE user_id = ?", (user_id,))
-    config = cursor.fetchone()
-    conn.close()
+    with conexao_leitura() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM usuarios WHERE user_id = ?", (user_id,))
+        config = cursor.fetchone()
 
     if config:
         return ConfiguracaoBot(
@@ -507,11 +501,9 @@ def get_configuracoes_bot(user_id: int):
         )
     else:
         # Criar configuração padrão se não existir
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR IGNORE INTO usuarios (user_id) VALUES (?)", (user_id,))
-        conn.commit()
-        conn.close()
+        with conexao() as conn:
+            conn.execute("INSERT OR IGNORE INTO usuarios (user_id) VALUES (?)", (user_id,))
+        roda_horarios.atualizar_usuario(user_id)
         return ConfiguracaoBot(
             resumo_automatico=True,
             horario_resumo="18:00",
@@ -520,22 +512,19 @@ def get_configuracoes_bot(user_id: int):
 
 def update_configuracoes_bot(user_id: int, config: ConfiguracaoBot):
     """Atualizar configurações do bot"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE usuarios SET resumo_automatico = ?, horario_resumo = ?, horario_panico = ? WHERE user_id = ?",
-        (int(config.resumo_automatico), config.horario_resumo, config.horario_panico, user_id)
-    )
-    affected_rows = cursor.rowcount
-    conn.commit()
-    conn.close()
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE usuarios SET resumo_automatico = ?, horario_resumo = ?, horario_panico = ? WHERE user_id = ?",
+            (int(config.resumo_automatico), config.horario_resumo, config.horario_panico, user_id)
+        )
+        affected_rows = cursor.rowcount
+    roda_horarios.atualizar_usuario(user_id)
     return affected_rows > 0
 
-def get_dados_historicos(ticker: str, periodo: str = "1d"):
-    """Obter dados históricos de uma ação"""
+def get_dados_historicos(ticker: str, periodo: str = "1d", max_points: int | None = None):
+    """Obter dados históricos de uma ação, opcionalmente reduzidos a max_points"""
     try:
-        stock = yf.Ticker(ticker)
-
         # Mapear períodos para yfinance
         period_map = {
             "1d": "1d",
@@ -547,19 +536,25 @@ def get_dados_historicos(ticker: str, periodo: str = "1d"):
         }
 
         yf_period = period_map.get(periodo, "1d")
-        hist = stock.history(period=yf_period)
+        hist = obter_historico_diario(ticker, yf_period)
 
+        hist = hist[hist["Close"].notna()]
         if hist.empty:
             return []
 
-        dados = []
-        for date, row in hist.iterrows():
-            dados.append({
-                "date": date.strftime("%Y-%m-%d"),
-                "price": float(row["Close"])
-            })
+        # Conversão colunar: datas e preços como arrays, sem iterar linha a linha
+        datas = hist.index.strftime("%Y-%m-%d")
+        precos = hist["Close"].to_numpy(dtype=float)
+
+        if max_points and len(precos) > max_points:
+            indices = lttb_indices(precos, max_points)
+            datas = datas[indices]
+            precos = precos[indices]
 
-        return dados
+        return [
+            {"date": date, "price": price}
+            for date, price in zip(datas.tolist(), precos.tolist())
+        ]
     except Exception as e:
         print(f"Erro ao obter dados históricos para {ticker}: {e}")
         return []
@@ -577,7 +572,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = authenticate_user(user_id, form_data.password)
+    user = await authenticate_user(user_id, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -591,12 +586,21 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 # --- Endpoints do Dashboard ---
+_template_dashboard = None
+
+def ler_template_dashboard():
+    """Ler o HTML do dashboard uma única vez, já apontando para os ativos versionados"""
+    global _template_dashboard
+    if _template_dashboard is None:
+        with open("../frontend/index.html", "r", encoding="utf-8") as f:
+            _template_dashboard = ativos_estaticos.reescrever_urls(f.read())
+    return _template_dashboard
+
 @app.get("/dashboard/{user_id}", response_class=HTMLResponse)
 async def get_dashboard_page(user_id: int):
     # Servir o arquivo HTML principal do dashboard
     try:
-        with open("../frontend/index.html", "r", encoding="utf-8") as f:
-            html_content = f.read()
+        html_content = _template_dashboard or await executar_bloqueante(ler_template_dashboard)
         # Substituir placeholder do user_id no HTML
         html_content = html_content.replace("{{user_id}}", str(user_id))
         return HTMLResponse(content=html_content)
@@ -631,27 +635,30 @@ async def update_dashboard_key(
     current_user: UserInDB = Depends(get_current_user)
 ):
     # Verificar se a chave antiga está correta
-    if not verify_password(key_update.old_key, current_user.hashed_dashboard_key):
+    if not await pool_senhas.verificar(key_update.old_key, current_user.hashed_dashboard_key):
         raise HTTPException(status_code=400, detail="Chave atual incorreta")
 
     # Atualizar com a nova chave
-    new_hashed_key = get_password_hash(key_update.new_key)
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE dashboard_users SET dashboard_key = ? WHERE user_id = ?",
-        (new_hashed_key, current_user.user_id)
-    )
-    conn.commit()
-    conn.close()
+    new_hashed_key = await pool_senhas.gerar_hash(key_update.new_key)
+    await executar_bloqueante(update_dashboard_key_db, current_user.user_id, new_hashed_key)
 
     return {"message": "Chave atualizada com sucesso"}
 
+@app.put("/api/user/theme")
+async def update_theme(
+    theme_update: ThemeUpdate,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if theme_update.theme not in ("dark", "light"):
+        raise HTTPException(status_code=400, detail="Tema inválido")
+    await executar_bloqueante(update_theme_db, current_user.user_id, theme_update.theme)
+    return {"message": "Tema atualizado com sucesso"}
+
 # --- Endpoints para Ações Monitoradas ---
 @app.get("/api/acoes/detalhadas", response_model=List[AcaoMonitorada])
 async def get_acoes_detalhadas(current_user: UserInDB = Depends(get_current_user)):
     """Obter ações monitoradas com preço atual e de referência"""
-    return get_acoes_monitoradas_detalhadas(current_user.user_id)
+    return await get_acoes_monitoradas_detalhadas(current_user.user_id)
 
 @app.put("/api/acoes/{ticker}")
 async def update_acao(
@@ -660,7 +667,7 @@ async def update_acao(
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Editar preço de referência de uma ação monitorada"""
-    success = update_acao_monitorada(current_user.user_id, ticker.upper(), acao_update.preco_referencia)
+    success = await executar_bloqueante(update_acao_monitorada, current_user.user_id, ticker.upper(), acao_update.preco_referencia)
     if not success:
         raise HTTPException(status_code=404, detail="Ação não encontrada")
     return {"message": "Ação atualizada com sucesso"}
@@ -671,7 +678,7 @@ async def delete_acao(
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Remover ação monitorada"""
-    success = delete_acao_monitorada(current_user.user_id, ticker.upper())
+    success = await executar_bloqueante(delete_acao_monitorada, current_user.user_id, ticker.upper())
     if not success:
         raise HTTPException(status_code=404, detail="Ação não encontrada")
     return {"message": "Ação removida com sucesso"}
@@ -682,7 +689,8 @@ async def create_acao(
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Adicionar nova ação monitorada"""
-    success = create_acao_monitorada(
+    success = await executar_bloqueante(
+        create_acao_monitorada,
         current_user.user_id,
         acao_create.ticker.upper(),
         acao_create.preco_referencia
@@ -691,11 +699,24 @@ async def create_acao(
         raise HTTPException(status_code=400, detail="Erro ao adicionar ação")
     return {"message": "Ação adicionada com sucesso"}
 
+@app.get("/api/acoes/{ticker}/metadados")
+async def get_metadados_acao(
+    ticker: str,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Obter dados cadastrais da empresa (carregados sob demanda)"""
+    try:
+        info = await executar_bloqueante(obter_metadados, ticker.upper())
+    except Exception as e:
+        print(f"Erro ao obter metadados para {ticker}: {e}")
+        raise HTTPException(status_code=502, detail="Erro ao obter dados da empresa")
+    return {"ticker": ticker.upper(), "info": info}
+
 # --- Endpoints para Alertas de Preço ---
 @app.get("/api/alertas/preco", response_model=List[AlertaPreco])
 async def get_alertas_preco_endpoint(current_user: UserInDB = Depends(get_current_user)):
     """Obter alertas de preço do usuário"""
-    return get_alertas_preco(current_user.user_id)
+    return await executar_bloqueante(get_alertas_preco, current_user.user_id)
 
 @app.put("/api/alertas/preco/{ticker}")
 async def update_alerta_preco_endpoint(
@@ -704,7 +725,7 @@ async def update_alerta_preco_endpoint(
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Editar alerta de preço"""
-    success = update_alerta_preco(current_user.user_id, ticker.upper(), alerta_update.preco_alvo)
+    success = await executar_bloqueante(update_alerta_preco, current_user.user_id, ticker.upper(), alerta_update.preco_alvo)
     if not success:
         raise HTTPException(status_code=404, detail="Alerta não encontrado")
     return {"message": "Alerta atualizado com sucesso"}
@@ -715,7 +736,7 @@ async def delete_alerta_preco_endpoint(
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Remover alerta de preço"""
-    success = delete_alerta_preco(current_user.user_id, ticker.upper())
+    success = await executar_bloqueante(delete_alerta_preco, current_user.user_id, ticker.upper())
     if not success:
         raise HTTPException(status_code=404, detail="Alerta não encontrado")
     return {"message": "Alerta removido com sucesso"}
@@ -726,7 +747,8 @@ async def create_alerta_preco_endpoint(
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Criar novo alerta de preço"""
-    success = create_alerta_preco(
+    success = await executar_bloqueante(
+        create_alerta_preco,
         current_user.user_id,
         alerta_create.ticker.upper(),
         alerta_create.preco_alvo
@@ -739,7 +761,7 @@ async def create_alerta_preco_endpoint(
 @app.get("/api/alertas/panico", response_model=List[AlertaPanico])
 async def get_alertas_panico_endpoint(current_user: UserInDB = Depends(get_current_user)):
     """Obter alertas de pânico do usuário"""
-    return get_alertas_panico(current_user.user_id)
+    return await executar_bloqueante(get_alertas_panico, current_user.user_id)
 
 @app.put("/api/alertas/panico/{ticker}")
 async def update_alerta_panico_endpoint(
@@ -748,7 +770,8 @@ async def update_alerta_panico_endpoint(
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Editar alerta de pânico"""
-    success = update_alerta_panico(
+    success = await executar_bloqueante(
+        update_alerta_panico,
         current_user.user_id,
         ticker.upper(),
         alerta_update.ativo,
@@ -764,7 +787,7 @@ async def delete_alerta_panico_endpoint(
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Remover alerta de pânico"""
-    success = delete_alerta_panico(current_user.user_id, ticker.upper())
+    success = await executar_bloqueante(delete_alerta_panico, current_user.user_id, ticker.upper())
     if not success:
         raise HTTPException(status_code=404, detail="Alerta não encontrado")
     return {"message": "Alerta removido com sucesso"}
@@ -775,7 +798,8 @@ async def create_alerta_panico_endpoint(
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Criar novo alerta de pânico"""
-    success = create_alerta_panico(
+    success = await executar_bloqueante(
+        create_alerta_panico,
         current_user.user_id,
         alerta_create.ticker.upper(),
         alerta_create.percentual_queda
@@ -785,16 +809,41 @@ async def create_alerta_panico_endpoint(
     return {"message": "Alerta criado com sucesso"}
 
 # --- Endpoint para Histórico de Alertas ---
-@app.get("/api/alertas/historico", response_model=List[AlertaHistorico])
-async def get_historico_alertas_endpoint(current_user: UserInDB = Depends(get_current_user)):
-    """Obter histórico de alertas disparados"""
-    return get_historico_alertas(current_user.user_id)
+@app.get("/api/alertas/historico", response_model=PaginaHistoricoAlertas)
+async def get_historico_alertas_endpoint(
+    limite: int = Query(historico_alertas.LIMITE_PADRAO, ge=1, le=historico_alertas.LIMITE_MAXIMO),
+    cursor: str | None = None,
+    ticker: str | None = None,
+    tipo: str | None = Query(None, regex="^(price|panic)$"),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Obter histórico de alertas disparados, paginado pelo cursor da página anterior"""
+    try:
+        return await executar_bloqueante(
+            get_historico_alertas,
+            current_user.user_id,
+            limite,
+            cursor,
+            ticker.upper() if ticker else None,
+            tipo
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/alertas/historico/diario", response_model=List[ResumoDiarioAlertas])
+async def get_resumo_diario_alertas_endpoint(
+    dias: int = Query(365, ge=1, le=3650),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Obter contagens diárias dos alertas já consolidados pela retenção"""
+    resumo = await executar_bloqueante(historico_alertas.resumo_diario, current_user.user_id, dias)
+    return [ResumoDiarioAlertas(**dict(linha)) for linha in resumo]
 
 # --- Endpoints para Configurações do Bot ---
 @app.get("/api/configuracoes/bot", response_model=ConfiguracaoBot)
 async def get_configuracoes_bot_endpoint(current_user: UserInDB = Depends(get_current_user)):
     """Obter configurações do bot"""
-    return get_configuracoes_bot(current_user.user_id)
+    return await executar_bloqueante(get_configuracoes_bot, current_user.user_id)
 
 @app.put("/api/configuracoes/bot")
 async def update_configuracoes_bot_endpoint(
@@ -802,7 +851,16 @@ async def update_configuracoes_bot_endpoint(
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Atualizar configurações do bot"""
-    success = update_configuracoes_bot(current_user.user_id, config)
+    # Mesmo formato aceito por /horario no bot; horários fora de 00:00-23:59 não são gravados
+    for campo in ("horario_resumo", "horario_panico"):
+        try:
+            minuto_do_dia(getattr(config, campo))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"{campo} inválido: use HH:MM entre 00:00 e 23:59"
+            )
+    success = await executar_bloqueante(update_configuracoes_bot, current_user.user_id, config)
     if not success:
         raise HTTPException(status_code=400, detail="Erro ao atualizar configurações")
     return {"message": "Configurações atualizadas com sucesso"}
@@ -812,10 +870,11 @@ async def update_configuracoes_bot_endpoint(
 async def get_historico_acao(
     ticker: str,
     periodo: str = "1d",
+    max_points: int | None = Query(None, ge=PONTOS_MINIMOS, le=PONTOS_MAXIMOS),
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Obter dados históricos de uma ação"""
-    dados = get_dados_historicos(ticker.upper(), periodo)
+    dados = await executar_bloqueante(get_dados_historicos, ticker.upper(), periodo, max_points)
     return {
         "ticker": ticker.upper(),
         "periodo": periodo,
@@ -823,27 +882,34 @@ async def get_historico_acao(
     }
 
 # --- Endpoint para Portfólio ---
-@app.get("/api/portfolio", response_model=List[PortfolioPosition])
-async def get_user_portfolio(current_user: UserInDB = Depends(get_current_user)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT ticker, quantity, avg_price FROM portfolio_positions WHERE user_id = ?",
-        (current_user.user_id,)
-    )
-    positions_db = cursor.fetchall()
-    conn.close()
+def get_portfolio_positions(user_id: int):
+    with conexao_leitura() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT ticker, quantity, avg_price FROM portfolio_positions WHERE user_id = ?",
+            (user_id,)
+        )
+        positions_db = cursor.fetchall()
+    return positions_db
+
+def save_portfolio_position(user_id: int, position: PortfolioPosition):
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO portfolio_positions (user_id, ticker, quantity, avg_price) VALUES (?, ?, ?, ?)",
+            (user_id, position.ticker, position.quantity, position.avg_price)
+        )
 
+def montar_portfolio(positions_db, precos: dict):
+    """Calcular valor e resultado das posições com os preços atuais já obtidos"""
     portfolio = []
     for pos in positions_db:
         ticker = pos["ticker"]
+        current_price = precos.get(ticker)
         quantity = pos["quantity"]
         avg_price = pos["avg_price"]
 
-        # Buscar preço atual
-        stock_data = get_stock_data(ticker)
-        if stock_data:
-            current_price = stock_data["current_price"]
+        if current_price is not None:
             total_value = quantity * current_price
             profit_loss = (current_price - avg_price) * quantity
 
@@ -858,29 +924,118 @@ async def get_user_portfolio(current_user: UserInDB = Depends(get_current_user))
 
     return portfolio
 
+@app.get("/api/portfolio", response_model=List[PortfolioPosition])
+async def get_user_portfolio(current_user: UserInDB = Depends(get_current_user)):
+    positions_db = await executar_bloqueante(get_portfolio_positions, current_user.user_id)
+
+    # Preços do snapshot de cotações (só o preço; metadados ficam fora do caminho quente)
+    tickers = [pos["ticker"] for pos in positions_db]
+    precos = await executar_bloqueante(get_precos_seguros, tickers) if tickers else {}
+    return montar_portfolio(positions_db, precos)
+
 @app.post("/api/portfolio/add")
 async def add_portfolio_position(
     position: PortfolioPosition,
     current_user: UserInDB = Depends(get_current_user)
 ):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR REPLACE INTO portfolio_positions (user_id, ticker, quantity, avg_price) VALUES (?, ?, ?, ?)",
-        (current_user.user_id, position.ticker, position.quantity, position.avg_price)
-    )
-    conn.commit()
-    conn.close()
+    await executar_bloqueante(save_portfolio_position, current_user.user_id, position)
 
     return {"message": f"Posição {position.ticker} adicionada/atualizada com sucesso"}
 
+# --- Snapshot agregado do dashboard ---
+def get_dados_snapshot(user_id: int):
+    """Ler de uma vez, em uma única transação de leitura, tudo o que o dashboard usa do banco"""
+    with transacao_leitura():
+        return {
+            "acoes": get_acoes_monitoradas(user_id),
+            "portfolio": get_portfolio_positions(user_id),
+            "alertas_preco": get_alertas_preco(user_id),
+            "alertas_panico": get_alertas_panico(user_id),
+            "historico_alertas": get_historico_alertas(user_id, historico_alertas.LIMITE_PADRAO),
+            "configuracoes_bot": get_configuracoes_bot(user_id),
+        }
+
+@app.get("/api/dashboard/snapshot", response_model=DashboardSnapshot)
+async def get_dashboard_snapshot(current_user: UserInDB = Depends(get_current_user)):
+    """Obter em uma única requisição todos os dados da carga inicial do dashboard"""
+    dados = await executar_bloqueante(get_dados_snapshot, current_user.user_id)
+
+    # Uma única leitura de cotações para a união dos tickers das ações e do portfólio
+    tickers = {acao["ticker"] for acao in dados["acoes"]} | {pos["ticker"] for pos in dados["portfolio"]}
+    precos = await executar_bloqueante(get_precos_seguros, tickers) if tickers else {}
+
+    return DashboardSnapshot(
+        user=User(user_id=current_user.user_id, username=current_user.username, theme=current_user.theme),
+        acoes_detalhadas=montar_acoes_detalhadas(dados["acoes"], precos),
+        portfolio=montar_portfolio(dados["portfolio"], precos),
+        alertas_preco=dados["alertas_preco"],
+        alertas_panico=dados["alertas_panico"],
+        historico_alertas=dados["historico_alertas"],
+        configuracoes_bot=dados["configuracoes_bot"]
+    )
+
+# --- Stream de preços (Server-Sent Events) ---
+def get_tickers_usuario(user_id: int):
+    """Obter os tickers monitorados e do portfólio do usuário"""
+    with conexao_leitura() as conn:
+        rows = conn.execute("""
+            SELECT ticker FROM acoes_monitoradas WHERE user_id = ?
+            UNION
+            SELECT ticker FROM portfolio_positions WHERE user_id = ?
+        """, (user_id, user_id)).fetchall()
+    return [row["ticker"] for row in rows]
+
+@app.post("/api/precos/stream/token")
+async def criar_token_stream(current_user: UserInDB = Depends(get_current_user)):
+    """Emitir um token de curta duração, válido apenas para abrir o stream de preços"""
+    token = create_access_token(
+        {"sub": str(current_user.user_id), "escopo": ESCOPO_STREAM},
+        expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    )
+    return {"token": token, "expires_in": STREAM_TOKEN_EXPIRE_SECONDS}
+
+@app.get("/api/precos/stream")
+async def stream_precos(request: Request, token: str):
+    """Enviar atualizações de preço dos tickers do usuário conforme o poller compartilhado as obtém.
+
+    EventSource não envia cabeçalhos, por isso o token vem na query string: é o
+    token de curta duração de /api/precos/stream/token, nunca o token de sessão.
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        if payload.get("escopo") != ESCOPO_STREAM:
+            raise JWTError("escopo inválido")
+        user_id = int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    tickers = await executar_bloqueante(get_tickers_usuario, user_id)
+    assinatura = difusor_cotacoes.assinar(tickers)
+
+    async def eventos():
+        try:
+            yield evento_sse("tickers", json.dumps(sorted(assinatura.tickers)))
+            while not await request.is_disconnected():
+                precos = await assinatura.proximos(HEARTBEAT_SEGUNDOS)
+                if precos:
+                    yield evento_sse("precos", json.dumps(precos))
+                else:
+                    yield ": ping\n\n"
+        finally:
+            difusor_cotacoes.cancelar(assinatura)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # --- Endpoint para o bot gerar a chave e o link ---
 @app.get("/generate_dashboard_link/{user_id}")
 async def generate_dashboard_link(user_id: int, username: str = None):
-    dashboard_key = create_dashboard_user(user_id, username)
+    dashboard_key = await create_dashboard_user(user_id, username)
     if not dashboard_key:
         # Usuário já existe, buscar dados existentes
-        user = get_user_from_db(user_id)
+        user = await executar_bloqueante(get_user_from_db, user_id)
         if user:
             return {
                 "message": "Usuário já possui acesso ao dashboard",
@@ -912,6 +1067,33 @@ def on_startup():
 async def health_check():
     return {"status": "ok", "timestamp": datetime.now().isoformat()}
 
+# --- Endpoint de métricas ---
+@app.get("/metrics")
+async def metrics(admin: UserInDB = Depends(get_admin_user)):
+    return {
+        "cache_cotacoes": cache_cotacoes.estatisticas(),
+        "cache_usuarios": cache_usuarios.estatisticas(),
+        "pool_senhas": pool_senhas.estatisticas(),
+        "coalescencia": voos_cotacoes.estatisticas(),
+        "stream_precos": difusor_cotacoes.estatisticas(),
+        "quote_snapshot": await executar_bloqueante(snapshot_cotacoes.estatisticas),
+        "escritor_alertas": escritor_alertas.estatisticas(),
+        "fila_notificacoes": bot.fila_notificacoes.estatisticas(),
+        "indice_alertas": indice_alertas.estatisticas(),
+        "agenda": roda_horarios.estatisticas(),
+        "resumos": cache_resumos.estatisticas(),
+        "provedor": provedor_atual().estatisticas(),
+    }
+
+# --- Endpoint de monitoramento dos jobs do bot ---
+@app.get("/metrics/jobs")
+async def metrics_jobs(
+    recentes: int = Query(10, ge=0, le=100),
+    admin: UserInDB = Depends(get_admin_user)
+):
+    """Duração, tickers, chamadas ao provedor, erros e execuções recentes de cada job agendado"""
+    return monitor_jobs.estatisticas(recentes)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+import time
+from threading import Lock
+
+from cache import cache_cotacoes
+from coalescencia import voos_cotacoes
+from db import conexao, conexao_leitura
+from executor import executor_io
+from provedores import provedor_atual
+
+logger = logging.getLogger(__name__)
+
+# Dados cadastrais mudam raramente: validade medida em dias
+METADADOS_TTL_DIAS = float(os.environ.get("METADADOS_TTL_DIAS", "7"))
+# Tempo em memória antes de reler o SQLite
+TTL_MEMORIA = 3600
+
+_atualizando = set()
+_atualizando_lock = Lock()
+
+
+def _ler(ticker: str):
+    with conexao_leitura() as conn:
+        return conn.execute(
+            "SELECT info, atualizado_em FROM metadados_empresas WHERE ticker = ?", (ticker,)
+        ).fetchone()
+
+
+def _buscar_e_gravar(ticker: str):
+    """Buscar os metadados no provedor e persistir o resultado"""
+    info = provedor_atual().metadados(ticker)
+    with conexao() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO metadados_empresas (ticker, info, atualizado_em) VALUES (?, ?, ?)",
+            (ticker, json.dumps(info, default=str), time.time())
+        )
+    cache_cotacoes.set(("info", ticker), info, ttl=TTL_MEMORIA)
+    return info
+
+
+def _atualizar_em_segundo_plano(ticker: str):
+    with _atualizando_lock:
+        if ticker in _atualizando:
+            return
+        _atualizando.add(ticker)
+
+    def _atualizar():
+        try:
+            voos_cotacoes.executar(("info", ticker), lambda: _buscar_e_gravar(ticker))
+        except Exception as e:
+            logger.warning(f"Erro ao atualizar metadados de {ticker}: {e}")
+        finally:
+            with _atualizando_lock:
+                _atualizando.discard(ticker)
+
+    executor_io.submit(_atualizar)
+
+
+def obter_metadados(ticker: str):
+    """Obter os dados cadastrais de um ticker (stock.info).
+
+    Carregados sob demanda e persistidos no SQLite; se estiverem vencidos, a versão
+    gravada é devolvida na hora e a atualização acontece em segundo plano.
+    """
+    info = cache_cotacoes.get(("info", ticker))
+    if info is not None:
+        return info
+
+    row = _ler(ticker)
+    if row is None:
+        return voos_cotacoes.executar(("info", ticker), lambda: _buscar_e_gravar(ticker))
+
+    info_json, atualizado_em = row
+    info = json.loads(info_json)
+    if time.time() - atualizado_em > METADADOS_TTL_DIAS * 86400:
+        _atualizar_em_segundo_plano(ticker)
+    cache_cotacoes.set(("info", ticker), info, ttl=TTL_MEMORIA)
+    return info
@@ -0,0 +1,289 @@
+"""Migrações versionadas do banco SQLite.
+
+A versão do esquema fica em ``PRAGMA user_version``. Cada migração roda uma única
+vez, dentro de uma transação, e bancos existentes são atualizados no lugar. Para
+alterar o esquema, acrescente uma nova entrada ao fim de ``MIGRACOES`` (nunca
+edite uma migração já publicada).
+
+Uso:
+    python migracoes.py            # aplica as migrações e confere os planos das consultas críticas
+"""
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# (versão, descrição, comandos)
+MIGRACOES = [
+    (1, "estrutura inicial", [
+        # Tabelas originais do bot
+        """
+        CREATE TABLE IF NOT EXISTS acoes_monitoradas (
+            user_id INTEGER,
+            ticker TEXT,
+            preco_referencia REAL,
+            PRIMARY KEY (user_id, ticker)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            user_id INTEGER PRIMARY KEY,
+            resumo_automatico INTEGER DEFAULT 1,
+            horario_resumo TEXT DEFAULT '18:00',
+            horario_panico TEXT DEFAULT '18:00'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS alertas_precos (
+            user_id INTEGER,
+            ticker TEXT,
+            preco_alvo REAL,
+            sentido TEXT DEFAULT 'DOWN',
+            notificado INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, ticker)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS alertas_panico (
+            user_id INTEGER,
+            ticker TEXT,
+            ativo INTEGER DEFAULT 1,
+            percentual_queda REAL DEFAULT 5.0,
+            PRIMARY KEY (user_id, ticker)
+        )
+        """,
+        # Tabelas do dashboard
+        """
+        CREATE TABLE IF NOT EXISTS dashboard_users (
+            user_id INTEGER PRIMARY KEY,
+            dashboard_key TEXT UNIQUE NOT NULL,
+            username TEXT,
+            theme TEXT DEFAULT 'dark',
+            last_login TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS portfolio_positions (
+            user_id INTEGER,
+            ticker TEXT,
+            quantity REAL,
+            avg_price REAL,
+            PRIMARY KEY (user_id, ticker)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS alert_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            ticker TEXT,
+            alert_type TEXT, -- 'price' or 'panic'
+            trigger_value REAL,
+            triggered_at TEXT,
+            message TEXT
+        )
+        """,
+        # Armazenamento local de pregões diários (OHLCV)
+        """
+        CREATE TABLE IF NOT EXISTS historico_precos (
+            ticker TEXT,
+            data TEXT,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume REAL,
+            PRIMARY KEY (ticker, data)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS historico_cobertura (
+            ticker TEXT PRIMARY KEY,
+            inicio TEXT,
+            completo INTEGER DEFAULT 0,
+            atualizado_em REAL
+        )
+        """,
+        # Dados cadastrais das empresas (stock.info), com validade em dias
+        """
+        CREATE TABLE IF NOT EXISTS metadados_empresas (
+            ticker TEXT PRIMARY KEY,
+            info TEXT,
+            atualizado_em REAL
+        )
+        """,
+    ]),
+    (2, "índices das consultas dos jobs e do histórico de alertas", [
+        # Só os alertas pendentes entram no índice, que cobre a consulta inteira
+        """
+        CREATE INDEX IF NOT EXISTS idx_alertas_precos_pendentes
+        ON alertas_precos (ticker, user_id, preco_alvo, sentido)
+        WHERE notificado = 0
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_usuarios_horario_resumo
+        ON usuarios (horario_resumo)
+        WHERE resumo_automatico = 1
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_usuarios_horario_panico ON usuarios (horario_panico)",
+        """
+        CREATE INDEX IF NOT EXISTS idx_alert_history_usuario
+        ON alert_history (user_id, triggered_at, id)
+        """,
+    ]),
+    (3, "contagens diárias dos alertas antigos", [
+        """
+        CREATE TABLE IF NOT EXISTS alert_history_diario (
+            user_id INTEGER,
+            ticker TEXT,
+            alert_type TEXT,
+            dia TEXT,
+            quantidade INTEGER,
+            PRIMARY KEY (user_id, ticker, alert_type, dia)
+        ) WITHOUT ROWID
+        """,
+        # A consolidação filtra só por data
+        "CREATE INDEX IF NOT EXISTS idx_alert_history_data ON alert_history (triggered_at)",
+    ]),
+    (4, "snapshot de cotações compartilhado entre bot e API", [
+        # Renovado pelo poller do bot; fetched_at em segundos desde a época
+        """
+        CREATE TABLE IF NOT EXISTS quote_snapshot (
+            ticker TEXT PRIMARY KEY,
+            price REAL,
+            prev_close REAL,
+            day_change REAL,
+            fetched_at REAL
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (5, "agenda por minuto em memória", [
+        # Último minuto processado pela agenda, para recuperar minutos perdidos após um reinício
+        """
+        CREATE TABLE IF NOT EXISTS agenda_execucoes (
+            nome TEXT PRIMARY KEY,
+            ultimo_minuto TEXT
+        )
+        """,
+        # Os usuários devidos em cada minuto agora vêm da roda de horários (agenda.py)
+        "DROP INDEX IF EXISTS idx_usuarios_horario_resumo",
+        "DROP INDEX IF EXISTS idx_usuarios_horario_panico",
+    ]),
+    (6, "fila persistente de notificações do Telegram", [
+        # Uma linha por mensagem ainda não entregue; removida após o envio
+        """
+        CREATE TABLE IF NOT EXISTS fila_notificacoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            texto TEXT NOT NULL,
+            parse_mode TEXT,
+            tentativas INTEGER DEFAULT 0,
+            criado_em REAL
+        )
+        """,
+    ]),
+]
+
+VERSAO_ATUAL = MIGRACOES[-1][0]
+
+# Consultas executadas a cada ciclo dos jobs ou a cada carga do dashboard.
+# Nenhuma delas pode cair em varredura completa de tabela.
+CONSULTAS_CRITICAS = {
+    "alertas de preço pendentes": (
+        "SELECT user_id, ticker, preco_alvo, sentido FROM alertas_precos WHERE notificado = 0",
+        (),
+    ),
+    "alertas de pânico dos usuários devidos": (
+        "SELECT user_id, ticker, percentual_queda FROM alertas_panico WHERE ativo=1 AND user_id IN (?, ?)",
+        (1, 2),
+    ),
+    "histórico de alertas do usuário": (
+        """
+        SELECT id, ticker, alert_type, trigger_value, triggered_at, message FROM alert_history
+        WHERE user_id = ? AND (triggered_at, id) < (?, ?)
+        ORDER BY triggered_at DESC, id DESC
+        LIMIT ?
+        """,
+        (1, "9999", 0, 50),
+    ),
+    "cotações do snapshot": (
+        "SELECT ticker, price, prev_close, day_change, fetched_at FROM quote_snapshot WHERE ticker IN (?, ?) AND fetched_at >= ?",
+        ("PETR4.SA", "VALE3.SA", 0),
+    ),
+    "ações monitoradas do usuário": (
+        "SELECT ticker, preco_referencia FROM acoes_monitoradas WHERE user_id = ?",
+        (1,),
+    ),
+}
+
+
+# Índices parciais cuja varredura completa é aceitável: só contêm as linhas pedidas
+INDICES_PARCIAIS_PERMITIDOS = {"idx_alertas_precos_pendentes"}
+
+
+def versao_do_banco(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def aplicar_migracoes(conn):
+    """Aplicar as migrações pendentes, uma transação por versão"""
+    for versao, descricao, comandos in MIGRACOES:
+        if versao <= versao_do_banco(conn):
+            continue
+
+        # BEGIN IMMEDIATE trava a escrita: outro processo não aplica a mesma versão
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if versao <= versao_do_banco(conn):
+                conn.rollback()
+                continue
+            for comando in comandos:
+                conn.execute(comando)
+            conn.execute(f"PRAGMA user_version = {versao}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"Migração {versao} aplicada: {descricao}")
+
+
+def varreduras_completas(conn):
+    """Consultas críticas cujo plano faz varredura completa de alguma tabela.
+
+    Retorna ``{nome: [linhas do plano]}``; vazio quando todas usam busca por índice.
+    Todo ``SCAN`` conta, inclusive ``USING (COVERING) INDEX`` (percorrer um índice
+    inteiro continua O(n)), exceto sobre os índices parciais permitidos.
+    """
+    problemas = {}
+    for nome, (consulta, params) in CONSULTAS_CRITICAS.items():
+        plano = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {consulta}", params)]
+        varreduras = [
+            linha for linha in plano
+            if linha.startswith("SCAN") and linha.split(" INDEX ")[-1].split(" ")[0] not in INDICES_PARCIAIS_PERMITIDOS
+        ]
+        if varreduras:
+            problemas[nome] = plano
+    return problemas
+
+
+def verificar_planos(conn):
+    """Falhar se alguma consulta crítica fizer varredura completa"""
+    problemas = varreduras_completas(conn)
+    if problemas:
+        detalhes = "; ".join(f"{nome}: {plano}" for nome, plano in problemas.items())
+        raise RuntimeError(f"Consultas críticas com varredura completa: {detalhes}")
+
+
+if __name__ == "__main__":
+    from db import conexao
+
+    logging.basicConfig(level=logging.INFO)
+    with conexao() as conn:
+        aplicar_migracoes(conn)
+        problemas = varreduras_completas(conn)
+        print(f"Esquema na versão {versao_do_banco(conn)}")
+
+    for nome, plano in problemas.items():
+        print(f"Varredura completa em '{nome}':")
+        for linha in plano:
+            print(f"    {linha}")
+    sys.exit(1 if problemas else 0)
@@ -0,0 +1,138 @@
+import functools
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from threading import Lock, local
+
+import numpy as np
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+
+from provedores import provedor_atual
+
+logger = logging.getLogger(__name__)
+
+# Execuções recentes guardadas por job
+HISTORICO_EXECUCOES = int(os.environ.get("JOBS_HISTORICO_EXECUCOES", "50"))
+
+# Eventos do APScheduler contados como execuções ignoradas
+EVENTOS_IGNORADOS = EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED
+MOTIVOS = {EVENT_JOB_MAX_INSTANCES: "execução anterior ainda em andamento", EVENT_JOB_MISSED: "atrasada demais"}
+
+# Política dos jobs do APScheduler: nunca duas execuções do mesmo job ao mesmo
+# tempo, e execuções atrasadas viram uma só em vez de rodarem em sequência
+JOB_DEFAULTS = {
+    "max_instances": 1,
+    "coalesce": True,
+    "misfire_grace_time": int(os.environ.get("JOBS_MISFIRE_GRACE_SEGUNDOS", "30")),
+}
+
+
+class MonitorJobs:
+    """Instrumentação dos jobs agendados: duração, tickers, chamadas ao provedor e erros.
+
+    ``instrumentar`` embrulha a função do job; dentro dela, ``anotar`` soma
+    contadores à execução corrente (tickers processados, erros tratados). Cada
+    execução entra num histórico circular por job. Execuções mais longas que o
+    intervalo do job e disparos ignorados pelo agendador geram aviso.
+    """
+
+    def __init__(self, historico: int = HISTORICO_EXECUCOES):
+        self.historico = historico
+        self._lock = Lock()
+        self._jobs = {}
+        self._atual = local()
+
+    def _job(self, nome: str):
+        # Chamado com o lock adquirido
+        job = self._jobs.get(nome)
+        if job is None:
+            job = self._jobs[nome] = {
+                "intervalo_segundos": None,
+                "execucoes": 0,
+                "erros": 0,
+                "estouros": 0,
+                "ignoradas": 0,
+                "em_execucao": 0,
+                "historico": deque(maxlen=self.historico),
+            }
+        return job
+
+    def instrumentar(self, nome: str, func, intervalo_segundos: float | None = None):
+        """Embrulhar a função de um job; ``intervalo_segundos`` habilita o aviso de estouro"""
+        with self._lock:
+            self._job(nome)["intervalo_segundos"] = intervalo_segundos
+
+        @functools.wraps(func)
+        def executar(*args, **kwargs):
+            execucao = {"inicio": datetime.now().isoformat(timespec="seconds"), "tickers": 0, "erros": 0}
+            anterior = getattr(self._atual, "execucao", None)
+            self._atual.execucao = execucao
+            provedor = provedor_atual()
+            chamadas_antes = provedor.chamadas_da_thread()
+            with self._lock:
+                self._job(nome)["em_execucao"] += 1
+            inicio = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                execucao["erros"] += 1
+                raise
+            finally:
+                execucao["duracao_ms"] = (time.perf_counter() - inicio) * 1000
+                execucao["chamadas_provedor"] = provedor.chamadas_da_thread() - chamadas_antes
+                self._atual.execucao = anterior
+                self._registrar(nome, execucao)
+
+        return executar
+
+    def anotar(self, **contadores):
+        """Somar contadores à execução do job em andamento nesta thread (sem efeito fora de um job)"""
+        execucao = getattr(self._atual, "execucao", None)
+        if execucao is None:
+            return
+        for nome, valor in contadores.items():
+            execucao[nome] = execucao.get(nome, 0) + valor
+
+    def _registrar(self, nome: str, execucao: dict):
+        with self._lock:
+            job = self._job(nome)
+            job["em_execucao"] -= 1
+            job["execucoes"] += 1
+            job["erros"] += execucao["erros"]
+            intervalo = job["intervalo_segundos"]
+            estourou = intervalo is not None and execucao["duracao_ms"] > intervalo * 1000
+            if estourou:
+                job["estouros"] += 1
+            job["historico"].append(execucao)
+        if estourou:
+            logger.warning(
+                f"Job {nome} levou {execucao['duracao_ms'] / 1000:.1f}s, mais que o intervalo de {intervalo:.0f}s"
+            )
+
+    def ouvir_agendador(self, evento):
+        """Listener do APScheduler para disparos ignorados (job ainda rodando ou atrasado demais)"""
+        with self._lock:
+            self._job(evento.job_id)["ignoradas"] += 1
+        logger.warning(f"Execução do job {evento.job_id} ignorada pelo agendador: {MOTIVOS.get(evento.code, evento.code)}")
+
+    def estatisticas(self, recentes: int = 10) -> dict:
+        with self._lock:
+            jobs = {nome: dict(job, historico=list(job["historico"])) for nome, job in self._jobs.items()}
+
+        resultado = {}
+        for nome, job in jobs.items():
+            historico = job.pop("historico")
+            duracoes = np.array([e["duracao_ms"] for e in historico]) if historico else None
+            resultado[nome] = {
+                **job,
+                "duracao_p50_ms": float(np.percentile(duracoes, 50)) if duracoes is not None else None,
+                "duracao_p95_ms": float(np.percentile(duracoes, 95)) if duracoes is not None else None,
+                "duracao_max_ms": float(duracoes.max()) if duracoes is not None else None,
+                "recentes": historico[-recentes:][::-1] if recentes else [],
+            }
+        return resultado
+
+
+monitor_jobs = MonitorJobs()
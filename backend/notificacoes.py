@@ -0,0 +1,411 @@
+import atexit
+import heapq
+import logging
+import os
+import time
+from collections import deque
+from threading import Condition, Thread
+
+import numpy as np
+from telegram.error import BadRequest, ChatMigrated, RetryAfter, Unauthorized
+
+from db import conexao_leitura
+from escritor import EscritorEmLote
+
+logger = logging.getLogger(__name__)
+
+# Limites do Telegram: ~30 mensagens/s no total e ~1 mensagem/s por chat.
+# RAJADA_* é a capacidade do balde: mensagens que podem sair de uma vez após um período ocioso
+TAXA_GLOBAL = float(os.environ.get("NOTIFICACOES_TAXA_GLOBAL", "25"))
+RAJADA_GLOBAL = float(os.environ.get("NOTIFICACOES_RAJADA_GLOBAL", "5"))
+TAXA_POR_CHAT = float(os.environ.get("NOTIFICACOES_TAXA_POR_CHAT", "1"))
+RAJADA_POR_CHAT = float(os.environ.get("NOTIFICACOES_RAJADA_POR_CHAT", "1"))
+NOTIFICACOES_WORKERS = int(os.environ.get("NOTIFICACOES_WORKERS", "4"))
+# Falhas transitórias: espera de BACKOFF_BASE * 2^tentativas, até MAX_TENTATIVAS envios
+MAX_TENTATIVAS = int(os.environ.get("NOTIFICACOES_MAX_TENTATIVAS", "6"))
+BACKOFF_BASE = float(os.environ.get("NOTIFICACOES_BACKOFF_BASE", "2"))
+
+AMOSTRAS_LATENCIA = 1000
+# Intervalo entre as limpezas dos baldes de chats ociosos
+LIMPEZA_BALDES_SEGUNDOS = 60
+
+# Tamanho máximo do texto de uma mensagem do Telegram
+LIMITE_MENSAGEM = 4096
+
+# Erros definitivos (bot bloqueado, chat inexistente, texto inválido): não adianta repetir.
+# ChatMigrated é tratado à parte: a mensagem é reenviada para o novo chat
+ERROS_DEFINITIVOS = (Unauthorized, BadRequest)
+
+
+class BaldeDeTokens:
+    """Token bucket: ``taxa`` tokens por segundo, acumulando até ``capacidade``"""
+
+    def __init__(self, taxa: float, capacidade: float):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.tokens = capacidade
+        self.atualizado_em = time.monotonic()
+
+    def espera(self, agora: float) -> float:
+        """Segundos até haver um token (0 se já houver)"""
+        self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado_em) * self.taxa)
+        self.atualizado_em = agora
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.taxa
+
+    def consumir(self):
+        self.tokens -= 1
+
+    def cheio(self, agora: float) -> bool:
+        """Se o balde já teria se recarregado por completo (pode ser descartado sem efeito)"""
+        return self.tokens + (agora - self.atualizado_em) * self.taxa >= self.capacidade
+
+
+def dividir_em_mensagens(linhas, cabecalho: str = "", limite: int = LIMITE_MENSAGEM):
+    """Juntar linhas em mensagens de até ``limite`` caracteres, repetindo o cabeçalho.
+
+    Retorna ``[(texto, parse_mode)]``. As mensagens só são divididas entre linhas,
+    nunca no meio de uma, para não partir um par ``*`` do Markdown (que o Telegram
+    recusaria). Uma linha que sozinha passa do limite sai em uma mensagem própria,
+    truncada e sem Markdown.
+    """
+    mensagens = []
+    atual = cabecalho
+    for linha in linhas:
+        if len(cabecalho) + len(linha) > limite:
+            if atual != cabecalho:
+                mensagens.append((atual, "Markdown"))
+                atual = cabecalho
+            mensagens.append((linha[:limite], None))
+            continue
+        separador = "\n" if atual != cabecalho else ""
+        if len(atual) + len(separador) + len(linha) > limite:
+            mensagens.append((atual, "Markdown"))
+            atual, separador = cabecalho, ""
+        atual += separador + linha
+    if atual != cabecalho:
+        mensagens.append((atual, "Markdown"))
+    return mensagens
+
+
+class AgrupadorAlertas:
+    """Junta os alertas disparados em um ciclo em uma mensagem por usuário.
+
+    Um único alerta sai com o texto original; vários viram um resumo com
+    cabeçalho, dividido em mais mensagens só quando passa de LIMITE_MENSAGEM.
+    """
+
+    def __init__(self, titulo: str):
+        self.titulo = titulo
+        self._por_usuario = {}
+
+    def adicionar(self, user_id: int, mensagem: str):
+        self._por_usuario.setdefault(user_id, []).append(mensagem)
+
+    def mensagens(self):
+        """Obter ``[(user_id, texto, parse_mode)]`` na ordem em que os usuários dispararam"""
+        resultado = []
+        for user_id, linhas in self._por_usuario.items():
+            cabecalho = f"{self.titulo} ({len(linhas)} alertas)\n\n" if len(linhas) > 1 else ""
+            resultado.extend(
+                (user_id, texto, parse_mode) for texto, parse_mode in dividir_em_mensagens(linhas, cabecalho)
+            )
+        return resultado
+
+    def enviar(self, fila):
+        """Enfileirar as mensagens agrupadas e esvaziar o agrupador"""
+        for user_id, texto, parse_mode in self.mensagens():
+            fila.enfileirar(user_id, texto, parse_mode)
+        self._por_usuario = {}
+
+
+class Notificacao:
+    __slots__ = ("id", "chat_id", "texto", "parse_mode", "tentativas", "criado_em")
+
+    def __init__(self, id, chat_id, texto, parse_mode, tentativas, criado_em):
+        self.id = id
+        self.chat_id = chat_id
+        self.texto = texto
+        self.parse_mode = parse_mode
+        self.tentativas = tentativas
+        self.criado_em = criado_em
+
+
+class FilaNotificacoes:
+    """Fila persistente de mensagens do Telegram, enviadas por um pool de workers.
+
+    Os jobs só enfileiram: a mensagem é gravada em ``fila_notificacoes`` e sai
+    daí apenas depois de entregue (ou descartada por erro definitivo), então
+    sobrevive a um reinício. Todas as escritas da tabela passam pelo escritor em
+    lote da própria fila, na ordem em que acontecem. Os workers respeitam um token bucket global e um
+    por chat; mensagens de um mesmo chat saem em ordem, uma de cada vez.
+    ``RetryAfter`` (429) adia o chat pelo tempo pedido e pausa os envios
+    globais; outras falhas são repetidas com backoff exponencial. Um chat
+    migrado (``ChatMigrated``) tem as mensagens pendentes movidas para o novo id,
+    e ``ao_migrar(antigo, novo)`` é chamado para atualizar o restante dos dados.
+    """
+
+    def __init__(self, enviar, workers: int = NOTIFICACOES_WORKERS,
+                 taxa_global: float = TAXA_GLOBAL, taxa_por_chat: float = TAXA_POR_CHAT, ao_migrar=None):
+        self._enviar = enviar
+        self._ao_migrar = ao_migrar
+        # Chats migrados nesta execução: o que ainda for enfileirado para o id antigo vai para o novo
+        self._migracoes = {}
+        self.workers = workers
+        self.taxa_por_chat = taxa_por_chat
+        self._cond = Condition()
+        self._threads = []
+        self._global = BaldeDeTokens(taxa_global, RAJADA_GLOBAL)
+        self._baldes = {}
+        self._limpeza_baldes_em = time.monotonic()
+        self._por_chat = {}
+        self._prontos = deque()
+        self._adiados = []
+        self._ocupados = set()
+        self._pausa_global_ate = 0.0
+        self._pendentes = 0
+        self._ids = set()
+        self._proximo_id = None
+        self._escritor = EscritorEmLote("escritor-notificacoes")
+        atexit.register(self._escritor.flush, timeout=5)
+        self._enviadas = 0
+        self._migradas = 0
+        self._descartadas = 0
+        self._retentativas = 0
+        self._latencias = {"envio": deque(maxlen=AMOSTRAS_LATENCIA), "fila": deque(maxlen=AMOSTRAS_LATENCIA)}
+
+    # --- Entrada ---
+
+    def enfileirar(self, chat_id: int, texto: str, parse_mode: str | None = "Markdown"):
+        """Gravar a mensagem na fila persistente e agendar o envio"""
+        criado_em = time.time()
+        chat_id = self._migracoes.get(chat_id, chat_id)
+        id_mensagem = self._novo_id()
+        self._escritor.enfileirar("""
+            INSERT INTO fila_notificacoes (id, chat_id, texto, parse_mode, tentativas, criado_em)
+            VALUES (?, ?, ?, ?, 0, ?)
+        """, (id_mensagem, chat_id, texto, parse_mode, criado_em))
+        self._adicionar(Notificacao(id_mensagem, chat_id, texto, parse_mode, 0, criado_em))
+
+    def _novo_id(self) -> int:
+        # Ids atribuídos aqui: a gravação é assíncrona, então não há lastrowid
+        with self._cond:
+            if self._proximo_id is None:
+                with conexao_leitura() as conn:
+                    maximo = conn.execute("SELECT MAX(id) FROM fila_notificacoes").fetchone()[0]
+                self._proximo_id = (maximo or 0) + 1
+            id_mensagem = self._proximo_id
+            self._proximo_id += 1
+            return id_mensagem
+
+    def carregar_pendentes(self):
+        """Retomar as mensagens que ficaram na fila (ex.: após um reinício)"""
+        # Remoções ainda na fila do escritor fariam mensagens já entregues voltarem
+        self._escritor.flush()
+        with conexao_leitura() as conn:
+            rows = conn.execute("""
+                SELECT id, chat_id, texto, parse_mode, tentativas, criado_em
+                FROM fila_notificacoes ORDER BY id
+            """).fetchall()
+        with self._cond:
+            novas = [Notificacao(*row) for row in rows if row["id"] not in self._ids]
+        for notificacao in novas:
+            self._adicionar(notificacao)
+        if novas:
+            logger.info(f"Fila de notificações: {len(novas)} mensagens pendentes retomadas")
+
+    def _adicionar(self, notificacao: Notificacao):
+        self._garantir_workers()
+        with self._cond:
+            fila = self._por_chat.setdefault(notificacao.chat_id, deque())
+            fila.append(notificacao)
+            self._ids.add(notificacao.id)
+            self._pendentes += 1
+            # Um chat entra em _prontos só quando fica com mensagens e não está em envio nem adiado
+            if len(fila) == 1 and notificacao.chat_id not in self._ocupados:
+                self._prontos.append(notificacao.chat_id)
+            self._cond.notify()
+
+    # --- Workers ---
+
+    def _garantir_workers(self):
+        with self._cond:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = Thread(target=self._executar, name=f"notificacoes-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _limpar_baldes(self, agora: float):
+        # Chamado com o lock: descarta baldes de chats sem mensagens que já se recarregaram
+        if agora - self._limpeza_baldes_em < LIMPEZA_BALDES_SEGUNDOS:
+            return
+        self._limpeza_baldes_em = agora
+        for chat_id in [c for c, balde in self._baldes.items() if c not in self._por_chat and balde.cheio(agora)]:
+            del self._baldes[chat_id]
+
+    def _proxima(self):
+        """Esperar até haver uma mensagem que pode sair agora e reservá-la (com o lock)"""
+        while True:
+            agora = time.monotonic()
+            self._limpar_baldes(agora)
+            while self._adiados and self._adiados[0][0] <= agora:
+                _, chat_id = heapq.heappop(self._adiados)
+                self._ocupados.discard(chat_id)
+                if self._por_chat.get(chat_id):
+                    self._prontos.append(chat_id)
+
+            espera = self._adiados[0][0] - agora if self._adiados else None
+            if self._prontos:
+                espera_global = max(self._global.espera(agora), self._pausa_global_ate - agora)
+                if espera_global <= 0:
+                    chat_id = self._prontos.popleft()
+                    balde = self._baldes.get(chat_id)
+                    if balde is None:
+                        balde = self._baldes[chat_id] = BaldeDeTokens(self.taxa_por_chat, RAJADA_POR_CHAT)
+                    espera_chat = balde.espera(agora)
+                    if espera_chat > 0:
+                        # Chat no limite: sai da vez sem bloquear os outros
+                        self._ocupados.add(chat_id)
+                        heapq.heappush(self._adiados, (agora + espera_chat, chat_id))
+                        continue
+                    balde.consumir()
+                    self._global.consumir()
+                    self._ocupados.add(chat_id)
+                    return self._por_chat[chat_id].popleft()
+                espera = espera_global if espera is None else min(espera, espera_global)
+            self._cond.wait(espera)
+
+    def _executar(self):
+        while True:
+            with self._cond:
+                notificacao = self._proxima()
+            self._entregar(notificacao)
+
+    def _entregar(self, notificacao: Notificacao):
+        inicio = time.monotonic()
+        adiar = 0.0
+        limite_telegram = False
+        novo_chat_id = None
+        try:
+            self._enviar(chat_id=notificacao.chat_id, text=notificacao.texto, parse_mode=notificacao.parse_mode)
+            resultado = "enviada"
+        except RetryAfter as e:
+            adiar = float(e.retry_after)
+            limite_telegram = True
+            resultado = "repetir"
+            logger.warning(f"Limite do Telegram atingido (chat {notificacao.chat_id}): aguardando {adiar:.0f}s")
+        except ChatMigrated as e:
+            # Grupo virou supergrupo: a mensagem e as pendentes do chat passam para o novo id
+            novo_chat_id = e.new_chat_id
+            resultado = "migrada"
+            logger.info(f"Chat {notificacao.chat_id} migrou para {novo_chat_id}: notificações movidas")
+        except ERROS_DEFINITIVOS as e:
+            resultado = "descartar"
+            logger.error(f"Notificação para {notificacao.chat_id} descartada: {e}")
+        except Exception as e:
+            notificacao.tentativas += 1
+            if notificacao.tentativas >= MAX_TENTATIVAS:
+                resultado = "descartar"
+                logger.error(f"Notificação para {notificacao.chat_id} descartada após {notificacao.tentativas} tentativas: {e}")
+            else:
+                adiar = BACKOFF_BASE * 2 ** (notificacao.tentativas - 1)
+                resultado = "repetir"
+                logger.warning(f"Erro ao enviar notificação para {notificacao.chat_id} (tentativa {notificacao.tentativas}): {e}")
+
+        fim = time.monotonic()
+        if resultado == "repetir":
+            self._escritor.enfileirar(
+                "UPDATE fila_notificacoes SET tentativas = ? WHERE id = ?", (notificacao.tentativas, notificacao.id)
+            )
+        elif resultado == "migrada":
+            self._escritor.enfileirar(
+                "UPDATE fila_notificacoes SET chat_id = ? WHERE chat_id = ?", (novo_chat_id, notificacao.chat_id)
+            )
+        else:
+            self._escritor.enfileirar("DELETE FROM fila_notificacoes WHERE id = ?", (notificacao.id,))
+
+        with self._cond:
+            chat_id = notificacao.chat_id
+            fila = self._por_chat[chat_id]
+            if resultado == "repetir":
+                # Volta para o início: a ordem das mensagens do chat é mantida
+                fila.appendleft(notificacao)
+                self._retentativas += 1
+                if limite_telegram:
+                    # 429 costuma indicar o limite global também: segura todos os envios por um instante
+                    self._pausa_global_ate = max(self._pausa_global_ate, fim + min(adiar, 1.0))
+                heapq.heappush(self._adiados, (fim + adiar, chat_id))
+            elif resultado == "migrada":
+                self._migracoes[chat_id] = novo_chat_id
+                self._migradas += 1
+                # Esta mensagem volta à frente; as pendentes seguem, todas já com o novo id
+                fila.appendleft(notificacao)
+                del self._por_chat[chat_id]
+                self._ocupados.discard(chat_id)
+                for pendente in fila:
+                    pendente.chat_id = novo_chat_id
+                destino = self._por_chat.setdefault(novo_chat_id, deque())
+                estava_vazio = not destino
+                destino.extend(fila)
+                if estava_vazio and novo_chat_id not in self._ocupados:
+                    self._prontos.append(novo_chat_id)
+            else:
+                self._pendentes -= 1
+                self._ids.discard(notificacao.id)
+                if resultado == "enviada":
+                    self._enviadas += 1
+                    self._latencias["envio"].append((fim - inicio) * 1000)
+                    self._latencias["fila"].append((time.time() - notificacao.criado_em) * 1000)
+                else:
+                    self._descartadas += 1
+                if fila:
+                    self._ocupados.discard(chat_id)
+                    self._prontos.append(chat_id)
+                else:
+                    del self._por_chat[chat_id]
+                    self._ocupados.discard(chat_id)
+            self._cond.notify_all()
+
+        if novo_chat_id is not None and self._ao_migrar is not None:
+            try:
+                self._ao_migrar(chat_id, novo_chat_id)
+            except Exception as e:
+                logger.error(f"Erro ao migrar dados do chat {chat_id} para {novo_chat_id}: {e}")
+
+    # --- Observabilidade ---
+
+    def drenar(self, timeout: float | None = None) -> bool:
+        """Aguardar o envio de tudo o que está na fila (inclusive retentativas)"""
+        limite = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._pendentes:
+                restante = limite - time.monotonic() if limite is not None else None
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(restante)
+        self._escritor.flush(timeout)
+        return True
+
+    def estatisticas(self) -> dict:
+        with self._cond:
+            resultado = {
+                "pendentes": self._pendentes,
+                "chats": len(self._por_chat),
+                "enviadas": self._enviadas,
+                "descartadas": self._descartadas,
+                "migradas": self._migradas,
+                "retentativas": self._retentativas,
+                "workers": len(self._threads),
+                "baldes_por_chat": len(self._baldes),
+            }
+        resultado["escritor"] = self._escritor.estatisticas()
+        for nome, amostras in self._latencias.items():
+            amostras = list(amostras)
+            valores = np.array(amostras) if amostras else None
+            resultado[f"latencia_{nome}"] = {
+                "amostras": len(amostras),
+                "p50_ms": float(np.percentile(valores, 50)) if valores is not None else None,
+                "p95_ms": float(np.percentile(valores, 95)) if valores is not None else None,
+                "max_ms": float(valores.max()) if valores is not None else None,
+            }
+        return resultado
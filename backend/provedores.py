@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import date
+from pathlib import Path
+from threading import Lock, local
+
+import pandas as pd
+import yfinance as yf
+
+logger = logging.getLogger(__name__)
+
+# Provedor de dados de mercado: "yfinance" (padrão) ou "replay"
+MARKET_DATA_PROVIDER = os.environ.get("MARKET_DATA_PROVIDER", "yfinance")
+REPLAY_DIR = os.environ.get("REPLAY_DIR", "fixtures/cotacoes")
+REPLAY_LATENCIA_MS = float(os.environ.get("REPLAY_LATENCIA_MS", "0"))
+REPLAY_TAXA_ERRO = float(os.environ.get("REPLAY_TAXA_ERRO", "0"))
+
+# Dias corridos aproximados de cada período do yfinance (None = tudo)
+DIAS_POR_PERIODO = {
+    "1d": 1, "2d": 2, "5d": 5, "7d": 7, "1mo": 31, "3mo": 92,
+    "6mo": 183, "1y": 366, "2y": 731, "5y": 1827, "10y": 3653, "max": None,
+}
+
+
+class ErroProvedor(Exception):
+    """Falha ao obter dados do provedor de mercado"""
+
+
+class ProvedorCotacoes(ABC):
+    """Interface dos provedores de dados de mercado.
+
+    Todas as operações contam as chamadas feitas ao provedor, para que benchmarks
+    e métricas possam medir o tráfego upstream.
+    """
+
+    nome = "base"
+
+    def __init__(self):
+        self._lock = Lock()
+        self.chamadas = Counter()
+        self._por_thread = local()
+
+    def _contar(self, operacao: str):
+        with self._lock:
+            self.chamadas[operacao] += 1
+        self._por_thread.total = getattr(self._por_thread, "total", 0) + 1
+
+    def chamadas_da_thread(self) -> int:
+        """Total de chamadas feitas pela thread atual (usado para medir cada execução de job)"""
+        return getattr(self._por_thread, "total", 0)
+
+    @abstractmethod
+    def historico(self, ticker: str, period: str | None = None, start: str | None = None):
+        """Histórico OHLCV de um ticker (DataFrame vazio se não houver dados)"""
+
+    @abstractmethod
+    def historicos_em_lote(self, tickers, period: str | None = None, start: str | None = None):
+        """Históricos de vários tickers em uma única requisição: ``{ticker: DataFrame}``"""
+
+    @abstractmethod
+    def metadados(self, ticker: str) -> dict:
+        """Dados cadastrais da empresa"""
+
+    def cotacao(self, ticker: str):
+        """Último preço de fechamento (None se não houver dados)"""
+        hist = self.historico(ticker, period="1d")
+        if hist.empty:
+            return None
+        return float(hist["Close"].iloc[-1])
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {"provedor": self.nome, "chamadas": dict(self.chamadas), "total": sum(self.chamadas.values())}
+
+
+class ProvedorYFinance(ProvedorCotacoes):
+    """Dados do Yahoo Finance via yfinance"""
+
+    nome = "yfinance"
+
+    def historico(self, ticker, period=None, start=None):
+        self._contar("historico")
+        if start is not None:
+            return yf.Ticker(ticker).history(start=start)
+        return yf.Ticker(ticker).history(period=period or "1mo")
+
+    def historicos_em_lote(self, tickers, period=None, start=None):
+        self._contar("historicos_em_lote")
+        tickers = list(tickers)
+        parametros = {"start": start} if start is not None else {"period": period or "1mo"}
+        dados = yf.download(
+            tickers,
+            group_by="ticker",
+            auto_adjust=True,
+            threads=True,
+            progress=False,
+            **parametros,
+        )
+
+        resultado = {}
+        if dados is None or dados.empty:
+            return resultado
+        for ticker in tickers:
+            hist = _extrair_historico(dados, ticker, len(tickers))
+            if hist is not None:
+                resultado[ticker] = hist
+        return resultado
+
+    def metadados(self, ticker):
+        self._contar("metadados")
+        return yf.Ticker(ticker).info or {}
+
+
+def _extrair_historico(dados, ticker, tamanho_lote):
+    """Separar o histórico de um ticker do DataFrame retornado por yf.download"""
+    if tamanho_lote == 1:
+        hist = dados
+    elif ticker in dados.columns.get_level_values(0):
+        hist = dados[ticker]
+    else:
+        return None
+    hist = hist.dropna(how="all")
+    return None if hist.empty else hist
+
+
+class ProvedorReplay(ProvedorCotacoes):
+    """Reproduz fixtures OHLCV gravadas em disco, sem acesso à rede.
+
+    Cada ticker é lido de ``<diretorio>/<TICKER>.csv`` (colunas Date, Open, High,
+    Low, Close, Volume) e, opcionalmente, ``<TICKER>.json`` com os metadados. Com
+    ``ancorar_hoje`` as datas são deslocadas para que o último pregão seja hoje.
+    Latência sintética (ms) e taxa de erro simulam o comportamento do upstream.
+    """
+
+    nome = "replay"
+
+    def __init__(self, diretorio, latencia_ms: float = 0, taxa_erro: float = 0,
+                 ancorar_hoje: bool = True, seed: int | None = None):
+        super().__init__()
+        self.diretorio = Path(diretorio)
+        self.latencia_ms = latencia_ms
+        self.taxa_erro = taxa_erro
+        self.ancorar_hoje = ancorar_hoje
+        self._random = random.Random(seed)
+        self._fixtures = {}
+
+    def _simular_upstream(self):
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+        if self.taxa_erro and self._random.random() < self.taxa_erro:
+            raise ErroProvedor("Erro sintético do provedor replay")
+
+    def _carregar(self, ticker):
+        hist = self._fixtures.get(ticker)
+        if hist is not None:
+            return hist
+
+        caminho = self.diretorio / f"{ticker}.csv"
+        if not caminho.exists():
+            hist = pd.DataFrame(columns=["Open", "High", "Low", "Close", "Volume"])
+        else:
+            hist = pd.read_csv(caminho, index_col="Date", parse_dates=True).sort_index()
+            if self.ancorar_hoje and not hist.empty:
+                deslocamento = pd.Timestamp(date.today()) - hist.index[-1].normalize()
+                hist.index = hist.index + deslocamento
+        self._fixtures[ticker] = hist
+        return hist
+
+    def _recortar(self, hist, period, start):
+        if hist.empty:
+            return hist
+        if start is not None:
+            return hist[hist.index >= pd.Timestamp(start)]
+        dias = DIAS_POR_PERIODO.get(period or "1mo")
+        if dias is None:
+            return hist
+        if period in ("1d", "2d", "5d"):
+            return hist.iloc[-dias:]
+        return hist[hist.index > hist.index[-1] - pd.Timedelta(days=dias)]
+
+    def historico(self, ticker, period=None, start=None):
+        self._contar("historico")
+        self._simular_upstream()
+        return self._recortar(self._carregar(ticker), period, start).copy()
+
+    def historicos_em_lote(self, tickers, period=None, start=None):
+        self._contar("historicos_em_lote")
+        self._simular_upstream()
+        resultado = {}
+        for ticker in tickers:
+            hist = self._recortar(self._carregar(ticker), period, start)
+            if not hist.empty:
+                resultado[ticker] = hist.copy()
+        return resultado
+
+    def metadados(self, ticker):
+        self._contar("metadados")
+        self._simular_upstream()
+        caminho = self.diretorio / f"{ticker}.json"
+        if caminho.exists():
+            return json.loads(caminho.read_text(encoding="utf-8"))
+        return {"symbol": ticker}
+
+
+def criar_provedor(nome: str | None = None) -> ProvedorCotacoes:
+    """Criar o provedor configurado em MARKET_DATA_PROVIDER"""
+    nome = nome or MARKET_DATA_PROVIDER
+    if nome == "yfinance":
+        return ProvedorYFinance()
+    if nome == "replay":
+        return ProvedorReplay(REPLAY_DIR, latencia_ms=REPLAY_LATENCIA_MS, taxa_erro=REPLAY_TAXA_ERRO)
+    raise ValueError(f"Provedor de dados desconhecido: {nome}")
+
+
+_provedor = None
+_provedor_lock = Lock()
+
+
+def provedor_atual() -> ProvedorCotacoes:
+    """Provedor usado por todos os endpoints e jobs agendados"""
+    global _provedor
+    if _provedor is None:
+        with _provedor_lock:
+            if _provedor is None:
+                _provedor = criar_provedor()
+                logger.info(f"Provedor de dados de mercado: {_provedor.nome}")
+    return _provedor
+
+
+def configurar_provedor(provedor: ProvedorCotacoes):
+    """Substituir o provedor em uso (benchmarks, testes de carga, replay de incidentes)"""
+    global _provedor
+    with _provedor_lock:
+        _provedor = provedor
+
+
+def gravar_fixtures(tickers, diretorio=REPLAY_DIR, period: str = "max"):
+    """Gravar históricos e metadados do yfinance como fixtures do provedor replay"""
+    destino = Path(diretorio)
+    destino.mkdir(parents=True, exist_ok=True)
+    provedor = ProvedorYFinance()
+    for ticker in tickers:
+        hist = provedor.historico(ticker, period=period)
+        if hist.empty:
+            logger.warning(f"Sem dados para gravar fixture de {ticker}")
+            continue
+        hist = hist[["Open", "High", "Low", "Close", "Volume"]]
+        hist.index = hist.index.tz_localize(None) if hist.index.tz is not None else hist.index
+        hist.to_csv(destino / f"{ticker}.csv", index_label="Date")
+        (destino / f"{ticker}.json").write_text(
+            json.dumps(provedor.metadados(ticker), default=str), encoding="utf-8"
+        )
+        logger.info(f"Fixture gravada para {ticker}: {len(hist)} pregões")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gravar fixtures para o provedor replay")
+    parser.add_argument("tickers", nargs="+")
+    parser.add_argument("--dir", default=REPLAY_DIR)
+    parser.add_argument("--period", default="max")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    gravar_fixtures(args.tickers, args.dir, args.period)
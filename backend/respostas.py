@@ -0,0 +1,203 @@
+"""ETags, compressão e cache HTTP das respostas da API e dos arquivos estáticos.
+
+Brotli é opcional: com o pacote ``brotli`` instalado as respostas saem em ``br``
+para os clientes que aceitam; sem ele, apenas gzip.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # dependência opcional
+    brotli = None
+
+# Respostas menores que isso não compensam o custo de comprimir
+COMPRESSAO_MIN_BYTES = int(os.environ.get("COMPRESSAO_MIN_BYTES", "1024"))
+
+# Respostas bufferizadas pelo middleware; streams (ex.: text/event-stream) passam direto
+TIPOS_COM_ETAG = ("application/json", "text/html")
+TIPOS_COMPRIMIVEIS = {".js", ".css", ".html", ".svg", ".json", ".txt"}
+
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "no-cache"
+
+
+def calcular_etag(corpo: bytes) -> str:
+    # ETag fraca: a mesma para as versões gzip, br e sem compressão do conteúdo
+    return f'W/"{hashlib.blake2b(corpo, digest_size=16).hexdigest()}"'
+
+
+def etag_corresponde(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    valor = etag.removeprefix("W/")
+    return any(candidato.strip().removeprefix("W/") == valor for candidato in if_none_match.split(","))
+
+
+def escolher_codificacao(accept_encoding: str | None) -> str | None:
+    aceitas = {parte.split(";")[0].strip() for parte in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in aceitas:
+        return "br"
+    if "gzip" in aceitas:
+        return "gzip"
+    return None
+
+
+def comprimir(corpo: bytes, codificacao: str, maximo: bool = False) -> bytes:
+    """Comprimir com o algoritmo escolhido; ``maximo`` para conteúdo pré-comprimido uma vez"""
+    if codificacao == "br":
+        return brotli.compress(corpo, quality=11 if maximo else 5)
+    return gzip.compress(corpo, compresslevel=9 if maximo else 6)
+
+
+class ETagCompressaoMiddleware:
+    """Middleware ASGI que adiciona ETag, responde 304 e comprime respostas GET.
+
+    Só respostas 200 JSON/HTML são bufferizadas: o ETag é o hash do corpo, então
+    um dashboard que consulta dados inalterados recebe 304 sem corpo.
+    """
+
+    def __init__(self, app, minimo_bytes: int = COMPRESSAO_MIN_BYTES, prefixos_ignorados=("/static",)):
+        self.app = app
+        self.minimo_bytes = minimo_bytes
+        self.prefixos_ignorados = prefixos_ignorados
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] not in ("GET", "HEAD")
+                or scope["path"].startswith(self.prefixos_ignorados)):
+            await self.app(scope, receive, send)
+            return
+
+        requisicao = Headers(scope=scope)
+        inicio = None
+        partes = []
+
+        async def enviar(mensagem):
+            nonlocal inicio
+            if mensagem["type"] == "http.response.start":
+                tipo = Headers(raw=mensagem["headers"]).get("content-type", "")
+                if mensagem["status"] == 200 and tipo.startswith(TIPOS_COM_ETAG):
+                    inicio = mensagem
+                    return
+                await send(mensagem)
+                return
+
+            if inicio is None:
+                await send(mensagem)
+                return
+
+            partes.append(mensagem.get("body", b""))
+            if not mensagem.get("more_body", False):
+                await self._responder(scope, requisicao, inicio, b"".join(partes), send)
+
+        await self.app(scope, receive, enviar)
+
+    async def _responder(self, scope, requisicao, inicio, corpo, send):
+        headers = MutableHeaders(raw=inicio["headers"])
+        etag = calcular_etag(corpo)
+        headers["etag"] = etag
+        headers.append("vary", "Accept-Encoding")
+        if scope["path"].startswith("/api/") and "cache-control" not in headers:
+            # Dados por usuário: o navegador guarda, mas sempre revalida com If-None-Match
+            headers["cache-control"] = "private, no-cache"
+
+        if etag_corresponde(requisicao.get("if-none-match"), etag):
+            del headers["content-length"]
+            if "content-type" in headers:
+                del headers["content-type"]
+            await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        codificacao = escolher_codificacao(requisicao.get("accept-encoding"))
+        if codificacao and len(corpo) >= self.minimo_bytes and "content-encoding" not in headers:
+            corpo = comprimir(corpo, codificacao)
+            headers["content-encoding"] = codificacao
+        headers["content-length"] = str(len(corpo))
+
+        await send(inicio)
+        await send({"type": "http.response.body", "body": corpo})
+
+
+class Ativo:
+    """Arquivo estático carregado em memória com as versões pré-comprimidas"""
+
+    def __init__(self, caminho: str, conteudo: bytes):
+        self.conteudo = conteudo
+        self.tipo = mimetypes.guess_type(caminho)[0] or "application/octet-stream"
+        self.hash = hashlib.sha256(conteudo).hexdigest()[:12]
+        self.etag = f'"{self.hash}"'
+        self.versoes = {}
+        if len(conteudo) >= COMPRESSAO_MIN_BYTES:
+            for codificacao in ("gzip", "br") if brotli is not None else ("gzip",):
+                self.versoes[codificacao] = comprimir(conteudo, codificacao, maximo=True)
+
+
+class AtivosEstaticos(StaticFiles):
+    """StaticFiles que serve JS/CSS da memória, pré-comprimidos e com nome versionado.
+
+    ``js/main.<hash>.js`` é servido com cache de um ano (o hash muda a cada
+    alteração); o nome original continua válido, com revalidação por ETag.
+    Outros arquivos seguem o fluxo normal do StaticFiles.
+    """
+
+    def __init__(self, directory: str, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self._ativos = {}
+        self._versionados = {}
+        for raiz, _, arquivos in os.walk(directory):
+            for nome in arquivos:
+                base, extensao = os.path.splitext(nome)
+                if extensao not in TIPOS_COMPRIMIVEIS or extensao == ".html":
+                    continue
+                completo = os.path.join(raiz, nome)
+                relativo = os.path.relpath(completo, directory)
+                with open(completo, "rb") as f:
+                    ativo = Ativo(relativo, f.read())
+                versionado = os.path.join(os.path.dirname(relativo), f"{base}.{ativo.hash}{extensao}")
+                self._ativos[relativo] = (ativo, False)
+                self._ativos[versionado] = (ativo, True)
+                self._versionados[relativo.replace(os.sep, "/")] = versionado.replace(os.sep, "/")
+
+    def url(self, caminho: str) -> str:
+        """Nome versionado de um arquivo (ou o próprio caminho, se não for um ativo carregado)"""
+        return self._versionados.get(caminho, caminho)
+
+    def reescrever_urls(self, html: str, prefixo: str = "/static/") -> str:
+        """Trocar as referências a ativos no HTML pelos nomes versionados"""
+        return re.sub(
+            re.escape(prefixo) + r"([\w./-]+)",
+            lambda m: prefixo + self.url(m.group(1)),
+            html
+        )
+
+    async def get_response(self, path: str, scope) -> Response:
+        entrada = self._ativos.get(path)
+        if entrada is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+
+        ativo, imutavel = entrada
+        requisicao = Headers(scope=scope)
+        headers = {
+            "etag": ativo.etag,
+            "cache-control": CACHE_IMUTAVEL if imutavel else CACHE_REVALIDAR,
+            "vary": "Accept-Encoding",
+        }
+        if etag_corresponde(requisicao.get("if-none-match"), ativo.etag):
+            return Response(status_code=304, headers=headers)
+
+        corpo = ativo.conteudo
+        codificacao = escolher_codificacao(requisicao.get("accept-encoding"))
+        if codificacao in ativo.versoes:
+            corpo = ativo.versoes[codificacao]
+            headers["content-encoding"] = codificacao
+        return Response(content=corpo, media_type=ativo.tipo, headers=headers)
@@ -0,0 +1,124 @@
+import logging
+import os
+import time
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from coalescencia import SingleFlight
+from historico_precos import obter_fechamentos_diarios
+
+logger = logging.getLogger(__name__)
+
+# Validade da tabela de resumo: cobre um ciclo do job e o aquecimento que o antecede
+RESUMO_TTL_SEGUNDOS = float(os.environ.get("RESUMO_TTL_SEGUNDOS", "600"))
+# Aquecimento: minutos de antecedência e usuários mínimos no horário para valer a pena
+AQUECIMENTO_MINUTOS = int(os.environ.get("RESUMO_AQUECIMENTO_MINUTOS", "3"))
+AQUECIMENTO_MIN_USUARIOS = int(os.environ.get("RESUMO_AQUECIMENTO_MIN_USUARIOS", "20"))
+
+COLUNAS_RESUMO = ["preco", "var_dia", "var_semana"]
+
+
+def calcular_resumos(fechamentos: pd.DataFrame) -> pd.DataFrame:
+    """Calcular preço, variação do dia e da semana de cada ticker de uma vez.
+
+    ``fechamentos`` é o DataFrame longo (ticker, data, close) ordenado por data.
+    Mesmas regras do resumo por ticker: a referência da semana é o primeiro
+    pregão da janela quando há pelo menos 5, senão o pregão anterior.
+    """
+    fechamentos = fechamentos.dropna(subset=["close"])
+    if fechamentos.empty:
+        return pd.DataFrame(columns=COLUNAS_RESUMO, dtype=float)
+
+    grupos = fechamentos.groupby("ticker")["close"]
+    atual = grupos.last()
+    # Fechamento anterior do último pregão; tickers com um só pregão usam o próprio preço
+    ontem = grupos.shift(1).groupby(fechamentos["ticker"]).last().reindex(atual.index).fillna(atual)
+    primeiro = grupos.first()
+    semana = pd.Series(np.where(grupos.size() >= 5, primeiro, ontem), index=atual.index)
+
+    return pd.DataFrame({
+        "preco": atual,
+        "var_dia": (atual - ontem) / ontem * 100,
+        "var_semana": (atual - semana) / semana * 100,
+    })
+
+
+def calcular_tabela(tickers) -> dict:
+    """Calcular ``{ticker: {preco, var_dia, var_semana}}`` agora, sem passar pelo cache"""
+    return calcular_resumos(obter_fechamentos_diarios(tickers, period="7d")).to_dict("index")
+
+
+class CacheResumos:
+    """Tabela de resumo por ticker compartilhada pelos resumos de um mesmo ciclo.
+
+    Cada ticker distinto é calculado uma vez por ciclo, a partir de uma única
+    consulta de fechamentos; as mensagens de todos os usuários são montadas
+    a partir da mesma tabela.
+    """
+
+    def __init__(self, ttl: float = RESUMO_TTL_SEGUNDOS):
+        self.ttl = ttl
+        self._lock = Lock()
+        self._voos = SingleFlight()
+        self._linhas = {}
+        self._calculado_em = {}
+        self.calculos = 0
+        self.tickers_calculados = 0
+        self.acertos = 0
+
+    def obter(self, tickers) -> dict:
+        """Obter ``{ticker: {preco, var_dia, var_semana}}``, calculando só os tickers ausentes ou vencidos"""
+        tickers = set(tickers)
+        with self._lock:
+            agora = time.monotonic()
+            faltantes = sorted(t for t in tickers if agora - self._calculado_em.get(t, -np.inf) > self.ttl)
+            self.acertos += len(tickers) - len(faltantes)
+
+        if faltantes:
+            # Cálculo fora do lock: leituras de tickers já calculados não esperam o provedor;
+            # ciclos simultâneos com os mesmos tickers faltantes compartilham um só cálculo
+            novos = self._voos.executar(tuple(faltantes), lambda: self._calcular(faltantes))
+            with self._lock:
+                for ticker in faltantes:
+                    # Tickers sem dados também ficam marcados: não são rebuscados a cada usuário
+                    self._calculado_em[ticker] = agora
+                    if ticker in novos:
+                        self._linhas[ticker] = novos[ticker]
+                    else:
+                        self._linhas.pop(ticker, None)
+
+        with self._lock:
+            return {ticker: self._linhas[ticker] for ticker in tickers if ticker in self._linhas}
+
+    def _calcular(self, tickers) -> dict:
+        novos = calcular_tabela(tickers)
+        with self._lock:
+            self.calculos += 1
+            self.tickers_calculados += len(tickers)
+        return novos
+
+    def aquecer(self, tickers):
+        """Calcular antecipadamente os tickers de um horário de resumo concorrido"""
+        if tickers:
+            self.obter(tickers)
+
+    def limpar(self):
+        """Descartar a tabela (benchmarks, testes)"""
+        with self._lock:
+            self._linhas.clear()
+            self._calculado_em.clear()
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "tickers": len(self._linhas),
+                "calculos": self.calculos,
+                "tickers_calculados": self.tickers_calculados,
+                "acertos": self.acertos,
+                "coalescidos": self._voos.coalescidas,
+            }
+
+
+cache_resumos = CacheResumos()
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import numpy as np
+from passlib.context import CryptContext
+
+# bcrypt libera o GIL enquanto calcula: threads bastam para usar vários núcleos
+HASH_MAX_WORKERS = int(os.environ.get("HASH_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Operações aguardando um worker além das em execução; acima disso a API responde 429
+HASH_FILA_MAX = int(os.environ.get("HASH_FILA_MAX", "32"))
+# Custo do bcrypt para hashes novos (hashes existentes continuam válidos)
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
+AMOSTRAS_LATENCIA = 1000
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PoolSaturado(Exception):
+    """Fila do pool de hashing cheia: a requisição deve ser repetida mais tarde"""
+
+
+class PoolSenhas:
+    """Pool limitado para hashing e verificação de senhas com bcrypt.
+
+    Mantém o trabalho de CPU fora do event loop e rejeita novas operações quando
+    a fila passa do limite, em vez de acumular logins sem fim.
+    """
+
+    def __init__(self, max_workers: int = HASH_MAX_WORKERS, fila_max: int = HASH_FILA_MAX):
+        self.max_workers = max_workers
+        self.fila_max = fila_max
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._lock = Lock()
+        self._pendentes = 0
+        self._rejeitadas = 0
+        self._latencias = {"verificar": deque(maxlen=AMOSTRAS_LATENCIA), "gerar_hash": deque(maxlen=AMOSTRAS_LATENCIA)}
+
+    async def _executar(self, operacao, func, *args):
+        with self._lock:
+            if self._pendentes >= self.max_workers + self.fila_max:
+                self._rejeitadas += 1
+                raise PoolSaturado("Muitas operações de autenticação simultâneas")
+            self._pendentes += 1
+
+        def _medir():
+            inicio = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self._latencias[operacao].append((time.perf_counter() - inicio) * 1000)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, _medir)
+        finally:
+            with self._lock:
+                self._pendentes -= 1
+
+    async def verificar(self, senha: str, hash_senha: str) -> bool:
+        return await self._executar("verificar", pwd_context.verify, senha, hash_senha)
+
+    async def gerar_hash(self, senha: str) -> str:
+        return await self._executar("gerar_hash", pwd_context.hash, senha)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            resultado = {
+                "max_workers": self.max_workers,
+                "fila_max": self.fila_max,
+                "pendentes": self._pendentes,
+                "rejeitadas": self._rejeitadas,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+            }
+        for operacao, amostras in self._latencias.items():
+            amostras = list(amostras)
+            valores = np.array(amostras) if amostras else None
+            resultado[operacao] = {
+                "amostras": len(amostras),
+                "p50_ms": float(np.percentile(valores, 50)) if valores is not None else None,
+                "p95_ms": float(np.percentile(valores, 95)) if valores is not None else None,
+                "max_ms": float(valores.max()) if valores is not None else None,
+            }
+        return resultado
+
+
+pool_senhas = PoolSenhas()
@@ -0,0 +1,123 @@
+import logging
+import os
+import time
+from threading import Lock
+
+from coalescencia import voos_cotacoes
+from cotacoes import baixar_historicos
+from db import conexao, conexao_leitura
+
+logger = logging.getLogger(__name__)
+
+# Intervalo do poller do bot que renova a tabela quote_snapshot
+INTERVALO_SEGUNDOS = int(os.environ.get("QUOTE_SNAPSHOT_INTERVALO", "60"))
+# Idade máxima de uma cotação lida do snapshot; acima disso a API busca no provedor
+MAX_IDADE_SEGUNDOS = float(os.environ.get("QUOTE_SNAPSHOT_MAX_IDADE", "180"))
+
+_lock = Lock()
+_contadores = {"atualizacoes": 0, "lidos": 0, "frescos": 0, "buscas_diretas": 0}
+
+
+def _contar(**incrementos):
+    with _lock:
+        for nome, valor in incrementos.items():
+            _contadores[nome] += valor
+
+
+def tickers_ativos():
+    """Obter os tickers que alguém acompanha: ações, portfólio e alertas ativos"""
+    with conexao_leitura() as conn:
+        rows = conn.execute("""
+            SELECT ticker FROM acoes_monitoradas
+            UNION SELECT ticker FROM portfolio_positions
+            UNION SELECT ticker FROM alertas_precos WHERE notificado = 0
+            UNION SELECT ticker FROM alertas_panico WHERE ativo = 1
+        """).fetchall()
+    return [row["ticker"] for row in rows]
+
+
+def atualizar_snapshot(tickers=None):
+    """Buscar cotações em lote e gravá-las em quote_snapshot.
+
+    Sem ``tickers``, renova todos os tickers ativos. Retorna ``{ticker: preço}``
+    dos tickers que o provedor devolveu.
+    """
+    tickers = sorted(set(tickers)) if tickers is not None else tickers_ativos()
+    if not tickers:
+        return {}
+
+    # 5 pregões bastam para ter o fechamento anterior mesmo depois de feriados
+    historicos = baixar_historicos(tickers, period="5d")
+    agora = time.time()
+    linhas = []
+    for ticker, hist in historicos.items():
+        fechamentos = hist["Close"].dropna()
+        if fechamentos.empty:
+            continue
+        preco = float(fechamentos.iloc[-1])
+        anterior = float(fechamentos.iloc[-2]) if len(fechamentos) >= 2 else None
+        variacao = ((preco - anterior) / anterior) * 100 if anterior else None
+        linhas.append((ticker, preco, anterior, variacao, agora))
+
+    if linhas:
+        with conexao() as conn:
+            conn.executemany("""
+                INSERT INTO quote_snapshot (ticker, price, prev_close, day_change, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(ticker) DO UPDATE SET
+                    price = excluded.price,
+                    prev_close = excluded.prev_close,
+                    day_change = excluded.day_change,
+                    fetched_at = excluded.fetched_at
+            """, linhas)
+    _contar(atualizacoes=1)
+    return {ticker: preco for ticker, preco, _, _, _ in linhas}
+
+
+def ler_snapshot(tickers, max_idade: float = None):
+    """Obter as linhas de quote_snapshot dos tickers com idade até ``max_idade`` segundos"""
+    tickers = list(set(tickers))
+    if not tickers:
+        return {}
+    max_idade = max_idade if max_idade is not None else MAX_IDADE_SEGUNDOS
+    with conexao_leitura() as conn:
+        rows = conn.execute(f"""
+            SELECT ticker, price, prev_close, day_change, fetched_at FROM quote_snapshot
+            WHERE ticker IN ({",".join("?" * len(tickers))}) AND fetched_at >= ?
+        """, (*tickers, time.time() - max_idade)).fetchall()
+    return {row["ticker"]: row for row in rows}
+
+
+def obter_cotacoes(tickers, max_idade: float = None):
+    """Obter o último preço de vários tickers, preferindo o snapshot.
+
+    Só os tickers ausentes ou mais velhos que ``max_idade`` são buscados no
+    provedor (e gravados no snapshot para as próximas leituras).
+    """
+    tickers = set(tickers)
+    snapshot = ler_snapshot(tickers, max_idade)
+    precos = {ticker: row["price"] for ticker, row in snapshot.items()}
+    faltantes = sorted(tickers - precos.keys())
+    _contar(lidos=len(tickers), frescos=len(precos), buscas_diretas=len(faltantes))
+
+    if faltantes:
+        # Requisições simultâneas pelos mesmos tickers compartilham uma busca
+        try:
+            precos.update(voos_cotacoes.executar(
+                ("quote_snapshot", tuple(faltantes)), lambda: atualizar_snapshot(faltantes)
+            ))
+        except Exception as e:
+            logger.warning(f"Erro ao buscar cotações fora do snapshot {faltantes}: {e}")
+    return precos
+
+
+def estatisticas() -> dict:
+    with _lock:
+        resultado = dict(_contadores)
+    resultado["intervalo_segundos"] = INTERVALO_SEGUNDOS
+    resultado["max_idade_segundos"] = MAX_IDADE_SEGUNDOS
+    with conexao_leitura() as conn:
+        row = conn.execute("SELECT COUNT(*) AS tickers, MIN(fetched_at) AS mais_antigo FROM quote_snapshot").fetchone()
+    resultado["tickers"] = row["tickers"]
+    resultado["idade_maxima_segundos"] = time.time() - row["mais_antigo"] if row["mais_antigo"] else None
+    return resultado
@@ -1,5 +1,8 @@
 // Configuração da aplicação
 const API_BASE_URL = '';
+// Limite de pontos do gráfico histórico (o servidor reduz séries maiores)
+const HISTORICO_MAX_POINTS = 500;
+const HISTORICO_ALERTAS_PAGINA = 50;
 let historicoChartInstance = null;
 function dashboardApp() {
     return {
@@ -17,6 +20,10 @@ function dashboardApp() {
         user: {},
         token: '',
 
+        // Stream de preços (Server-Sent Events)
+        precosStream: null,
+        precosStreamTickers: '',
+
         // Formulário de login
         loginForm: {
             userId: '',
@@ -29,6 +36,11 @@ function dashboardApp() {
         alertasPreco: [],
         alertasPanico: [],
         historicoAlertas: [],
+        historicoAlertasCursor: null,
+        historicoAlertasFilters: {
+            ticker: '',
+            tipo: ''
+        },
         botConfig: {
             resumo_automatico: true,
             horario_resumo: '18:00',
@@ -76,8 +88,6 @@ function dashboardApp() {
             if (savedToken) {
                 this.token = savedToken;
                 try {
-                    await this.loadUserData();
-                    this.isAuthenticated = true;
                     await this.loadAllData();
                 } catch (error) {
                     console.error('Erro ao carregar dados do usuário:', error);
@@ -112,8 +122,6 @@ function dashboardApp() {
                 this.token = data.access_token;
                 localStorage.setItem('dashboard_token', this.token);
 
-                await this.loadUserData();
-                this.isAuthenticated = true;
                 await this.loadAllData();
 
             } catch (error) {
@@ -125,6 +133,7 @@ function dashboardApp() {
 
         logout() {
             this.isAuthenticated = false;
+            this.fecharStreamPrecos();
             this.token = '';
             this.user = {};
             localStorage.removeItem('dashboard_token');
@@ -133,28 +142,106 @@ function dashboardApp() {
 
         // Carregamento de dados
         async loadUserData() {
-            const response = await this.apiCall('/api/user/me');
-            this.user = response;
+            this.setUser(await this.apiCall('/api/user/me'));
+        },
+
+        setUser(user) {
+            this.user = user;
+            if (user.theme) {
+                this.theme = user.theme;
+                localStorage.setItem('dashboard_theme', this.theme);
+            }
         },
 
         async loadAllData() {
-            await Promise.all([
-                this.loadAcoesDetalhadas(),
-                this.loadPortfolio(),
-                this.loadAlertasPreco(),
-                this.loadAlertasPanico(),
-                this.loadHistoricoAlertas(),
-                this.loadBotConfig()
-            ]);
+            // Um único snapshot substitui /api/user/me e as seis cargas individuais
+            const snapshot = await this.apiCall('/api/dashboard/snapshot');
+            this.setUser(snapshot.user);
+            this.acoesDetalhadas = snapshot.acoes_detalhadas;
+            this.portfolio = snapshot.portfolio;
+            this.alertasPreco = snapshot.alertas_preco;
+            this.alertasPanico = snapshot.alertas_panico;
+            this.historicoAlertas = snapshot.historico_alertas.alertas;
+            this.historicoAlertasCursor = snapshot.historico_alertas.proximo_cursor;
+            this.historicoAlertasFilters = { ticker: '', tipo: '' };
+            this.botConfig = snapshot.configuracoes_bot;
+            this.isAuthenticated = true;
+            this.conectarStreamPrecos();
 
             this.$nextTick(() => {
                 this.initCharts();
             });
         },
 
+        // Preços ao vivo: o servidor envia só os tickers que mudaram
+        async conectarStreamPrecos() {
+            const tickers = [...new Set([
+                ...this.acoesDetalhadas.map(acao => acao.ticker),
+                ...this.portfolio.map(position => position.ticker)
+            ])].sort().join(',');
+
+            // Reabrir só quando o conjunto de tickers muda (o servidor lê os tickers ao conectar);
+            // precosStreamTickers fica preenchido enquanto o stream está aberto ou abrindo
+            if (tickers && tickers === this.precosStreamTickers) return;
+            this.fecharStreamPrecos();
+            if (!tickers || !window.EventSource) return;
+
+            this.precosStreamTickers = tickers;
+            // A URL leva um token de curta duração só do stream, nunca o token de sessão
+            let streamToken;
+            try {
+                ({ token: streamToken } = await this.apiCall('/api/precos/stream/token', 'POST'));
+            } catch (error) {
+                console.error('Erro ao abrir stream de preços:', error);
+                this.precosStreamTickers = '';
+                return;
+            }
+            if (this.precosStreamTickers !== tickers) return;  // outra conexão começou enquanto isso
+
+            const stream = new EventSource(
+                `${API_BASE_URL}/api/precos/stream?token=${encodeURIComponent(streamToken)}`
+            );
+            stream.addEventListener('precos', (event) => {
+                this.aplicarPrecos(JSON.parse(event.data));
+            });
+            stream.addEventListener('error', () => {
+                // A reconexão automática reusa o token, já expirado: reabre com um novo
+                if (stream.readyState === EventSource.CLOSED && this.precosStream === stream) {
+                    this.fecharStreamPrecos();
+                    setTimeout(() => this.conectarStreamPrecos(), 5000);
+                }
+            });
+            this.precosStream = stream;
+        },
+
+        fecharStreamPrecos() {
+            if (this.precosStream) {
+                this.precosStream.close();
+                this.precosStream = null;
+            }
+            this.precosStreamTickers = '';
+        },
+
+        aplicarPrecos(precos) {
+            this.acoesDetalhadas.forEach(acao => {
+                const preco = precos[acao.ticker];
+                if (preco === undefined) return;
+                acao.preco_atual = preco;
+                acao.variacao_percentual = ((preco - acao.preco_referencia) / acao.preco_referencia) * 100;
+            });
+            this.portfolio.forEach(position => {
+                const preco = precos[position.ticker];
+                if (preco === undefined) return;
+                position.current_price = preco;
+                position.total_value = position.quantity * preco;
+                position.profit_loss = (preco - position.avg_price) * position.quantity;
+            });
+        },
+
         async loadAcoesDetalhadas() {
             try {
                 this.acoesDetalhadas = await this.apiCall('/api/acoes/detalhadas');
+                this.conectarStreamPrecos();
             } catch (error) {
                 console.error('Erro ao carregar ações detalhadas:', error);
                 this.acoesDetalhadas = [];
@@ -164,6 +251,7 @@ function dashboardApp() {
         async loadPortfolio() {
             try {
                 this.portfolio = await this.apiCall('/api/portfolio');
+                this.conectarStreamPrecos();
             } catch (error) {
                 console.error('Erro ao carregar portfólio:', error);
                 this.portfolio = [];
@@ -188,12 +276,24 @@ function dashboardApp() {
             }
         },
 
-        async loadHistoricoAlertas() {
+        async loadHistoricoAlertas(maisAntigos = false) {
             try {
-                this.historicoAlertas = await this.apiCall('/api/alertas/historico');
+                const params = new URLSearchParams({ limite: HISTORICO_ALERTAS_PAGINA });
+                if (this.historicoAlertasFilters.ticker) params.set('ticker', this.historicoAlertasFilters.ticker);
+                if (this.historicoAlertasFilters.tipo) params.set('tipo', this.historicoAlertasFilters.tipo);
+                if (maisAntigos && this.historicoAlertasCursor) params.set('cursor', this.historicoAlertasCursor);
+
+                const pagina = await this.apiCall(`/api/alertas/historico?${params}`);
+                this.historicoAlertas = maisAntigos
+                    ? this.historicoAlertas.concat(pagina.alertas)
+                    : pagina.alertas;
+                this.historicoAlertasCursor = pagina.proximo_cursor;
             } catch (error) {
                 console.error('Erro ao carregar histórico de alertas:', error);
-                this.historicoAlertas = [];
+                if (!maisAntigos) {
+                    this.historicoAlertas = [];
+                    this.historicoAlertasCursor = null;
+                }
             }
         },
 
@@ -209,8 +309,12 @@ function dashboardApp() {
             if (!this.historicoFilters.ticker) return;
 
             try {
+                // Um ponto por pixel da largura do gráfico já é suficiente
+                const canvas = document.getElementById('historicoChart');
+                const maxPoints = Math.max(3, Math.min(canvas?.clientWidth || HISTORICO_MAX_POINTS, HISTORICO_MAX_POINTS));
+
                 const response = await this.apiCall(
-                    `/api/historico/${this.historicoFilters.ticker}?periodo=${this.historicoFilters.periodo}`
+                    `/api/historico/${this.historicoFilters.ticker}?periodo=${this.historicoFilters.periodo}&max_points=${maxPoints}`
                 );
 
                 // ---- INÍCIO DA MODIFICAÇÃO ----
@@ -366,8 +470,14 @@ function dashboardApp() {
             }
         },
 
-        updateTheme() {
+        async updateTheme() {
             localStorage.setItem('dashboard_theme', this.theme);
+            if (!this.isAuthenticated) return;
+            try {
+                await this.apiCall('/api/user/theme', 'PUT', { theme: this.theme });
+            } catch (error) {
+                console.error('Erro ao salvar tema:', error);
+            }
         },
 
         toggleTheme() {
@@ -380,6 +490,8 @@ function dashboardApp() {
             this.refreshing = true;
             try {
                 await this.loadAllData();
+            } catch (error) {
+                this.showError('Erro ao atualizar dados: ' + error.message);
             } finally {
                 this.refreshing = false;
             }